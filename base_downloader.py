@@ -13,7 +13,7 @@ class BaseDownloader:
 
         raise NotImplementedError
 
-    def extract_archive(self, result):
-        """extract previously downloaded archive"""
+    def extract_archive(self, result, stream = False):
+        """extract previously downloaded archive, when stream is True the archive is left to be streamed"""
 
         raise NotImplementedError
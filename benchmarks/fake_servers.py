@@ -0,0 +1,344 @@
+"""Local stand-ins of GitHub and of a documentation site used by the benchmarks (standard library only)"""
+import io
+import re
+import json
+import time
+import base64
+import hashlib
+import zipfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+DEFAULT_BRANCH = 'main'
+# repositories are generated on demand, the number of files is part of their name: bench/files-100
+REPOSITORY_PATTERN = re.compile(r'^(?P<owner>[\w.-]+)/files-(?P<files>\d+)$')
+# every JS_PAGE_EVERY-th page of the documentation site is an empty single page application shell
+JS_PAGE_EVERY = 5
+
+FUNCTION_TEMPLATE = '''
+def function_{index}(value, factor={index}):
+    """multiply value by factor and add the index of the function"""
+    result = value * factor
+    for step in range({index} % 7 + 1):
+        result += step
+    return result + {index}
+'''
+
+MARKDOWN_TEMPLATE = '''# Module {index}
+
+This page documents the module number {index} of the benchmark repository.
+It explains how `function_{index}` multiplies its value and why the result is stable.
+
+## Usage
+
+Call `function_{index}(value)` and read the result, nothing else is needed.
+'''
+
+def repository_files(files):
+    """deterministic content of a synthetic repository: python modules, markdown pages and a few binary files"""
+    content = {}
+    for index in range(files):
+        folder = f"pkg{index // 50}"
+        if index % 10 == 9:
+            content[f"assets/image_{index}.png"] = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+        elif index % 3 == 2:
+            content[f"docs/{folder}/module_{index}.md"] = MARKDOWN_TEMPLATE.format(index=index).encode('utf-8')
+        else:
+            body = ''.join(FUNCTION_TEMPLATE.format(index=index * 10 + n) for n in range(10))
+            content[f"src/{folder}/module_{index}.py"] = f'"""module {index}"""\n{body}'.encode('utf-8')
+    content['README.md'] = f"# Benchmark repository\n\n{files} generated files.\n".encode('utf-8')
+    return content
+
+class FakeRepository:
+    """A synthetic repository with its zipball, its git tree and its blobs"""
+
+    def __init__(self, full_name, files):
+        self.full_name = full_name
+        self.name = full_name.split('/')[-1]
+        self.files = repository_files(files)
+        self.blob_shas = {path: hashlib.sha1(data).hexdigest() for path, data in self.files.items()}
+        self.tree_sha = hashlib.sha1(''.join(sorted(self.blob_shas.values())).encode('ascii')).hexdigest()
+        self._zipball = None
+        self.lock = threading.Lock()
+
+    def zipball(self, branch):
+        """zip archive with the same layout of GitHub: <repository>-<branch>/..."""
+        with self.lock:
+            if self._zipball is None:
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    for path, data in sorted(self.files.items()):
+                        zip_file.writestr(f"{self.name}-{branch}/{path}", data)
+                self._zipball = buffer.getvalue()
+            return self._zipball
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """web (search, info/refs, archives), /api (search, repos, trees, contents) and /raw endpoints"""
+    protocol_version = 'HTTP/1.1'
+    # headers and body leave in one segment, otherwise the delayed ACKs of keep-alive connections add 40ms per request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count_request()
+        parts = urlparse(self.path)
+        path = unquote(parts.path)
+        query = parse_qs(parts.query)
+        try:
+            if path == '/search':
+                return self.search_web(query.get('q', [''])[0])
+            if path == '/api/search/repositories':
+                return self.search_api(query.get('q', [''])[0])
+            if path.startswith('/api/repos/'):
+                return self.api_repos(path[len('/api/repos/'):], query)
+            if path.startswith('/raw/'):
+                return self.raw(path[len('/raw/'):])
+            match = re.match(r'^/([\w.-]+/[\w.-]+)\.git/info/refs$', path)
+            if match is not None:
+                return self.info_refs(match.group(1))
+            match = re.match(r'^/([\w.-]+/[\w.-]+)/archive/(?:refs/heads/)?(.+)\.zip$', path)
+            if match is not None:
+                return self.archive(match.group(1), match.group(2))
+            self.send_body(404, b'not found', 'text/plain')
+        except KeyError:
+            self.send_body(404, b'not found', 'text/plain')
+
+    def send_body(self, status, body, content_type, headers = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Limit', '5000')
+        self.send_header('X-RateLimit-Remaining', '4999')
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status = 200):
+        self.send_body(status, json.dumps(data).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def search_names(self, query):
+        name = query.split('+')[0].split(' ')[0]
+        names = [name if '/' in name else f"bench/{name}"]
+        names += [f"bench/{name.split('/')[-1]}-fork-{n}" for n in range(self.server.search_results - 1)]
+        return names
+
+    def search_web(self, query):
+        # the unauthenticated search answers with the json payload of the search page
+        results = []
+        for name in self.search_names(query):
+            owner, repository = name.split('/')
+            results.append({'hl_name': f"{owner}&#x2F;<em>{repository}</em>", 'repo': {'repository': {'name': repository}}})
+        self.send_json({'payload': {'results': results, 'result_count': len(results)}})
+
+    def search_api(self, query):
+        items = [{'full_name': name, 'html_url': f"{self.server.base_url}/{name}"} for name in self.search_names(query)]
+        self.send_json({'total_count': len(items), 'incomplete_results': False, 'items': items})
+
+    def repository_data(self, repository):
+        api_url = f"{self.server.base_url}/api/repos/{repository.full_name}"
+        return {
+            'id': abs(hash(repository.full_name)) % 1000000,
+            'name': repository.name,
+            'full_name': repository.full_name,
+            'owner': {'login': repository.full_name.split('/')[0]},
+            'url': api_url,
+            'html_url': f"{self.server.base_url}/{repository.full_name}",
+            'default_branch': DEFAULT_BRANCH,
+            'private': False,
+        }
+
+    def api_repos(self, rest, query):
+        owner, name, *tail = rest.split('/')
+        repository = self.server.repository(f"{owner}/{name}")
+        if len(tail) == 0:
+            return self.send_json(self.repository_data(repository))
+        api_url = f"{self.server.base_url}/api/repos/{repository.full_name}"
+        if tail[:2] == ['git', 'trees']:
+            tree = [{'path': path, 'mode': '100644', 'type': 'blob', 'sha': repository.blob_shas[path], 'size': len(data),
+                     'url': f"{api_url}/git/blobs/{repository.blob_shas[path]}"} for path, data in sorted(repository.files.items())]
+            return self.send_json({'sha': repository.tree_sha, 'url': f"{api_url}/git/trees/{repository.tree_sha}", 'tree': tree, 'truncated': False})
+        if tail[0] == 'commits':
+            commit_sha = hashlib.sha1(repository.tree_sha.encode('ascii')).hexdigest()
+            return self.send_json({'sha': commit_sha, 'url': f"{api_url}/commits/{commit_sha}",
+                                   'commit': {'tree': {'sha': repository.tree_sha, 'url': f"{api_url}/git/trees/{repository.tree_sha}"}}})
+        if tail[0] == 'contents':
+            path = '/'.join(tail[1:])
+            data = repository.files[path]
+            return self.send_json({'type': 'file', 'encoding': 'base64', 'path': path, 'name': path.split('/')[-1], 'size': len(data),
+                                   'sha': repository.blob_shas[path], 'content': base64.b64encode(data).decode('ascii'),
+                                   'url': f"{api_url}/contents/{path}"})
+        self.send_json({'message': 'Not Found'}, 404)
+
+    def raw(self, rest):
+        owner, name, branch, *path = rest.split('/')
+        repository = self.server.repository(f"{owner}/{name}")
+        self.send_body(200, repository.files['/'.join(path)], 'text/plain; charset=utf-8')
+
+    def info_refs(self, full_name):
+        self.server.repository(full_name)
+        service = b'# service=git-upload-pack\n'
+        head = f"{'0' * 40} HEAD\x00multi_ack symref=HEAD:refs/heads/{DEFAULT_BRANCH} agent=git/fake\n".encode('utf-8')
+        body = b'%04x' % (len(service) + 4) + service + b'0000' + b'%04x' % (len(head) + 4) + head + b'0000'
+        self.send_body(200, body, 'application/x-git-upload-pack-advertisement')
+
+    def archive(self, full_name, branch):
+        repository = self.server.repository(full_name)
+        body = repository.zipball(branch)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_body(304, b'', 'application/zip', {'ETag': etag})
+        match = re.match(r'^bytes=(\d+)-$', self.headers.get('Range', ''))
+        if match is not None and self.headers.get('If-Range', etag) == etag and int(match.group(1)) < len(body):
+            start = int(match.group(1))
+            return self.send_body(206, body[start:], 'application/zip', {'ETag': etag, 'Content-Range': f"bytes {start}-{len(body) - 1}/{len(body)}"})
+        self.send_body(200, body, 'application/zip', {'ETag': etag, 'Content-Disposition': f"attachment; filename={repository.name}-{branch}.zip"})
+
+class FakeGitHub(ThreadingHTTPServer):
+    """Fake GitHub on 127.0.0.1, web at base_url, the API at base_url/api and raw files at base_url/raw"""
+    daemon_threads = True
+
+    def __init__(self, search_results = 10):
+        super().__init__(('127.0.0.1', 0), FakeGitHubHandler)
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.search_results = max(1, int(search_results))
+        self.repositories = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def repository(self, full_name):
+        """generated repository, raise KeyError for the names that do not match REPOSITORY_PATTERN"""
+        match = REPOSITORY_PATTERN.match(full_name)
+        if match is None:
+            raise KeyError(full_name)
+        with self.lock:
+            if full_name not in self.repositories:
+                self.repositories[full_name] = FakeRepository(full_name, int(match.group('files')))
+            return self.repositories[full_name]
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    @property
+    def env(self):
+        """environment variables pointing the plugin to this server"""
+        return {
+            'CATOVERFLOW_GITHUB_WEB_URL': self.base_url,
+            'CATOVERFLOW_GITHUB_API_URL': f"{self.base_url}/api",
+            'CATOVERFLOW_GITHUB_RAW_URL': f"{self.base_url}/raw",
+        }
+
+STATIC_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>Page {index}</title></head>
+<body><nav>{links}</nav>
+<main><h1>Guide page {index}</h1>
+<p>This page explains the feature number {index} of the benchmark library. The feature is configured with a single option,
+it accepts a value and returns a result that depends only on the value and on the page number.</p>
+<pre><code>import bench
+bench.feature_{index}(value=42)</code></pre>
+<p>See the related pages in the navigation for the other features, every page of the guide follows the same structure.</p>
+</main></body></html>
+'''
+
+JS_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>Page {index}</title><script src="/static/app.js"></script></head>
+<body><div id="root"></div><nav>{links}</nav></body></html>
+'''
+
+APP_SCRIPT = b'''document.getElementById("root").innerHTML = "<main><h1>" + document.title + "</h1><p>" +
+  "This content is rendered in the browser. ".repeat(20) + "</p></main>";
+'''
+
+class FakeDocsHandler(BaseHTTPRequestHandler):
+    """robots.txt, sitemap.xml, the pages of the guide and the script of the javascript pages"""
+    protocol_version = 'HTTP/1.1'
+    # headers and body leave in one segment, otherwise the delayed ACKs of keep-alive connections add 40ms per request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count_request()
+        path = urlparse(self.path).path
+        if path == '/robots.txt':
+            return self.send_body(f"User-agent: *\nAllow: /\nSitemap: {self.server.base_url}/sitemap.xml\n".encode('utf-8'), 'text/plain')
+        if path == '/sitemap.xml':
+            return self.send_body(self.server.sitemap(), 'application/xml')
+        if path == '/static/app.js':
+            return self.send_body(APP_SCRIPT, 'application/javascript')
+        page = self.server.page_index(path)
+        if page is None:
+            return self.send_body(b'not found', 'text/plain', 404)
+        self.send_body(self.server.page(page), 'text/html; charset=utf-8')
+
+    def send_body(self, body, content_type, status = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeDocsSite(ThreadingHTTPServer):
+    """
+    Documentation site of a given number of pages below /docs/, every page links to the next pages
+    and every JS_PAGE_EVERY-th page needs javascript to show its content"""
+    daemon_threads = True
+
+    def __init__(self, pages = 50, links_per_page = 4):
+        super().__init__(('127.0.0.1', 0), FakeDocsHandler)
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.pages = max(1, int(pages))
+        self.links_per_page = max(1, int(links_per_page))
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def start_url(self):
+        return f"{self.base_url}/docs/"
+
+    def page_url(self, index):
+        return self.start_url if index == 0 else f"{self.base_url}/docs/guide/page-{index}.html"
+
+    def page_urls(self):
+        return [self.page_url(index) for index in range(self.pages)]
+
+    def js_pages(self):
+        return [self.page_url(index) for index in range(self.pages) if index > 0 and index % JS_PAGE_EVERY == 0]
+
+    def page_index(self, path):
+        if path in ('/docs', '/docs/', '/docs/index.html'):
+            return 0
+        match = re.match(r'^/docs/guide/page-(\d+)\.html$', path)
+        if match is None or not 0 < int(match.group(1)) < self.pages:
+            return None
+        return int(match.group(1))
+
+    def page(self, index):
+        targets = [0] + [(index + step) % self.pages for step in range(1, self.links_per_page + 1)]
+        links = ' '.join(f'<a href="{urlparse(self.page_url(target)).path}">page {target}</a>' for target in dict.fromkeys(targets))
+        template = JS_PAGE_TEMPLATE if index > 0 and index % JS_PAGE_EVERY == 0 else STATIC_PAGE_TEMPLATE
+        return template.format(index=index, links=links).encode('utf-8')
+
+    def sitemap(self):
+        entries = ''.join(f"<url><loc>{url}</loc><lastmod>2024-01-01</lastmod></url>" for url in self.page_urls())
+        return (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>').encode('utf-8')
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+def start_server(server):
+    """serve in a daemon thread, return the server"""
+    thread = threading.Thread(target=server.serve_forever, name='catoverflow-bench-server', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,292 @@
+"""
+Benchmark the plugin offline, against local stand-ins of GitHub and of a documentation site.
+
+    python benchmarks/run_benchmarks.py --repo-sizes 50,200,1000 --site-sizes 20,100 --output bench_output.json
+    python benchmarks/run_benchmarks.py --baseline bench_output.json --tolerance 0.25
+
+Every component is timed at every size and the results are written as JSON.
+A component whose dependencies are not installed is reported as skipped.
+With --baseline the run exits with status 1 when a component is slower than the baseline by more than the tolerance"""
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import zipfile
+import argparse
+import contextlib
+import platform
+import importlib
+import tempfile
+import statistics
+import multiprocessing
+import urllib.request
+
+# the repository is loaded as a package under this name, like the Cheshire Cat does with its plugins
+PACKAGE = 'catoverflow'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def plugin_module(name):
+    """import a module of the plugin, the package is registered on the first call"""
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+def split_sizes(value):
+    return [int(size) for size in value.split(',') if size.strip()]
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+def timed(func, *args, **kwargs):
+    """return a (result, seconds) tuple"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def bench_find_repo(context, size, work_folder):
+    """size is the number of search results, half of the lookups use the web search and half the API"""
+    finder_module = plugin_module('gh_repo_finder')
+    context.github.search_results = size
+    lookups = context.args.lookups
+    phases = {}
+    for mode, key in (('web', None), ('api', 'bench-token')):
+        finder = finder_module.GhRepoFinder(github_key=key)
+        results, phases[mode] = timed(lambda: [finder.find_repo('bench/files-10') for _ in range(lookups)])
+        if any(result is None for result in results):
+            raise Exception(f"repository search failed ({mode})")
+    return {'seconds': sum(phases.values()), 'items': 2 * lookups, 'phases': phases}
+
+def bench_easy_downloader(context, size, work_folder):
+    """download, extract and revalidate (304) the zipball of a repository of size files"""
+    downloader_module = plugin_module('gh_easy_downloader')
+    resolver_module = plugin_module('branch_resolver')
+    name = f"bench/files-{size}"
+    resolver = resolver_module.BranchResolver(f"{work_folder}/cache")
+    downloader = downloader_module.GhEasyDownloader(name, f"{work_folder}/repositories", branch_resolver=resolver)
+    result, download = timed(downloader.download_files_from_repo)
+    if not result or result['result'] is not True:
+        raise Exception(f"download of {name} failed: {result}")
+    extracted, extract = timed(downloader.extract_archive, result)
+    result, revalidate = timed(downloader.download_files_from_repo)
+    if result['not_modified'] is not True:
+        raise Exception(f"the archive of {name} was downloaded again instead of being revalidated")
+    return {'seconds': download + extract, 'items': size, 'phases': {'download': download, 'extract': extract, 'revalidate': revalidate}}
+
+def bench_api_downloader(context, size, work_folder):
+    """list the tree of a repository of size files and download every blob from the raw endpoint"""
+    downloader_module = plugin_module('gh_api_downloader')
+    name = f"bench/files-{size}"
+    downloader, setup = timed(downloader_module.GhApiRepoDownloader, name, f"{work_folder}/repositories", key='bench-token',
+                              workers=context.args.download_workers)
+    result, download = timed(downloader.download_files_from_repo)
+    if result['result'] is not True:
+        raise Exception(f"download of {name} failed")
+    return {'seconds': setup + download, 'items': size, 'phases': {'repository': setup, 'tree_and_blobs': download}}
+
+def bench_spider(context, size, work_folder):
+    """crawl a documentation site of size pages (robots.txt and sitemap included)"""
+    spider_module = plugin_module('my_spider')
+    site = context.sites[size]
+    found_pages, seconds = timed(spider_module.MySpider.runme, site.start_url, set(), n=context.args.crawl_depth, max_pages=size,
+                                 output_folder=f"{work_folder}/pages", timeout=context.args.crawl_timeout)
+    return {'seconds': seconds, 'items': len(found_pages), 'phases': {'crawl': seconds}}
+
+def bench_page_downloader(context, size, work_folder):
+    """save the pages of a site of size pages, the static ones from the bodies on disk and the others with a browser"""
+    page_downloader_module = plugin_module('page_downloader')
+    site = context.sites[size]
+    page_urls = site.page_urls()
+    if context.args.skip_render:
+        page_urls = [page_url for page_url in page_urls if page_url not in site.js_pages()]
+    static_pages = {}
+    os.makedirs(f"{work_folder}/bodies", exist_ok=True)
+    for index, page_url in enumerate(page_urls):
+        static_pages[page_url] = f"{work_folder}/bodies/page_{index}.html"
+        with open(static_pages[page_url], 'wb') as f:
+            f.write(fetch(page_url))
+    downloader = page_downloader_module.PageDownloader(f"{work_folder}/site", page_urls, static_pages=static_pages,
+                                                       concurrency=context.args.render_concurrency)
+    message, seconds = timed(downloader.save_pages)
+    return {'seconds': seconds, 'items': len(page_urls), 'phases': {'save_pages': seconds}, 'message': message}
+
+def bench_ingestion(context, size, work_folder):
+    """ingest the extracted files of a repository of size files into the fake rabbit hole"""
+    stub_cat = importlib.import_module('stub_cat')
+    cat_overflow = plugin_module('cat_overflow')
+    file_filter_module = plugin_module('file_filter')
+    folder = f"{work_folder}/repository"
+    with zipfile.ZipFile(_download_archive(context, size, work_folder)) as zip_file:
+        zip_file.extractall(folder)
+    cat = stub_cat.StubCat(context.args.store_delay)
+    stats, seconds = timed(cat_overflow.run_ingestion, cat, folder, workers=context.args.ingestion_workers,
+                           file_filter=file_filter_module.FileFilter())
+    return {'seconds': seconds, 'items': stats['ingested'], 'phases': {'ingestion': seconds},
+            'ingestion': {key: stats[key] for key in ('files', 'ingested', 'errors', 'max_concurrency', 'skipped')},
+            'rabbit_hole': dict(cat.rabbit_hole.stats)}
+
+def _download_archive(context, size, work_folder):
+    archive_path = f"{work_folder}/files-{size}.zip"
+    with open(archive_path, 'wb') as f:
+        f.write(fetch(f"{context.github.base_url}/bench/files-{size}/archive/refs/heads/main.zip"))
+    return archive_path
+
+# component -> (function, option with its sizes)
+BENCHMARKS = {
+    'find_repo': (bench_find_repo, 'search_sizes'),
+    'easy_downloader': (bench_easy_downloader, 'repo_sizes'),
+    'api_downloader': (bench_api_downloader, 'repo_sizes'),
+    'spider': (bench_spider, 'site_sizes'),
+    'page_downloader': (bench_page_downloader, 'site_sizes'),
+    'ingestion': (bench_ingestion, 'repo_sizes'),
+}
+
+class Context:
+    """servers and options shared by the benchmarks"""
+
+    def __init__(self, args, github, sites):
+        self.args = args
+        self.github = github
+        self.sites = sites
+
+    def requests(self):
+        return self.github.requests + sum(site.requests for site in self.sites.values())
+
+def run_benchmark(context, component, size):
+    """run a benchmark repeat times, return its result entry"""
+    func, _ = BENCHMARKS[component]
+    entry = {'component': component, 'size': size, 'status': 'ok'}
+    runs = []
+    requests_before = context.requests()
+    try:
+        for _ in range(context.args.repeat):
+            work_folder = tempfile.mkdtemp(prefix=f"catoverflow-bench-{component}-")
+            try:
+                runs.append(func(context, size, work_folder))
+            finally:
+                shutil.rmtree(work_folder, ignore_errors=True)
+    except ImportError as e:
+        entry.update({'status': 'skipped', 'reason': f"missing dependency: {e}"})
+        return entry
+    except Exception as e:
+        # first line only, some errors (e.g. a missing browser) come with a banner
+        lines = str(e).strip().splitlines()
+        entry.update({'status': 'error', 'reason': f"{type(e).__name__}: {lines[0] if lines else ''}"})
+        return entry
+    seconds = [run['seconds'] for run in runs]
+    median = statistics.median(seconds)
+    last = runs[-1]
+    entry.update({
+        'seconds': round(median, 4),
+        'min_seconds': round(min(seconds), 4),
+        'runs': [round(value, 4) for value in seconds],
+        'items': last['items'],
+        'items_per_second': round(last['items'] / median, 2) if median > 0 else None,
+        'requests': (context.requests() - requests_before) // len(runs),
+        'phases': {name: round(value, 4) for name, value in last['phases'].items()},
+    })
+    for key in ('message', 'ingestion', 'rabbit_hole'):
+        if key in last:
+            entry[key] = last[key]
+    return entry
+
+def compare(results, baseline_path, tolerance):
+    """add the ratio to the baseline to every result, return the regressions"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(entry['component'], entry['size']): entry for entry in json.load(f)['results'] if entry['status'] == 'ok'}
+    regressions = []
+    for entry in results:
+        previous = baseline.get((entry['component'], entry['size']))
+        if entry['status'] != 'ok' or previous is None or previous['seconds'] <= 0:
+            continue
+        entry['baseline_ratio'] = round(entry['seconds'] / previous['seconds'], 3)
+        if entry['baseline_ratio'] > 1 + tolerance:
+            regressions.append(entry)
+    return regressions
+
+def print_table(results):
+    print(f"{'component':<16} {'size':>6} {'status':<8} {'seconds':>9} {'items/s':>9} {'requests':>8}  notes")
+    for entry in results:
+        notes = entry.get('reason', '')
+        if 'baseline_ratio' in entry:
+            notes = f"x{entry['baseline_ratio']} of baseline"
+        print(f"{entry['component']:<16} {entry['size']:>6} {entry['status']:<8} {entry.get('seconds', ''):>9} "
+              f"{entry.get('items_per_second') or '':>9} {entry.get('requests', ''):>8}  {notes}")
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description='offline benchmarks of the cat-overflow plugin')
+    parser.add_argument('--components', default=','.join(BENCHMARKS), help='comma separated components to run')
+    parser.add_argument('--repo-sizes', type=split_sizes, default=[50, 200, 1000], help='files of the benchmark repositories')
+    parser.add_argument('--site-sizes', type=split_sizes, default=[20, 100], help='pages of the benchmark documentation sites')
+    parser.add_argument('--search-sizes', type=split_sizes, default=[10, 100], help='results of the repository searches')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark, the median is reported')
+    parser.add_argument('--lookups', type=int, default=20, help='repository searches per find_repo run and mode')
+    parser.add_argument('--download-workers', type=int, default=8)
+    parser.add_argument('--ingestion-workers', type=int, default=4)
+    parser.add_argument('--render-concurrency', type=int, default=4)
+    parser.add_argument('--skip-render', action='store_true', help='leave the javascript pages out of the page_downloader benchmark')
+    parser.add_argument('--store-delay', type=float, default=0.0, help='seconds the fake rabbit hole spends per stored chunk')
+    parser.add_argument('--crawl-depth', type=int, default=5)
+    parser.add_argument('--crawl-timeout', type=int, default=300)
+    parser.add_argument('--output', default='bench_output.json', help='json results file')
+    parser.add_argument('--baseline', default=None, help='json results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown over the baseline reported as a regression')
+    return parser.parse_args(argv)
+
+def main(argv = None):
+    args = parse_args(argv)
+    components = [component for component in args.components.split(',') if component in BENCHMARKS]
+    # the crawl worker needs the plugin package registered by this process
+    if 'fork' in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method('fork', force=True)
+
+    fake_servers = importlib.import_module('fake_servers')
+    stub_cat = importlib.import_module('stub_cat')
+    github = fake_servers.start_server(fake_servers.FakeGitHub())
+    sites = {size: fake_servers.start_server(fake_servers.FakeDocsSite(size)) for size in args.site_sizes}
+    # the GitHub urls of the plugin are read from the environment when its modules are imported
+    os.environ.update(github.env)
+    stub_cat.install_cat_modules()
+    context = Context(args, github, sites)
+
+    results = []
+    try:
+        for component in components:
+            for size in getattr(args, BENCHMARKS[component][1]):
+                # the plugin prints every ingested file, stdout is kept for the result table
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    entry = run_benchmark(context, component, size)
+                results.append(entry)
+                print(f"{component} [{size}]: {entry['status']} {entry.get('seconds', entry.get('reason', ''))}", file=sys.stderr)
+    finally:
+        if f"{PACKAGE}.crawl_service" in sys.modules:
+            sys.modules[f"{PACKAGE}.crawl_service"].get_crawl_service().shutdown()
+        github.shutdown()
+        for site in sites.values():
+            site.shutdown()
+
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else []
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+        'regressions': [f"{entry['component']} [{entry['size']}]" for entry in regressions],
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print_table(results)
+    print(f"results written to {args.output}")
+    if len(regressions) > 0:
+        print(f"regressions over {args.tolerance:.0%}: {', '.join(report['regressions'])}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""A stand-in of the Cheshire Cat for the benchmarks: a fake rabbit hole that chunks files without embedding them"""
+import os
+import sys
+import time
+import types
+import logging
+import threading
+
+# extensions the fake rabbit hole refuses, like the real one does for the mime types it has no parser for
+UNSUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.gz', '.pdf', '.woff', '.woff2')
+CHUNK_SIZE = 512
+
+class Document:
+    """the two attributes of a langchain document the plugin reads"""
+
+    def __init__(self, page_content, metadata = None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+class FakeRabbitHole:
+    """Split files and strings into fixed size chunks and count what would have been embedded"""
+
+    def __init__(self, store_delay = 0.0):
+        # seconds spent per stored chunk, stands in for the embedder and the vector memory
+        self.store_delay = float(store_delay)
+        self.lock = threading.Lock()
+        self.stats = {'files': 0, 'strings': 0, 'documents': 0, 'bytes': 0, 'rejected': 0}
+
+    def count(self, key, amount = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def string_to_docs(self, cat, file_bytes, source = None, content_type = 'text/plain', chunk_size = None, chunk_overlap = None):
+        self.count('strings')
+        text = file_bytes.decode('utf-8', errors='replace') if isinstance(file_bytes, bytes) else file_bytes
+        self.count('bytes', len(text))
+        size = chunk_size or CHUNK_SIZE
+        return [Document(text[start:start + size], {'source': source}) for start in range(0, len(text), size)]
+
+    def file_to_docs(self, cat, file_path, chunk_size = None, chunk_overlap = None):
+        if file_path.lower().endswith(UNSUPPORTED_EXTENSIONS):
+            self.count('rejected')
+            raise ValueError(f"unsupported file type: {file_path}")
+        self.count('files')
+        with open(file_path, 'rb') as f:
+            return self.string_to_docs(cat, f.read(), source=os.path.basename(file_path), chunk_size=chunk_size)
+
+    def store_documents(self, cat, docs, source, metadata = None):
+        if self.store_delay > 0:
+            time.sleep(self.store_delay * len(docs))
+        self.count('documents', len(docs))
+
+    def ingest_file(self, cat, file, chunk_size = None, chunk_overlap = None, metadata = None):
+        docs = self.file_to_docs(cat, file, chunk_size, chunk_overlap)
+        self.store_documents(cat, docs, file, metadata)
+
+class StubCat:
+    """the cat object passed to the tools: a fake rabbit hole and the chat messages it was sent"""
+
+    def __init__(self, store_delay = 0.0):
+        self.rabbit_hole = FakeRabbitHole(store_delay)
+        self.messages = []
+
+    def send_ws_message(self, content, msg_type = 'notification'):
+        self.messages.append((msg_type, content))
+
+def _tool(*args, **kwargs):
+    # @tool and @tool(...) both return the function unchanged
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return args[0]
+    return lambda func: func
+
+def install_cat_modules():
+    """
+    register the cat modules imported by the plugin (cat.log, cat.mad_hatter.decorators, langchain_core.documents) when the Cheshire Cat is not installed,
+    return False when the real ones are available"""
+    try:
+        import cat.log  # noqa: F401
+        return False
+    except ImportError:
+        pass
+    logger = logging.getLogger('catoverflow.bench')
+    modules = {
+        'cat': types.ModuleType('cat'),
+        'cat.log': types.ModuleType('cat.log'),
+        'cat.mad_hatter': types.ModuleType('cat.mad_hatter'),
+        'cat.mad_hatter.decorators': types.ModuleType('cat.mad_hatter.decorators'),
+    }
+    modules['cat'].__path__ = []
+    modules['cat.mad_hatter'].__path__ = []
+    modules['cat.log'].log = logger
+    modules['cat.mad_hatter.decorators'].tool = _tool
+    modules['cat.mad_hatter.decorators'].plugin = lambda func: func
+    modules['cat.mad_hatter.decorators'].hook = _tool
+    try:
+        import langchain_core.documents  # noqa: F401
+    except ImportError:
+        # shipped with the Cheshire Cat, the code chunker builds its documents with it
+        modules['langchain_core'] = types.ModuleType('langchain_core')
+        modules['langchain_core'].__path__ = []
+        modules['langchain_core.documents'] = types.ModuleType('langchain_core.documents')
+        modules['langchain_core.documents'].Document = Document
+    sys.modules.update(modules)
+    return True
@@ -0,0 +1,96 @@
+"""This class finds the default branch of a GitHub repository with a single request"""
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+import requests
+from cat.log import log
+from .github_scheduler import get_scheduler, PRIORITY_METADATA, GITHUB_API_URL, GITHUB_WEB_URL
+
+SYMREF_PATTERN = re.compile(r'symref=HEAD:refs/heads/([^\s\x00]+)')
+# every resolver reads and rewrites the same cache file, repositories of a batch resolve their branch at the same time
+_CACHE_LOCK = threading.Lock()
+
+class BranchResolver:
+    """Resolve (and cache with a TTL) the default branch of a repository"""
+
+    def __init__(self, cache_folder, github_key = None, ttl = 86400):
+        self.github_key = github_key
+        self.ttl = int(ttl)
+        self.cache_path = f"{cache_folder}/branches.json"
+        self.lock = _CACHE_LOCK
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"unable to read branch cache {self.cache_path}: {e}")
+            return {}
+
+    def _save_cache(self, cache):
+        # a temporary file of its own, a process sharing the cache folder never replaces the file being written here
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(self.cache_path), prefix='branches.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                json.dump(cache, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            log.error(f"unable to save branch cache {self.cache_path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _from_api(self, repository_name):
+        url = f"{GITHUB_API_URL}/repos/{repository_name}"
+        headers = {'Authorization': f"token {self.github_key}", 'Accept': 'application/vnd.github+json'}
+        response = get_scheduler().request('GET', url, priority=PRIORITY_METADATA, resource='core', headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json().get('default_branch')
+
+    def _from_info_refs(self, repository_name):
+        # the smart http advertisement starts with the HEAD symref, only the first bytes are needed
+        url = f"{GITHUB_WEB_URL}/{repository_name}.git/info/refs?service=git-upload-pack"
+        with get_scheduler().request('GET', url, priority=PRIORITY_METADATA, resource='web', stream=True, timeout=10) as response:
+            response.raise_for_status()
+            head = b''
+            for chunk in response.iter_content(chunk_size=4 * 1024):
+                head += chunk
+                match = SYMREF_PATTERN.search(head.decode('utf-8', errors='ignore'))
+                if match is not None:
+                    return match.group(1)
+                if len(head) >= 16 * 1024:
+                    break
+        return None
+
+    def resolve(self, repository_name):
+        """default branch of the repository, None if it can not be resolved"""
+        with self.lock:
+            cache = self._load_cache()
+            cached = cache.get(repository_name)
+            if cached is not None and time.time() - cached.get('resolved_at', 0) < self.ttl:
+                log.info(f"default branch of {repository_name} from cache: {cached['branch']}")
+                return cached['branch']
+
+        branch = None
+        try:
+            if self.github_key not in [None, '']:
+                branch = self._from_api(repository_name)
+            else:
+                branch = self._from_info_refs(repository_name)
+        except requests.exceptions.RequestException as e:
+            log.error(f"unable to resolve the default branch of {repository_name}: {e}")
+
+        if branch is not None:
+            log.info(f"default branch of {repository_name}: {branch}")
+            with self.lock:
+                cache = self._load_cache()
+                cache[repository_name] = {'branch': branch, 'resolved_at': time.time()}
+                self._save_cache(cache)
+        return branch
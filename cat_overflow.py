@@ -1,7 +1,11 @@
 '''cat_overflow plugin'''
 import os
+import time
+import shutil
+import zipfile
+import functools
 import threading
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 from cat.mad_hatter.decorators import tool, plugin
 from cat.log import log
@@ -10,12 +14,32 @@ from urllib.parse import urlparse
 from .gh_repo_finder import GhRepoFinder
 from .gh_easy_downloader import GhEasyDownloader
 from .gh_api_downloader import GhApiRepoDownloader
+from .branch_resolver import BranchResolver
+from .search_cache import get_search_cache
+from .github_scheduler import get_scheduler, GITHUB_WEB_URL
 from .my_spider import MySpider
+from .crawl_frontier import DEFAULT_EXCLUDE_URL_PATTERNS
 from .page_downloader import PageDownloader
+from .doc_pipeline import DocPipeline
+from .content_extractor import ContentExtractor
+from .dedup import Deduplicator
+from .ingestion_manifest import IngestionManifest
+from .ingestion_pool import IngestionPool
+from .file_filter import FileFilter, DEFAULT_EXCLUDE_GLOBS, DEFAULT_EXCLUDED_DIRS, DEFAULT_MAX_FILE_SIZE_KB
+from .job_manager import get_job_manager, JobCancelled
+from .raw_fallback import RawFallback
+from .url_utils import canonicalize_url
+from .metrics import RunMetrics
+from .code_chunker import CodeChunker, DEFAULT_MAX_CHUNK_CHARS
 
 import subprocess
 
 CAT_OVERFLOW_DIR = "/catoverflow"
+CACHE_DIR = f"{CAT_OVERFLOW_DIR}/cache"
+FINGERPRINTS_DIR = f"{CAT_OVERFLOW_DIR}/fingerprints"
+RUNS_DIR = f"{CAT_OVERFLOW_DIR}/runs"
+# repositories of a @getcode batch downloaded and extracted at the same time
+MAX_PARALLEL_REPOSITORIES = 8
 
 class MySettings(BaseModel):
     ''' settings for the cat_overflow plugin '''
@@ -28,6 +52,36 @@ class MySettings(BaseModel):
     use_chrome: bool = True
     use_firefox: bool = False    
     use_webkit: bool = False
+    scraping_concurrency: int = 4
+    scraping_page_timeout: int = 30
+    scraping_static_first: bool = True
+    scraping_extract_content: bool = True
+    scraping_cache: bool = True
+    scraping_use_sitemap: bool = True
+    scraping_crawl_timeout: int = 600
+    scraping_concurrent_requests: int = 8
+    scraping_autothrottle_target: float = 2.0
+    scraping_include_patterns: str = ""
+    scraping_exclude_patterns: str = DEFAULT_EXCLUDE_URL_PATTERNS
+    ingestion_workers: int = 4
+    ingestion_include_extensions: str = ""
+    ingestion_include_globs: str = ""
+    ingestion_exclude_globs: str = DEFAULT_EXCLUDE_GLOBS
+    ingestion_excluded_dirs: str = DEFAULT_EXCLUDED_DIRS
+    ingestion_max_file_size_kb: int = DEFAULT_MAX_FILE_SIZE_KB
+    stream_archives: bool = False
+    branch_cache_ttl_seconds: int = 86400
+    download_workers: int = 8
+    deduplicate_content: bool = True
+    dedup_max_distance: int = 3
+    search_cache_ttl_seconds: int = 3600
+    search_negative_cache_ttl_seconds: int = 300
+    job_workers: int = 2
+    ingest_top_results: int = 0
+    code_chunking: bool = True
+    code_chunk_max_chars: int = DEFAULT_MAX_CHUNK_CHARS
+    metrics_reports: bool = True
+    metrics_prometheus_file: str = ""
 
 @plugin
 def settings_model():
@@ -39,68 +93,419 @@ def activated(plugin):
     subprocess.run(["playwright", "install"]) 
     subprocess.run(["playwright", "install-deps"]) 
 
-def raw_file_url_exists(raw_file_url):
+def ingest_deduplicated(cat, file_path, dedup, chunker = None, path = None):
     '''
-    Check if an url exists'''
+    Ingest a file sending to the vector memory only the chunks that are not already embedded for the library.
+    Source files are split by chunker (a CodeChunker) when one is given'''
+    duplicate, file_fingerprint = dedup.check_file(file_path)
+    if duplicate:
+        log.info(f"skipping duplicate file: {file_path}")
+        return
+    docs = None if chunker is None else chunker.file_to_docs(file_path, path)
+    if docs is None:
+        docs = cat.rabbit_hole.file_to_docs(cat, file_path)
+    kept, chunk_fingerprints = dedup.filter_documents(docs)
     try:
-        r = requests.get(raw_file_url, timeout=5)
-        r.raise_for_status()  # Raise exception for any HTTP errors
-        return r.status_code == 200
+        if len(kept) > 0:
+            cat.rabbit_hole.store_documents(cat, kept, file_path)
     except Exception:
-        return False
+        dedup.forget_chunks(chunk_fingerprints)
+        raise
+    dedup.record_file(file_fingerprint)
 
-def ingest_archive(cat, root, relpath, file, fallback = True, tool_input = '', branch_name = ''):
+def ingest_archive(cat, root, relpath, file, fallback = None, dedup = None, chunker = None):
+    '''
+    Ingest a file from disk, the files the rabbit hole rejects are queued to the raw github fallback when one is given.
+    When chunker (a CodeChunker) is given source files are stored as one document per symbol.
+    Returns 'fallback' when the file has been queued to the fallback, None when it has been ingested'''
     print(f"ingesting file: {os.path.join(root, file)}")
+    path = '/'.join(part for part in (relpath, file) if part)
     try:
-        cat.rabbit_hole.ingest_file(cat, os.path.join(root, file))
+        if dedup is not None:
+            ingest_deduplicated(cat, os.path.join(root, file), dedup, chunker, path)
+            return
+        docs = None if chunker is None else chunker.file_to_docs(os.path.join(root, file), path)
+        if docs is None:
+            cat.rabbit_hole.ingest_file(cat, os.path.join(root, file))
+        elif len(docs) > 0:
+            cat.rabbit_hole.store_documents(cat, docs, os.path.join(root, file))
     except ValueError as e:
-        if fallback:
-            raw_file_url = f"https://raw.githubusercontent.com/{tool_input}/{branch_name}/{relpath}/{file}"
-            if raw_file_url_exists(raw_file_url):
-                log.info(f"falling back to raw github url: {raw_file_url}")
-                cat.rabbit_hole.ingest_file(cat, raw_file_url)
-            else:
-                log.error(f"raw github url IS WRONG!!!: {raw_file_url}")
-        else:
+        if fallback is None:
             raise e
+        fallback.add(os.path.join(root, file), relpath, file)
+        return 'fallback'
+
+def relative_folder(relpath):
+    '''
+    Drop the top level folder of the archive (e.g. repository-main) from a relative path'''
+    return '/'.join(relpath.split('/')[1:])
+
+def run_ingestion(cat, folder, fallback = None, workers = 4, manifest = None, file_filter = None, dedup = None,
+                  cancel_event = None, metrics = None, executor = None, chunker = None):
+    '''
+    Ingest every file found in folder using a bounded pool of workers.
+    Files are submitted while os.walk is still running, at most 2 * workers at a time.
+    When a manifest is given only new or changed files are sent to the rabbit hole.
+    When a file_filter is given excluded directories are pruned and rejected files are counted per reason.
+    When cancel_event is set the walk stops and the queued files are skipped.
+    Files rejected by the rabbit hole are queued to fallback (a RawFallback) when one is given.
+    When metrics (a RunMetrics) is given every file is recorded with its time, size and outcome.
+    When executor is given the files are ingested by its workers, shared with other ingestions.
+    When chunker (a CodeChunker) is given source files are split by symbol instead of by size.
+    Returns a dict with the ingestion statistics'''
+    if file_filter is not None:
+        file_filter.load_gitignore(folder)
+
+    with IngestionPool(workers, manifest=manifest, file_filter=file_filter, root_folder=folder, cancel_event=cancel_event,
+                       metrics=metrics, executor=executor) as pool:
+        for root, dirs, files in os.walk(folder):
+            if pool.cancelled:
+                break
+            relpath = relative_folder(os.path.relpath(root, folder).replace(os.sep, '/'))
+            pool.prune_dirs(dirs, relpath)
+            for file in files:
+                pool.submit(os.path.join(root, file), ingest_archive, cat, root, relpath, file, fallback, dedup, chunker)
+
+    return pool.stats
+
+def run_archive_ingestion(cat, archive_path, extraction_folder, fallback = None, workers = 4, manifest = None, file_filter = None, dedup = None,
+                          cancel_event = None, metrics = None, executor = None, chunker = None):
+    '''
+    Ingest the members of a zip archive without extracting it first.
+    Every member is decompressed by a worker into the extraction folder, ingested and then removed,
+    so the disk only holds the archive plus the files currently being ingested.
+    Returns a dict with the ingestion statistics'''
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref, \
+            IngestionPool(workers, manifest=manifest, file_filter=file_filter, root_folder=extraction_folder, cancel_event=cancel_event,
+                          metrics=metrics, executor=executor) as pool:
+        if file_filter is not None and file_filter.use_gitignore:
+            for info in zip_ref.infolist():
+                if info.filename.endswith('/.gitignore'):
+                    file_filter.add_gitignore_patterns(zip_ref.read(info).decode('utf-8', errors='ignore'))
+        for info in zip_ref.infolist():
+            if pool.cancelled:
+                break
+            if info.is_dir():
+                continue
+            member_path = relative_folder(info.filename)
+            if file_filter is not None:
+                if file_filter.is_excluded_path(member_path):
+                    pool.count_skipped('directory')
+                    continue
+                reason = file_filter.reject_reason_for_name(member_path, info.file_size)
+                if reason is not None:
+                    pool.count_skipped(reason)
+                    continue
+            target_path = os.path.join(extraction_folder, *info.filename.split('/'))
+            root, file = os.path.split(target_path)
+            relpath = relative_folder(os.path.dirname(info.filename))
+            prepare = functools.partial(spool_archive_member, zip_ref, info, target_path)
+            pool.submit(target_path, ingest_archive, cat, root, relpath, file, fallback, dedup, chunker, prepare=prepare, cleanup=True)
+
+    remove_empty_folders(extraction_folder)
+    return pool.stats
+
+def spool_archive_member(zip_ref, info, target_path):
+    '''
+    Decompress a single archive member on disk keeping its original modification time'''
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with zip_ref.open(info) as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 64 * 1024)
+    modified_at = time.mktime(info.date_time + (0, 0, -1))
+    os.utime(target_path, (modified_at, modified_at))
+
+def remove_empty_folders(folder):
+    '''
+    Remove the empty folders left behind by the archive streaming'''
+    for root, dirs, files in os.walk(folder, topdown=False):
+        if root != folder and not os.listdir(root):
+            os.rmdir(root)
 
-def run_ingestion(cat, folder, fallback = True, tool_input = '', branch_name = ''):
-    ingestion_threads = []
+def ingestion_summary(stats):
+    '''
+    Format the ingestion statistics returned by run_ingestion'''
+    summary = (
+        f"{stats['ingested']}/{stats['files']} files have been ingested in {stats['elapsed']}s "
+        f"({stats['unchanged']} unchanged, {stats['fallback']} sent to the raw github fallback) "
+        f"using up to {stats['max_concurrency']} concurrent workers "
+        f"(pool size: {stats['workers']}, errors: {stats['errors']})"
+    )
+    if stats['skipped']:
+        skipped = ', '.join(f"{reason}: {count}" for reason, count in sorted(stats['skipped'].items()))
+        summary += f", skipped ({skipped})"
+    return summary
+
+def deduplicator_setting(settings, library):
+    '''
+    Build the fingerprint index of a library, None when deduplication is disabled'''
+    if 'deduplicate_content' in settings and settings['deduplicate_content'] is not True:
+        return None
+    max_distance = 3 if 'dedup_max_distance' not in settings else settings['dedup_max_distance']
+    return Deduplicator(FINGERPRINTS_DIR, library, max_distance=max_distance)
 
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            relpath = f"{root.replace(folder, '')}"[1:]
-            relpath = ''.join((relpath, '/'))
-            relpath = '/'.join(relpath.split('/')[1:])[:-1]
-            t = threading.Thread(target=ingest_archive, args=(cat, root, relpath, file, fallback, tool_input, branch_name))
-            ingestion_threads.append(t)
+def code_chunker_setting(settings, repository, branch):
+    '''
+    Build the code chunker of a repository, None when code chunking is disabled'''
+    if 'code_chunking' in settings and settings['code_chunking'] is not True:
+        return None
+    max_chunk_chars = DEFAULT_MAX_CHUNK_CHARS if 'code_chunk_max_chars' not in settings else settings['code_chunk_max_chars']
+    return CodeChunker(repository, branch, max_chunk_chars=max_chunk_chars)
 
-    log.info(f"the number of ingestion threads is: {len(ingestion_threads)}")
+def ingestion_workers_setting(settings):
+    '''
+    Read the ingestion_workers setting, falling back to the default value'''
+    workers = 4 if 'ingestion_workers' not in settings else settings['ingestion_workers']
+    try:
+        return max(1, int(workers))
+    except (TypeError, ValueError):
+        return 4
 
-    thread_count = len(ingestion_threads)
-    for t in ingestion_threads:
-        t.start()
-        t.join()
-    
-    return thread_count
+def parse_repository_ref(tool_input):
+    '''
+    Split "owner/repository@ref" into the search key and the pinned ref (None if missing)'''
+    tool_input = tool_input.strip().strip('"').strip("'")
+    if '@' in tool_input:
+        name, ref = tool_input.rsplit('@', 1)
+        if name.strip() != '' and ref.strip() != '':
+            return name.strip(), ref.strip()
+    return tool_input, None
+
+def parse_repositories(tool_input):
+    '''
+    Split the input of @getcode into (name, ref) tuples.
+    Several repositories are separated by commas, or by spaces when every one is written as owner/repository,
+    any other input is a single search key (e.g. "cheshire cat")'''
+    tool_input = tool_input.strip().strip('"').strip("'")
+    names = tool_input.replace(',', ' ').split()
+    if ',' not in tool_input and not all('/' in name for name in names):
+        return [parse_repository_ref(tool_input)]
+    return [parse_repository_ref(name) for name in names]
+
+def getcode_settings(settings):
+    '''
+    Read the settings used by @getcode, falling back to the default values'''
+    return {
+        'github_key': None if 'github_api_key' not in settings else settings['github_api_key'].strip(),
+        'use_api': False if 'use_api' not in settings else settings['use_api'] is True,
+        'search_on_web': False if 'search_on_web' not in settings else settings['search_on_web'] is True,
+        'search_on_stack_overflow': False if 'search_on_stack_overflow' not in settings else settings['search_on_stack_overflow'] is True,
+        'ingestion_workers': ingestion_workers_setting(settings),
+        'stream_archives': False if 'stream_archives' not in settings else settings['stream_archives'] is True,
+        'branch_cache_ttl': 86400 if 'branch_cache_ttl_seconds' not in settings else settings['branch_cache_ttl_seconds'],
+        'download_workers': 8 if 'download_workers' not in settings else max(1, int(settings['download_workers'])),
+        'search_cache_ttl': 3600 if 'search_cache_ttl_seconds' not in settings else settings['search_cache_ttl_seconds'],
+        'search_negative_cache_ttl': 300 if 'search_negative_cache_ttl_seconds' not in settings else settings['search_negative_cache_ttl_seconds'],
+        'ingest_top_results': 0 if 'ingest_top_results' not in settings else max(0, int(settings['ingest_top_results'])),
+    }
+
+def repository_finder(options):
+    '''
+    Repository search sharing the search cache of the plugin'''
+    return GhRepoFinder(github_key=options['github_key'], cache=get_search_cache(CACHE_DIR),
+                        cache_ttl=options['search_cache_ttl'], negative_cache_ttl=options['search_negative_cache_ttl'])
+
+_REPOSITORY_LOCKS = {}
+_REPOSITORY_LOCKS_LOCK = threading.Lock()
+
+def repository_lock(repository_name):
+    '''
+    Lock of a repository: archive, extraction folder and manifest are shared by every ref and every job of a repository'''
+    with _REPOSITORY_LOCKS_LOCK:
+        return _REPOSITORY_LOCKS.setdefault(repository_name.lower(), threading.Lock())
+
+def ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event, metrics = None, executor = None):
+    '''
+    Download, extract and ingest a repository ({'name', 'url'}), return the summary of the ingestion.
+    stage(name) is called at the start of every step and raises JobCancelled once the job has been cancelled,
+    progress(message) is sent to the chat. When executor is given the files are ingested by its shared workers.
+    A repository already being ingested by another job (another ref or a batch) is waited for'''
+    lock = repository_lock(repository['name'])
+    if not lock.acquire(blocking=False):
+        stage('wait for repository')
+        progress(f"{repository['name']} is being ingested by another job, waiting for it to finish")
+        while not lock.acquire(timeout=1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled(f"ingestion of {repository['name']} has been cancelled")
+    try:
+        return download_and_ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event,
+                                              metrics=metrics, executor=executor)
+    finally:
+        lock.release()
+
+def download_and_ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event, metrics = None, executor = None):
+    '''
+    Download, extract and ingest a repository, the caller holds its repository_lock'''
+    repository_name = repository['name']
+    github_key = options['github_key']
+    output_folder = f"{CAT_OVERFLOW_DIR}/repositories"
+
+    stage('download')
+    msg = f'''
+    Start downloading repository:
+
+    name: {repository_name}'
+    url: {repository['url']}'
+    '''
+    progress(msg)
+    log.info(msg)
+    log.info(f'output_directory: {output_folder}')
+
+    if github_key is not None and options['use_api'] is True:
+        #raise ValueError("Not implemented")
+        gh_repo_downloader = GhApiRepoDownloader(key = github_key, name = repository_name, output_folder = output_folder, ref = repository_ref,
+                                                 workers = options['download_workers'], file_filter = FileFilter.from_settings(settings))
+    else:
+        branch_resolver = BranchResolver(CACHE_DIR, github_key = github_key, ttl = options['branch_cache_ttl'])
+        gh_repo_downloader = GhEasyDownloader(name = repository_name, output_folder = output_folder, ref = repository_ref, branch_resolver = branch_resolver)
+
+    download_result = gh_repo_downloader.download_files_from_repo()
+    log.info(f"download result: {download_result}")
+    if metrics is not None:
+        metrics.add_counters('download', gh_repo_downloader.stats)
+    progress(f"download finished, GitHub rate limit budget: {get_scheduler().budget_summary()}")
+
+    stage('extract')
+    extract_result = gh_repo_downloader.extract_archive(download_result, stream=options['stream_archives'])
+    branch_name = extract_result['branch']
+    extraction_folder = extract_result['extraction_folder']
+
+    stage('ingest')
+    progress("ingesting library archive has <b>started</b>.")
+
+    manifest = IngestionManifest(extraction_folder, branch_name)
+    file_filter = FileFilter.from_settings(settings)
+    dedup = deduplicator_setting(settings, repository_name)
+    chunker = code_chunker_setting(settings, repository_name, branch_name)
+    # files the rabbit hole cannot read from disk are fetched from raw.githubusercontent.com in one batch at the end
+    fallback = RawFallback(repository_name, branch_name, workers=options['download_workers'], github_key=github_key, dedup=dedup, manifest=manifest,
+                           metrics=metrics)
+    if extract_result.get('streamed') is True:
+        ingestion_stats = run_archive_ingestion(cat, extract_result['path'], extraction_folder, fallback, workers=options['ingestion_workers'],
+                                                manifest=manifest, file_filter=file_filter, dedup=dedup, cancel_event=cancel_event,
+                                                metrics=metrics, executor=executor, chunker=chunker)
+    else:
+        ingestion_stats = run_ingestion(cat, extraction_folder, fallback, workers=options['ingestion_workers'],
+                                        manifest=manifest, file_filter=file_filter, dedup=dedup, cancel_event=cancel_event,
+                                        metrics=metrics, executor=executor, chunker=chunker)
+    try:
+        stage('raw fallback')
+        fallback.run(cat, cancel_event=cancel_event)
+    finally:
+        if dedup is not None:
+            dedup.save()
+        if metrics is not None:
+            metrics.add_counters('ingestion', ingestion_stats)
+            metrics.add_counters('fallback', fallback.stats)
+            if dedup is not None:
+                metrics.add_counters('dedup', dedup.stats)
+            if chunker is not None:
+                metrics.add_counters('chunker', chunker.stats)
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled(f"ingestion of {repository_name} has been cancelled")
+    progress("ingesting library archive has <b>finished</b>.")
+
+    summary = f"{ingestion_summary(ingestion_stats)}, {fallback.summary()}"
+    if chunker is not None:
+        summary += f", {chunker.summary()}"
+    if dedup is not None:
+        summary += f", {dedup.summary()}"
+    return summary
+
+def ingest_repositories(cat, settings, options, repositories, job, metrics = None):
+    '''
+    Ingest several repositories ((name, ref) tuples, names without an owner are searched first) in one job.
+    Searches, downloads and extractions run concurrently over the shared GitHub session and the files of every repository
+    go through one shared pool of ingestion workers, so the batch takes about as long as its slowest repository'''
+    finder = repository_finder(options)
+    ingestion_executor = ThreadPoolExecutor(max_workers=options['ingestion_workers'], thread_name_prefix='catoverflow-ingestion')
+    # archive, extraction folder and manifest of a repository do not depend on the ref: every repository is ingested once per batch,
+    # and ingest_repository waits for the other jobs (single repositories or batches) ingesting the same repository
+    claimed = set()
+    claimed_lock = threading.Lock()
+
+    def claim(repository_name):
+        with claimed_lock:
+            if repository_name.lower() in claimed:
+                return False
+            claimed.add(repository_name.lower())
+            return True
+
+    def run_one(name, ref):
+        started_at = time.monotonic()
+        status = 'failed'
+
+        def stage(step):
+            job.check_cancelled()
+            job.progress(f"{name}: {step}")
+
+        try:
+            if '/' in name:
+                repository = {'name': name, 'url': f"{GITHUB_WEB_URL}/{name}"}
+            else:
+                stage('search')
+                search_results = finder.find_repo(name)
+                if not search_results:
+                    status = 'not found'
+                    return f"{name}: sorry, no repository found"
+                # the best match of the search, the batch does not stop to ask which one
+                repository = search_results[0]
+                if not claim(repository['name']):
+                    status = 'duplicate'
+                    return f"{name}: {repository['name']} is already part of this batch"
+            summary = ingest_repository(cat, settings, options, repository, ref, stage,
+                                        lambda message: job.progress(f"{repository['name']}: {message}"), job.cancel_event,
+                                        metrics=metrics, executor=ingestion_executor)
+            status = 'finished'
+            return f"{repository['name']}: {summary}"
+        except JobCancelled:
+            status = 'cancelled'
+            raise
+        finally:
+            if metrics is not None:
+                metrics.record('repo', name, time.monotonic() - started_at, status)
+
+    for name, ref in repositories:
+        if '/' in name:
+            claim(name)
+    summaries = []
+    started_at = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(repositories), MAX_PARALLEL_REPOSITORIES), thread_name_prefix='catoverflow-repository') as executor:
+            futures = [(name, executor.submit(run_one, name, ref)) for name, ref in repositories]
+            for name, future in futures:
+                try:
+                    summaries.append(future.result())
+                except JobCancelled:
+                    pass
+                except Exception as e:
+                    log.error(f"ingestion of {name} failed: {e}")
+                    summaries.append(f"{name}: failed ({e})")
+    finally:
+        ingestion_executor.shutdown(wait=True)
+    job.check_cancelled()
+    summaries.append(f"{len(repositories)} repositories processed in {time.monotonic() - started_at:.0f}s, Miao!")
+    return "\n".join(summaries)
 
 @tool(examples=[
     "@getcode cheshirecat", 
     "@getcode fastapi", 
     "@getcode react", 
-    "@getcode angularjs"], return_direct=True)
+    "@getcode angularjs",
+    "@getcode cheshire-cat-ai/docs@main",
+    "@getcode cheshire-cat-ai/core cheshire-cat-ai/docs"], return_direct=True)
 def get_code(tool_input, cat):
     '''
     Download the code library sources from github and scrape stack overflow pages about that library. 
-    Input must be prepended with @getcode followed by the library name
+    Input must be prepended with @getcode followed by the library name.
+    A branch, tag or commit can be pinned with owner/repository@ref.
+    Several repositories, separated by spaces, are downloaded and ingested together
     
     '''
 
     settings = cat.mad_hatter.get_plugin().load_settings()
-    github_key = None if 'github_api_key' not in settings else settings['github_api_key'].strip()
-    use_api = False if 'use_api' not in settings else settings['use_api'] is True
-    search_on_web = False if 'search_on_web' not in settings else settings['search_on_web'] is True
-    search_on_stack_overflow = False if 'search_on_stack_overflow' not in settings else settings['search_on_stack_overflow'] is True
+    options = getcode_settings(settings)
+    repositories = parse_repositories(tool_input)
+    tool_input, repository_ref = parse_repository_ref(tool_input)
     log.info("*" * 80)
     log.info(f"CAT OVERFLOW => settings: {settings}")
     log.info("*" * 80)
@@ -110,65 +515,51 @@ def get_code(tool_input, cat):
     * Cat Overfl0w plugin: start searching for repository: {tool_input}
     {'*' * 80}
     * current settings:
-    * use_api: {str(use_api)}
-    * search_on_web: {str(search_on_web)}
-    * search_on_stack_overflow: {str(search_on_stack_overflow)}
+    * use_api: {str(options['use_api'])}
+    * search_on_web: {str(options['search_on_web'])}
+    * search_on_stack_overflow: {str(options['search_on_stack_overflow'])}
+    * ingestion_workers: {str(options['ingestion_workers'])}
+    * stream_archives: {str(options['stream_archives'])}
+    * ingest_top_results: {str(options['ingest_top_results'])}
+    * ref: {str(repository_ref)}
     {'*' * 80}                                
     '''
     cat.send_ws_message(content=msg, msg_type="chat")
 
-    gh = GhRepoFinder(github_key=github_key)
+    metrics = metrics_setting(settings, 'getcode', tool_input)
+    if len(repositories) > 1:
+        return submit_repositories(cat, settings, options, repositories, metrics)
+
+    if metrics is not None:
+        metrics.stage('search')
+    gh = repository_finder(options)
     search_results = gh.find_repo(tool_input)
 
     log.info("*" * 80)
     log.info(f"CAT OVERFLOW => search_results: {search_results}")
     log.info("*" * 80)
+    cat.send_ws_message(content=f"GitHub rate limit budget: {get_scheduler().budget_summary()}", msg_type="chat")
 
     if search_results is None or len(search_results) == 0:
         content_msg = f'Sorry I was unable to find any repository with the key: {tool_input}'
         return content_msg
 
     if len(search_results) == 1:
-        prefix = "Start downloading repository:"
-        repository_name = search_results[0]['name']
-        repository_url = search_results[0]['url']
-        output_folder = f"{CAT_OVERFLOW_DIR}/repositories"
-
-        msg = f'''
-        {prefix}
-
-        name: {repository_name}'
-        url: {repository_url}'
-        '''
-        
-        cat.send_ws_message(content=msg, msg_type="chat")
-        log.info(msg)
-        msg = f'output_directory: {output_folder}'
-        #cat.send_ws_message(content=msg, msg_type="chat")
-        log.info(msg)
-
-        if github_key is not None and use_api is True:
-            #raise ValueError("Not implemented")
-            gh_repo_downloader = GhApiRepoDownloader(key = github_key, name = repository_name, output_folder = output_folder)
-        else:
-            gh_repo_downloader = GhEasyDownloader(name = repository_name, output_folder = output_folder)
+        repository = search_results[0]
 
-        download_result = gh_repo_downloader.download_files_from_repo()
-        log.info(f"download result: {download_result}")
+        def run(job):
+            summary = ingest_repository(cat, settings, options, repository, repository_ref, job.set_stage, job.progress, job.cancel_event,
+                                        metrics=metrics)
+            return f"{summary}, Miao!"
 
-        extract_result = gh_repo_downloader.extract_archive(download_result)
-        branch_name = extract_result['branch']
-        extraction_folder = extract_result['extraction_folder']
+        key = f"repository:{repository['name'].lower()}@{repository_ref or ''}"
+        job, merged = get_job_manager(job_workers_setting(settings)).submit('getcode', key, f"@getcode {repository['name']}", cat, run, metrics=metrics)
+        return job_started_message(job, merged)
 
-        cat.send_ws_message(content="ingesting library archive has <b>started</b>.", msg_type="chat")
-        
-        thread_count = run_ingestion(cat, output_folder, True, tool_input, branch_name)
-    
-        ingestion_finished_msg = "ingesting library archive has <b>finished</b>."
-
-        cat.send_ws_message(content=ingestion_finished_msg, msg_type="chat")
-
-        return f"All files have been ingested using {thread_count} threads, Miao!"
+    elif options['ingest_top_results'] > 0:
+        top_results = search_results[:options['ingest_top_results']]
+        cat.send_ws_message(content=f"ingesting the top {len(top_results)} results: {', '.join(result['name'] for result in top_results)}", msg_type="chat")
+        return submit_repositories(cat, settings, options, [(result['name'], None) for result in top_results], metrics)
 
     else:
         prefix = "I found the following libraries on github:"
@@ -193,6 +584,34 @@ def get_code(tool_input, cat):
             #log.info(prompt)
             return cat.llm(prompt)
 
+def unique_repositories(repositories):
+    '''
+    Keep the first (name, ref) of every repository, return the kept and the skipped ones.
+    The refs of a repository would share its archive and extraction folder'''
+    unique = {}
+    skipped = []
+    for name, ref in repositories:
+        if name.lower() in unique:
+            skipped.append((name, ref))
+        else:
+            unique[name.lower()] = (name, ref)
+    return list(unique.values()), skipped
+
+def submit_repositories(cat, settings, options, repositories, metrics = None):
+    '''
+    Start the background job ingesting several repositories'''
+    repositories, skipped = unique_repositories(repositories)
+    for name, ref in skipped:
+        cat.send_ws_message(content=f"{name}@{ref or 'default branch'} skipped, {name} is already in the list", msg_type="chat")
+    names = [name if ref is None else f"{name}@{ref}" for name, ref in repositories]
+
+    def run(job):
+        job.set_stage('download and ingest')
+        return ingest_repositories(cat, settings, options, repositories, job, metrics=metrics)
+
+    key = "repositories:" + ','.join(sorted(name.lower() for name in names))
+    job, merged = get_job_manager(job_workers_setting(settings)).submit('getcode', key, f"@getcode {' '.join(names)}", cat, run, metrics=metrics)
+    return job_started_message(job, merged)
 
 def retrieve_contents(page_urls):     
     output_folder = f"{CAT_OVERFLOW_DIR}/html_pages"
@@ -217,6 +636,18 @@ def get_code_documentation(tool_input, cat):
     use_chrome = True if 'use_chrome' not in settings else settings['use_chrome'] is True
     use_firefox = False if 'use_firefox' not in settings else settings['use_firefox'] is True
     use_webkit = False if 'use_webkit' not in settings else settings['use_webkit'] is True
+    scraping_concurrency = 4 if 'scraping_concurrency' not in settings else settings['scraping_concurrency']
+    scraping_page_timeout = 30 if 'scraping_page_timeout' not in settings else settings['scraping_page_timeout']
+    static_first = True if 'scraping_static_first' not in settings else settings['scraping_static_first'] is True
+    extract_content = True if 'scraping_extract_content' not in settings else settings['scraping_extract_content'] is True
+    use_cache = True if 'scraping_cache' not in settings else settings['scraping_cache'] is True
+    use_sitemap = True if 'scraping_use_sitemap' not in settings else settings['scraping_use_sitemap'] is True
+    crawl_timeout = 600 if 'scraping_crawl_timeout' not in settings else settings['scraping_crawl_timeout']
+    concurrent_requests = 8 if 'scraping_concurrent_requests' not in settings else settings['scraping_concurrent_requests']
+    autothrottle_target = 2.0 if 'scraping_autothrottle_target' not in settings else settings['scraping_autothrottle_target']
+    include_patterns = "" if 'scraping_include_patterns' not in settings else settings['scraping_include_patterns']
+    exclude_patterns = DEFAULT_EXCLUDE_URL_PATTERNS if 'scraping_exclude_patterns' not in settings else settings['scraping_exclude_patterns']
+    ingestion_workers = ingestion_workers_setting(settings)
 
     msg = f'''
     {'*' * 80}
@@ -228,38 +659,143 @@ def get_code_documentation(tool_input, cat):
     * use_chrome: {str(use_chrome)}
     * use_firefox: {str(use_firefox)}
     * use_webkit: {str(use_webkit)}
+    * scraping_concurrency: {str(scraping_concurrency)}
+    * scraping_page_timeout: {str(scraping_page_timeout)}
+    * scraping_static_first: {str(static_first)}
+    * scraping_extract_content: {str(extract_content)}
+    * scraping_cache: {str(use_cache)}
+    * scraping_use_sitemap: {str(use_sitemap)}
+    * scraping_crawl_timeout: {str(crawl_timeout)}
+    * scraping_concurrent_requests: {str(concurrent_requests)}
+    * scraping_autothrottle_target: {str(autothrottle_target)}
+    * scraping_include_patterns: {str(include_patterns)}
+    * scraping_exclude_patterns: {str(exclude_patterns)}
+    * ingestion_workers: {str(ingestion_workers)}
     {'*' * 80}                                
     '''
     cat.send_ws_message(content=msg, msg_type="chat")
 
-    cat.send_ws_message(content=f"Start Scraping url: <b>{tool_input}</b>", msg_type="chat")
     domain = urlparse(tool_input).netloc
     output_folder = f"{CAT_OVERFLOW_DIR}/html_pages/{domain}"
-    os.makedirs(output_folder, exist_ok=True)
-    found_pages = MySpider.runme(tool_input, set(), n=max_depth, max_pages=max_pages, save_pages=False, output_folder=output_folder)
-    
-    content = "Scraping ended. These are the results:\n"
-    output = []
-    for page in found_pages:
-        output.append(page)
-    content += "\n".join(output)
-    cat.send_ws_message(content=content, msg_type="chat")
-
-    downloader = PageDownloader(output_folder=output_folder, page_urls=output, use_chrome=use_chrome, use_firefox=use_firefox, use_webkit=use_webkit)
-    #result = asyncio.run(downloader.save_pages())
-    result = downloader.save_pages()
-    log.info(result)
-
-    cat.send_ws_message(content=result, msg_type="chat")
-
-    cat.send_ws_message(content="Page Download ended", msg_type="chat")
-
-    cat.send_ws_message(content="ingesting document pages has <b>started</b>.", msg_type="chat")
-    
-    thread_count = run_ingestion(cat, output_folder, False)
-
-    ingestion_finished_msg = "ingesting document pages has <b>finished</b>."
+    crawl_folder = f"{CAT_OVERFLOW_DIR}/crawls"
+
+    def run(job):
+        job.set_stage('crawl')
+        job.progress(f"Start Scraping url: <b>{tool_input}</b>")
+        os.makedirs(output_folder, exist_ok=True)
+        # crawl, page download and ingestion run at the same time: pages are ingested while the crawl goes on
+        # etag, last-modified and content hash of every page of the past crawls, unchanged pages are not rendered and ingested again
+        cache_path = f"{output_folder}.crawl.json" if use_cache else None
+        crawl = MySpider.stream(tool_input, n=max_depth, max_pages=max_pages, save_pages=static_first, output_folder=crawl_folder, cache_path=cache_path,
+                                use_sitemap=use_sitemap, timeout=crawl_timeout, include_patterns=include_patterns, exclude_patterns=exclude_patterns,
+                                concurrent_requests=concurrent_requests, autothrottle_target=autothrottle_target)
+        downloader = PageDownloader(output_folder=output_folder, page_urls=[], use_chrome=use_chrome, use_firefox=use_firefox, use_webkit=use_webkit,
+                                    concurrency=scraping_concurrency, page_timeout=scraping_page_timeout,
+                                    extractor=ContentExtractor() if extract_content else None)
+
+        dedup = deduplicator_setting(settings, domain)
+
+        def ingest_page(file_path):
+            root, file = os.path.split(file_path)
+            ingest_archive(cat, root, '', file, dedup=dedup)
+
+        job.progress("crawling, downloading and ingesting document pages has <b>started</b>.")
+
+        with IngestionPool(ingestion_workers, root_folder=output_folder, cancel_event=job.cancel_event, metrics=metrics) as pool:
+            pipeline = DocPipeline(crawl, downloader, pool, ingest_page, progress=job.progress, cancel_event=job.cancel_event, metrics=metrics)
+            pipeline_stats = pipeline.run()
+        if dedup is not None:
+            dedup.save()
+        if metrics is not None:
+            metrics.add_counters('pipeline', pipeline_stats)
+            metrics.add_counters('ingestion', pool.stats)
+            if downloader.extractor is not None:
+                metrics.add_counters('extractor', downloader.extractor.stats)
+            if dedup is not None:
+                metrics.add_counters('dedup', dedup.stats)
+        job.check_cancelled()
+
+        content = "Scraping ended. These are the results:\n"
+        content += "\n".join(pipeline.pages)
+        job.progress(content)
+
+        result = (f"{pipeline_stats['static']} static pages were saved, {pipeline_stats['rendered']} pages were rendered, "
+                  f"{pipeline_stats['failed']} failed, {pipeline_stats['unchanged']} were unchanged since the last crawl. First page saved after {pipeline_stats['first_page_saved_after']}s, "
+                  f"crawl took {pipeline_stats['crawl_elapsed']}s. {pipeline.throughput()}")
+        if downloader.extractor is not None:
+            result += f"\n{downloader.extractor.summary()}"
+        log.info(result)
+        job.progress(result)
+
+        ingestion_stats = pool.stats
+
+        job.progress("ingesting document pages has <b>finished</b>.")
+
+        if dedup is not None:
+            return f"{ingestion_summary(ingestion_stats)}, {dedup.summary()}, Miao!"
+        return f"{ingestion_summary(ingestion_stats)}, Miao!"
+
+    key = f"documentation:{canonicalize_url(tool_input)}"
+    metrics = metrics_setting(settings, 'getcodedoc', tool_input)
+    job, merged = get_job_manager(job_workers_setting(settings)).submit('getcodedoc', key, f"@getcodedoc {tool_input}", cat, run, metrics=metrics)
+    return job_started_message(job, merged)
+
+def job_workers_setting(settings):
+    '''
+    Number of background jobs running at the same time'''
+    try:
+        return max(1, int(2 if 'job_workers' not in settings else settings['job_workers']))
+    except (TypeError, ValueError):
+        return 2
 
-    cat.send_ws_message(content=ingestion_finished_msg, msg_type="chat")
+def metrics_setting(settings, kind, target):
+    '''
+    Metrics of a run, None when neither the run reports nor the Prometheus file are enabled'''
+    reports = True if 'metrics_reports' not in settings else settings['metrics_reports'] is True
+    prometheus_file = "" if 'metrics_prometheus_file' not in settings else (settings['metrics_prometheus_file'] or "").strip()
+    if not reports and prometheus_file == "":
+        return None
+    return RunMetrics(kind, target, report_folder=RUNS_DIR if reports else None, prometheus_file=prometheus_file or None, scheduler=get_scheduler())
+
+def job_started_message(job, merged):
+    '''
+    Answer of a tool that started (or joined) a background job'''
+    if merged:
+        return (f"{job.description} is already running as job {job.id} ({job.stage}), you will receive its progress here. "
+                f"Use <b>@catoverflow status {job.id}</b> or <b>@catoverflow cancel {job.id}</b>.")
+    return (f"{job.description} started as job {job.id}, progress will be sent here. "
+            f"Use <b>@catoverflow status {job.id}</b> or <b>@catoverflow cancel {job.id}</b>.")
 
-    return f"All files have been ingested using {thread_count} threads, Miao!"
+@tool(examples=[
+    "@catoverflow status",
+    "@catoverflow status 3",
+    "@catoverflow cancel 3"], return_direct=True)
+def catoverflow_jobs(tool_input, cat):
+    '''
+    Show or cancel the background jobs started by @getcode and @getcodedoc.
+    Input must be prepended with @catoverflow followed by status (optionally with a job id) or cancel with a job id
+    '''
+    words = tool_input.replace('@catoverflow', '').split()
+    command = words[0].lower() if len(words) > 0 else 'status'
+    job_id = words[1] if len(words) > 1 else None
+    manager = get_job_manager()
+    if job_id is not None and not job_id.isdigit():
+        return f"Sorry, {job_id} is not a job id"
+
+    if command == 'status':
+        if job_id is None:
+            jobs = manager.list_jobs()
+            if len(jobs) == 0:
+                return "There are no cat overflow jobs"
+            return "\n".join(job.summary() for job in jobs)
+        job = manager.get(int(job_id))
+        return job.summary() if job is not None else f"Sorry, there is no job {job_id}"
+
+    if command == 'cancel':
+        if job_id is None:
+            return "Please tell me the id of the job to cancel, e.g. @catoverflow cancel 3"
+        if manager.cancel(int(job_id)):
+            return f"job {job_id} will stop at the end of its current step"
+        return f"Sorry, job {job_id} is not running"
+
+    return "Sorry, I only know the status and cancel commands"
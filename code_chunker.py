@@ -0,0 +1,361 @@
+"""This class splits source files into one chunk per top level symbol or class method"""
+import os
+import re
+import ast
+import threading
+from langchain_core.documents import Document
+from cat.log import log
+
+DEFAULT_MAX_CHUNK_CHARS = 4000
+
+# extension -> language, python is parsed with ast and the others with the brace tokenizer below
+LANGUAGES = {
+    'py': 'python', 'pyi': 'python',
+    'js': 'javascript', 'mjs': 'javascript', 'cjs': 'javascript', 'jsx': 'javascript',
+    'ts': 'typescript', 'mts': 'typescript', 'cts': 'typescript', 'tsx': 'typescript',
+    'java': 'java', 'kt': 'kotlin', 'kts': 'kotlin', 'scala': 'scala', 'swift': 'swift',
+    'go': 'go', 'rs': 'rust', 'cs': 'csharp', 'php': 'php', 'dart': 'dart',
+    'c': 'c', 'h': 'c', 'cc': 'cpp', 'cpp': 'cpp', 'cxx': 'cpp', 'hh': 'cpp', 'hpp': 'cpp', 'hxx': 'cpp',
+}
+# languages with a string delimiter that may span several lines
+MULTILINE_QUOTES = {'javascript': '`', 'typescript': '`', 'go': '`'}
+
+CONTAINER_PATTERN = re.compile(r'\b(class|interface|struct|enum|trait|object|namespace|module|record|union|protocol|extension)\s+([A-Za-z_$][\w$.]*)')
+TYPE_PATTERN = re.compile(r'\btype\s+([A-Za-z_]\w*)(?:\[[^\]]*\])?\s+(?:struct|interface)\b')
+IMPL_PATTERN = re.compile(r'\bimpl\b(?:\s*<[^>]*>)?\s+([\w:]+)(?:<[^>{]*>)?(?:\s+for\s+([\w:]+))?')
+TYPE_ALIAS_PATTERN = re.compile(r'\btype\s+([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*=')
+# go methods are named after their receiver type: func (s *Server) Start() -> Server.Start
+RECEIVER_PATTERN = re.compile(r'\bfunc\s*\(\s*(?:[A-Za-z_]\w*\s+)?\*?\s*([A-Za-z_]\w*)(?:\[[^\]]*\])?\s*\)\s*([A-Za-z_]\w*)')
+FUNCTION_PATTERN = re.compile(r'\b(?:function|def|fn|func|fun)\b\s*\*?\s*([A-Za-z_$][\w$]*)')
+VARIABLE_PATTERN = re.compile(r'\b(?:const|let|var|val)\s+([A-Za-z_$][\w$]*)\s*[:=]')
+ARROW_PATTERN = re.compile(r'=>|\bfunction\b')
+MODIFIER_PATTERN = re.compile(r'\b(?:export|default)\b')
+CALL_PATTERN = re.compile(r'([A-Za-z_$][\w$]*)\s*(?:<[^<>()]*>\s*)?\(')
+KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'sizeof', 'typeof', 'new', 'await', 'with', 'match', 'foreach', 'using', 'lock'}
+
+class CodeChunker:
+    """
+    Language aware chunking of the files of a repository: one langchain document per top level symbol or class method,
+    with repository, branch, path, symbol and line range in its metadata.
+    Files in other languages, or that cannot be parsed, are left to the splitter of the rabbit hole"""
+
+    def __init__(self, repository, branch, max_chunk_chars = DEFAULT_MAX_CHUNK_CHARS):
+        self.repository = repository
+        self.branch = branch
+        # symbols longer than this are split at line boundaries
+        self.max_chunk_chars = max(500, int(max_chunk_chars))
+        self.lock = threading.Lock()
+        self.stats = {'files': 0, 'symbols': 0, 'chunks': 0, 'fallbacks': 0}
+
+    def count(self, key, amount = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def summary(self):
+        return (f"code chunking: {self.stats['chunks']} chunks from {self.stats['symbols']} symbols of {self.stats['files']} files "
+                f"({self.stats['fallbacks']} files left to the rabbit hole splitter)")
+
+    @staticmethod
+    def language(file_name):
+        return LANGUAGES.get(os.path.splitext(file_name)[1].lower().lstrip('.'))
+
+    def file_to_docs(self, file_path, path):
+        """
+        documents of a source file, path is its path inside the repository.
+        Returns None when the file has to go through the splitter of the rabbit hole"""
+        language = self.language(file_path)
+        if language is None:
+            return None
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (UnicodeDecodeError, OSError) as e:
+            log.info(f"code chunking: unable to read {path}: {e}")
+            self.count('fallbacks')
+            return None
+        symbols = self.chunk(text, language)
+        if symbols is None:
+            log.info(f"code chunking: unable to parse {path}, using the rabbit hole splitter")
+            self.count('fallbacks')
+            return None
+        docs = []
+        for symbol in symbols:
+            for start_line, end_line, part in self._split(symbol):
+                metadata = {
+                    'repository': self.repository,
+                    'branch': self.branch,
+                    'path': path,
+                    'language': language,
+                    'symbol': symbol['symbol'],
+                    'kind': symbol['kind'],
+                    'start_line': start_line,
+                    'end_line': end_line,
+                }
+                # the location is repeated in the text: the metadata is not embedded nor shown to the LLM
+                header = f"{path}: {symbol['symbol']} (lines {start_line}-{end_line})"
+                docs.append(Document(page_content=f"{header}\n\n{part}", metadata=metadata))
+        self.count('files')
+        self.count('symbols', len(symbols))
+        self.count('chunks', len(docs))
+        return docs
+
+    def chunk(self, text, language):
+        """
+        list of {'symbol', 'kind', 'start_line', 'end_line', 'text'} in file order (lines are 1-based),
+        None when the text cannot be parsed"""
+        lines = text.splitlines()
+        if language == 'python':
+            symbols = self._python_symbols(text, lines)
+        else:
+            symbols = self._brace_symbols(lines, language)
+        if symbols is None:
+            return None
+        return [{key: value for key, value in symbol.items() if key != 'line_numbers'} for symbol in symbols if symbol['text'].strip() != '']
+
+    def _split(self, symbol):
+        """(start_line, end_line, text) pieces of a symbol, at most max_chunk_chars long"""
+        if len(symbol['text']) <= self.max_chunk_chars:
+            return [(symbol['start_line'], symbol['end_line'], symbol['text'])]
+        pieces = []
+        piece = []
+        size = 0
+        start_line = symbol['start_line']
+        line_number = start_line
+        for line in symbol['text'].split('\n'):
+            if piece and size + len(line) + 1 > self.max_chunk_chars:
+                pieces.append((start_line, line_number - 1, '\n'.join(piece)))
+                piece, size, start_line = [], 0, line_number
+            piece.append(line[:self.max_chunk_chars])
+            size += len(piece[-1]) + 1
+            line_number += 1
+        if piece:
+            pieces.append((start_line, line_number - 1, '\n'.join(piece)))
+        return pieces
+
+    # python
+
+    def _python_symbols(self, text, lines):
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            return None
+        return self._python_body(tree.body, lines, 1, len(lines), '')
+
+    def _python_body(self, body, lines, first_line, last_line, prefix):
+        """symbols of the statements of a module (or of a class when prefix is the class name)"""
+        symbols = []
+        loose = []
+        # comments and blank lines above a definition belong to it
+        cursor = first_line
+        for node in body:
+            end = node.end_lineno
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                symbols += self._flush(loose, lines, prefix)
+                kind = 'method' if prefix else 'function'
+                symbols.append(_symbol(lines, cursor, end, prefix + node.name, kind))
+            elif isinstance(node, ast.ClassDef) and not prefix:
+                symbols += self._flush(loose, lines, prefix)
+                symbols += self._python_class(node, lines, cursor, end)
+            else:
+                loose += range(cursor, end + 1)
+            cursor = end + 1
+        loose += range(cursor, last_line + 1)
+        return symbols + self._flush(loose, lines, prefix)
+
+    def _python_class(self, node, lines, start, end):
+        methods = [child for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        if not methods:
+            return [_symbol(lines, start, end, node.name, 'class')]
+        body_start = _first_line(node.body[0])
+        header = list(range(start, body_start))
+        members = self._python_body(node.body, lines, body_start, end, node.name + '.')
+        # the class statement, its docstring and attributes, without the methods
+        declaration = [symbol for symbol in members if symbol['kind'] == 'code']
+        line_numbers = header + [number for symbol in declaration for number in symbol['line_numbers']]
+        return [_symbol_of_lines(lines, line_numbers, node.name, 'class')] + [symbol for symbol in members if symbol['kind'] != 'code']
+
+    def _flush(self, loose, lines, prefix):
+        """the statements between two definitions as one chunk (imports, constants, module level code)"""
+        if not loose:
+            return []
+        symbol = _symbol_of_lines(lines, loose, prefix.rstrip('.') or '<module>', 'code')
+        loose.clear()
+        return [symbol] if symbol['text'].strip() != '' else []
+
+    # brace languages
+
+    def _brace_symbols(self, lines, language):
+        depths = _brace_depths(lines, language)
+        if depths is None:
+            return None
+        return self._brace_body(lines, depths, 0, len(lines), 0, '')
+
+    def _brace_body(self, lines, depths, first, last, depth, prefix):
+        """symbols of the lines first..last (0-based, last excluded) at a nesting depth"""
+        symbols = []
+        loose = []
+        index = first
+        while index < last:
+            if depths[index] <= depth and not _one_line_declaration(lines[index]):
+                loose.append(index + 1)
+                index += 1
+                continue
+            end = index
+            while end < last - 1 and depths[end] > depth:
+                end += 1
+            # the signature and the comments right above the opening brace belong to the block
+            attached = []
+            while loose and lines[loose[-1] - 1].strip() != '' and not lines[loose[-1] - 1].rstrip().endswith((';', '}')):
+                attached.insert(0, loose.pop())
+            symbols += self._flush(loose, lines, prefix)
+            symbols += self._brace_block(lines, depths, attached, index, end, depth, prefix)
+            index = end + 1
+        return symbols + self._flush(loose, lines, prefix)
+
+    def _brace_block(self, lines, depths, attached, first, last, depth, prefix):
+        start_line = attached[0] if attached else first + 1
+        header = ' '.join(_code_line(lines[number - 1]) for number in attached)
+        header += ' ' + lines[first].split('{', 1)[0]
+        name, kind = _brace_name(header)
+        if kind != 'class' or prefix or last - first < 2:
+            return [_symbol(lines, start_line, last + 1, prefix + name, 'method' if prefix and kind == 'function' else kind)]
+        members = self._brace_body(lines, depths, first + 1, last, depth + 1, name + '.')
+        if not any(symbol['kind'] != 'code' for symbol in members):
+            return [_symbol(lines, start_line, last + 1, name, kind)]
+        declaration = list(range(start_line, first + 2)) + [number for symbol in members if symbol['kind'] == 'code'
+                                                               for number in symbol['line_numbers']] + [last + 1]
+        return [_symbol_of_lines(lines, declaration, name, kind)] + [symbol for symbol in members if symbol['kind'] != 'code']
+
+def _first_line(node):
+    """first line of a statement, decorators included"""
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])])
+
+def _symbol(lines, start_line, end_line, name, kind):
+    return _symbol_of_lines(lines, range(start_line, end_line + 1), name, kind)
+
+def _symbol_of_lines(lines, line_numbers, name, kind):
+    """symbol made of some lines of the file (1-based numbers), blank lines at the edges are dropped"""
+    line_numbers = sorted(set(line_numbers))
+    while line_numbers and lines[line_numbers[0] - 1].strip() == '':
+        line_numbers.pop(0)
+    while line_numbers and lines[line_numbers[-1] - 1].strip() == '':
+        line_numbers.pop()
+    return {
+        'symbol': name,
+        'kind': kind,
+        'start_line': line_numbers[0] if line_numbers else 0,
+        'end_line': line_numbers[-1] if line_numbers else 0,
+        'text': '\n'.join(lines[number - 1] for number in line_numbers),
+        'line_numbers': line_numbers,
+    }
+
+def _code_line(line):
+    """a signature line without comments and annotations, empty for the others"""
+    stripped = line.strip()
+    if stripped.startswith(('//', '/*', '*', '#', '@')):
+        return ''
+    return stripped
+
+def _brace_name(header, calls = True):
+    """(name, kind) of a block from the text before its opening brace, calls=False ignores the names followed by a parenthesis"""
+    header = re.sub(r'"[^"]*"|\'(?:\\.|[^\'\\])\'', '""', header)
+    header = MODIFIER_PATTERN.sub(' ', header)
+    match = IMPL_PATTERN.search(header)
+    if match is not None:
+        return (match.group(2) or match.group(1)), 'class'
+    match = TYPE_PATTERN.search(header)
+    if match is not None:
+        return match.group(1), 'class'
+    match = CONTAINER_PATTERN.search(header)
+    if match is not None:
+        return match.group(2), 'class'
+    match = VARIABLE_PATTERN.search(header)
+    if match is not None:
+        return match.group(1), 'function' if ARROW_PATTERN.search(header) else 'code'
+    match = RECEIVER_PATTERN.search(header)
+    if match is not None:
+        return f"{match.group(1)}.{match.group(2)}", 'method'
+    match = FUNCTION_PATTERN.search(header)
+    if match is not None:
+        return match.group(1), 'function'
+    match = TYPE_ALIAS_PATTERN.search(header)
+    if match is not None:
+        return match.group(1), 'type'
+    if calls:
+        for match in reversed(list(CALL_PATTERN.finditer(header))):
+            if match.group(1) not in KEYWORDS:
+                return match.group(1), 'function'
+    return '<block>', 'code'
+
+def _one_line_declaration(line):
+    """
+    True for a function, class or type declared on a single line (const add = (a, b) => a + b;),
+    False for the other statements (imports, constants, calls)"""
+    code = _code_line(line)
+    if code == '':
+        return False
+    header = code.split('{', 1)[0]
+    # a name followed by a parenthesis is a declaration only when a body follows its parameters: int size() { ... }
+    calls = '{' in code and re.search(r'\)[^(){};=]*$', header) is not None
+    return _brace_name(header, calls=calls)[1] != 'code'
+
+def _brace_depths(lines, language):
+    """
+    brace depth at the end of every line, ignoring the braces in strings and comments.
+    None when the braces are unbalanced (the chunks would be meaningless)"""
+    depths = []
+    depth = 0
+    in_comment = False
+    # delimiter of a string spanning several lines (template literals, go raw strings)
+    in_string = None
+    multiline_quote = MULTILINE_QUOTES.get(language)
+    for line in lines:
+        index = 0
+        length = len(line)
+        while index < length:
+            char = line[index]
+            if in_comment:
+                if line.startswith('*/', index):
+                    in_comment = False
+                    index += 1
+            elif in_string is not None:
+                if char == '\\':
+                    index += 1
+                elif char == in_string:
+                    in_string = None
+            elif line.startswith('//', index) or (language == 'php' and char == '#'):
+                break
+            elif line.startswith('/*', index):
+                in_comment = True
+                index += 1
+            elif char == multiline_quote:
+                in_string = char
+            elif char == '"' or (char == "'" and language != 'rust'):
+                index = _string_end(line, index, char)
+            elif char == "'":
+                # rust: a char literal ('a', '\n') or a lifetime ('a)
+                match = re.match(r"'(\\.[^']*|[^'\\])'", line[index:])
+                if match is not None:
+                    index += len(match.group(0)) - 1
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth < 0:
+                    return None
+            index += 1
+        depths.append(depth)
+    if depth != 0:
+        return None
+    return depths
+
+def _string_end(line, index, quote):
+    """index of the closing quote of a string opened at index (the end of the line for unterminated strings)"""
+    index += 1
+    while index < len(line):
+        if line[index] == '\\':
+            index += 1
+        elif line[index] == quote:
+            return index
+        index += 1
+    return len(line)
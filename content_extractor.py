@@ -0,0 +1,268 @@
+"""This class extracts the main content of a documentation page and converts it to Markdown"""
+import re
+import hashlib
+import threading
+from urllib.parse import urljoin
+import lxml.html
+from cat.log import log
+
+# elements that never contain documentation text
+DROP_TAGS = ('script', 'style', 'noscript', 'template', 'iframe', 'svg', 'canvas', 'form', 'button', 'input', 'select', 'textarea', 'link', 'meta')
+# layout elements that repeat on every page of a site
+LAYOUT_TAGS = ('nav', 'header', 'footer', 'aside')
+LAYOUT_ROLES = ('navigation', 'banner', 'contentinfo', 'complementary', 'search')
+LAYOUT_TOKENS = ('nav', 'navbar', 'menu', 'sidebar', 'footer', 'header', 'breadcrumb', 'breadcrumbs', 'cookie', 'cookies', 'consent',
+                 'banner', 'toc', 'pagination', 'skip', 'social', 'share', 'advert', 'ads', 'announcement')
+TOKEN_SPLIT = re.compile(r'[\s_\-]+')
+# class and id tokens only mark small or link heavy blocks as layout, wrappers like wy-grid-for-nav hold the whole page
+LAYOUT_MAX_TEXT = 300
+LAYOUT_MIN_LINK_DENSITY = 0.5
+# an extraction with less text than this (when the page has more) saves the whole page instead
+MIN_CONTENT_CHARS = 200
+
+BLOCK_TAGS = ('p', 'pre', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'table', 'dl')
+CANDIDATE_TAGS = ('article', 'main', 'section', 'div')
+
+class BoilerplateTracker:
+    """Count on how many pages of a crawl every text block appears, blocks repeated on many pages are boilerplate"""
+
+    def __init__(self, min_pages = 3):
+        self.min_pages = min_pages
+        self.lock = threading.Lock()
+        self.pages_per_block = {}
+
+    @staticmethod
+    def fingerprint(text):
+        normalized = ' '.join(text.lower().split())
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def observe(self, fingerprints):
+        """record the blocks of a page, return the set of blocks that are boilerplate so far"""
+        with self.lock:
+            for fingerprint in set(fingerprints):
+                self.pages_per_block[fingerprint] = self.pages_per_block.get(fingerprint, 0) + 1
+            return {fingerprint for fingerprint in fingerprints if self.pages_per_block[fingerprint] >= self.min_pages}
+
+class ContentExtractor:
+    """Readability-style main content extraction plus HTML to Markdown conversion"""
+
+    def __init__(self, boilerplate_min_pages = 3):
+        self.tracker = BoilerplateTracker(boilerplate_min_pages)
+        self.lock = threading.Lock()
+        self.stats = {'pages': 0, 'html_bytes': 0, 'markdown_bytes': 0, 'boilerplate_blocks': 0, 'fallbacks': 0}
+
+    @staticmethod
+    def _is_layout(element):
+        if element.tag in LAYOUT_TAGS:
+            return True
+        if (element.get('role') or '').lower() in LAYOUT_ROLES:
+            return True
+        tokens = set(TOKEN_SPLIT.split(f"{element.get('class') or ''} {element.get('id') or ''}".lower()))
+        if not any(token in tokens for token in LAYOUT_TOKENS):
+            return False
+        return ContentExtractor._is_leaf_block(element)
+
+    @staticmethod
+    def _is_leaf_block(element):
+        """a block with little text, mostly links or no nested containers"""
+        text_length = len(element.text_content().strip())
+        if text_length < LAYOUT_MAX_TEXT:
+            return True
+        link_length = sum(len(link.text_content()) for link in element.iter('a'))
+        if link_length / text_length >= LAYOUT_MIN_LINK_DENSITY:
+            return True
+        return next(element.iterdescendants(*CANDIDATE_TAGS), None) is None
+
+    @staticmethod
+    def _remove(element):
+        parent = element.getparent()
+        if parent is None:
+            return
+        # keep the text that follows the removed element
+        if element.tail:
+            previous = element.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or '') + element.tail
+            else:
+                parent.text = (parent.text or '') + element.tail
+        parent.remove(element)
+
+    def _drop(self, root):
+        """remove scripts, styles, forms, comments and processing instructions"""
+        for element in list(root.iter(*DROP_TAGS)):
+            self._remove(element)
+        for element in list(root.iter()):
+            if not isinstance(element.tag, str):
+                self._remove(element)
+
+    def _clean(self, content):
+        """remove the layout blocks inside the main content, the content itself and its ancestors are kept"""
+        for element in list(content.iterdescendants()):
+            # a parent removed earlier takes its children along
+            if element.getparent() is None or not any(ancestor is content for ancestor in element.iterancestors()):
+                continue
+            if element.tag not in ('main', 'article') and self._is_layout(element):
+                if element.tag in ('header', 'footer') and any(ancestor.tag in ('article', 'main') for ancestor in element.iterancestors()):
+                    # the header of an article holds its title
+                    continue
+                self._remove(element)
+
+    @staticmethod
+    def _score(element):
+        text = element.text_content()
+        text_length = len(text.strip())
+        if text_length == 0:
+            return 0
+        link_length = sum(len(link.text_content()) for link in element.iter('a'))
+        link_density = link_length / text_length
+        paragraphs = len(element.findall('.//p')) + len(element.findall('.//pre'))
+        return (text_length + paragraphs * 100) * (1 - link_density)
+
+    def _main_content(self, root):
+        for xpath in ('//main', '//article', '//*[@role="main"]'):
+            candidates = root.xpath(xpath)
+            if candidates:
+                return max(candidates, key=self._score)
+        body = root.find('body')
+        body = body if body is not None else root
+        best, best_score = body, self._score(body) * 0.5
+        for element in body.iter(*CANDIDATE_TAGS):
+            score = self._score(element)
+            if score > best_score:
+                best, best_score = element, score
+        return best
+
+    def _remove_boilerplate(self, content):
+        blocks = [element for element in content.iter(*BLOCK_TAGS) if element.text_content().strip() != '']
+        fingerprints = [self.tracker.fingerprint(element.text_content()) for element in blocks]
+        boilerplate = self.tracker.observe(fingerprints)
+        removed = 0
+        for element, fingerprint in zip(blocks, fingerprints):
+            # headings are kept, a repeated title is still useful to locate the content
+            if fingerprint in boilerplate and element.tag not in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6') and element.getparent() is not None:
+                self._remove(element)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _inline(element, base_url):
+        parts = [element.text or '']
+        for child in element:
+            if child.tag == 'a':
+                text = ContentExtractor._inline(child, base_url).strip()
+                href = child.get('href')
+                if href and text and not href.startswith('#') and not href.startswith('javascript:'):
+                    parts.append(f"[{text}]({urljoin(base_url, href)})")
+                else:
+                    parts.append(text)
+            elif child.tag == 'code':
+                parts.append(f"`{child.text_content()}`")
+            elif child.tag in ('strong', 'b'):
+                parts.append(f"**{ContentExtractor._inline(child, base_url).strip()}**")
+            elif child.tag in ('em', 'i'):
+                parts.append(f"*{ContentExtractor._inline(child, base_url).strip()}*")
+            elif child.tag == 'br':
+                parts.append('\n')
+            elif child.tag == 'img':
+                parts.append(child.get('alt') or '')
+            else:
+                parts.append(ContentExtractor._inline(child, base_url))
+            parts.append(child.tail or '')
+        return re.sub(r'[ \t\r\f\v]+', ' ', ''.join(parts))
+
+    def _markdown(self, element, base_url, lines, list_depth = 0):
+        tag = element.tag
+        if tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            text = ' '.join(element.text_content().split())
+            if text:
+                lines.append(f"{'#' * int(tag[1])} {text}")
+        elif tag == 'pre':
+            code = element.text_content().strip('\n')
+            classes = (element.get('class') or '') + ' ' + ' '.join(code_element.get('class') or '' for code_element in element.iter('code'))
+            language = re.search(r'language-([\w+#-]+)', classes)
+            lines.append(f"```{language.group(1) if language else ''}\n{code}\n```")
+        elif tag in ('ul', 'ol'):
+            for index, item in enumerate(element.findall('li'), start=1):
+                marker = f"{index}." if tag == 'ol' else '-'
+                nested = [child for child in item if child.tag in ('ul', 'ol')]
+                for child in nested:
+                    item.remove(child)
+                text = ' '.join(self._inline(item, base_url).split())
+                if text:
+                    lines.append(f"{'  ' * list_depth}{marker} {text}")
+                for child in nested:
+                    self._markdown(child, base_url, lines, list_depth + 1)
+        elif tag == 'table':
+            rows = []
+            for row in element.iter('tr'):
+                cells = [' '.join(self._inline(cell, base_url).split()).replace('|', '\\|') for cell in row if cell.tag in ('td', 'th')]
+                if cells:
+                    rows.append(cells)
+            if rows:
+                columns = max(len(cells) for cells in rows)
+                table = [f"| {' | '.join(cells)} |" for cells in rows]
+                table.insert(1, '|' + ' --- |' * columns)
+                lines.append('\n'.join(table))
+        elif tag == 'blockquote':
+            text = ' '.join(self._inline(element, base_url).split())
+            if text:
+                lines.append(f"> {text}")
+        elif tag in ('p', 'dt', 'dd', 'figcaption', 'summary'):
+            text = self._inline(element, base_url).strip()
+            if text:
+                lines.append(text)
+        else:
+            # generic container: inline text is a paragraph, block children are converted recursively
+            if element.text and element.text.strip():
+                lines.append(' '.join(element.text.split()))
+            for child in element:
+                if isinstance(child.tag, str):
+                    self._markdown(child, base_url, lines, list_depth)
+                if child.tail and child.tail.strip():
+                    lines.append(' '.join(child.tail.split()))
+
+    def extract(self, html, page_url):
+        """return the page as Markdown with title and canonical url metadata, None when no main content could be extracted"""
+        root = lxml.html.document_fromstring(html.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+        title_element = root.find('.//title')
+        title = ' '.join(title_element.text_content().split()) if title_element is not None else ''
+        canonical = root.xpath('//link[@rel="canonical"]/@href')
+        canonical_url = urljoin(page_url, canonical[0]) if canonical else page_url
+
+        self._drop(root)
+        page_text_length = len(root.text_content().strip())
+        content = self._main_content(root)
+        self._clean(content)
+        removed = self._remove_boilerplate(content)
+        lines = []
+        self._markdown(content, page_url, lines)
+        content_length = sum(len(line) for line in lines)
+        if content_length < MIN_CONTENT_CHARS and page_text_length > content_length * 2:
+            log.info(f"only {content_length} characters extracted out of {page_text_length}, saving the whole page: {page_url}")
+            with self.lock:
+                self.stats['fallbacks'] += 1
+            return None
+        if not title:
+            headings = content.xpath('.//h1')
+            title = ' '.join(headings[0].text_content().split()) if headings else ''
+
+        front_matter = f"---\ntitle: {title}\nurl: {canonical_url}\nsource: {page_url}\n---\n\n"
+        markdown = front_matter + (f"# {title}\n\n" if title and not (lines and lines[0].startswith('# ')) else '') + '\n\n'.join(lines) + '\n'
+
+        with self.lock:
+            self.stats['pages'] += 1
+            self.stats['html_bytes'] += len(html.encode('utf-8'))
+            self.stats['markdown_bytes'] += len(markdown.encode('utf-8'))
+            self.stats['boilerplate_blocks'] += removed
+        return markdown
+
+    def summary(self):
+        """how much the extraction reduced the content to ingest"""
+        with self.lock:
+            stats = dict(self.stats)
+        if stats['html_bytes'] == 0:
+            return "no page has been converted to markdown"
+        ratio = 100 * (1 - stats['markdown_bytes'] / stats['html_bytes'])
+        log.info(f"content extraction statistics: {stats}")
+        return (f"{stats['pages']} pages converted to markdown: {stats['html_bytes']} html bytes -> {stats['markdown_bytes']} markdown bytes "
+                f"({ratio:.0f}% less, {stats['boilerplate_blocks']} repeated blocks removed, {stats['fallbacks']} pages saved whole)")
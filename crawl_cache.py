@@ -0,0 +1,98 @@
+"""This class remembers the pages fetched by past crawls so that unchanged pages are revalidated instead of downloaded again"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from scrapy.http import HtmlResponse
+from .url_utils import canonicalize_url
+
+class CrawlCache:
+    """Persistent canonical url -> etag, last_modified, sha256, body file, fetched_at index of a crawled site"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {'revalidated': 0, 'not_modified': 0, 'unchanged': 0, 'changed': 0}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, url):
+        with self.lock:
+            return self.entries.get(canonicalize_url(url))
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for a page whose body is still on disk"""
+        entry = self.get(url)
+        if entry is None or not os.path.exists(entry.get('body') or ''):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url, body, body_path, etag = None, last_modified = None):
+        """record a fetched page, return True if its content changed since the last crawl"""
+        url = canonicalize_url(url)
+        content_hash = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            previous = self.entries.get(url) or {}
+            changed = previous.get('sha256') != content_hash
+            self.entries[url] = {
+                'etag': etag or previous.get('etag'),
+                'last_modified': last_modified or previous.get('last_modified'),
+                'sha256': content_hash,
+                'body': body_path,
+                'fetched_at': datetime.now(timezone.utc).isoformat(),
+            }
+            self.stats['changed' if changed else 'unchanged'] += 1
+        return changed
+
+    def save(self):
+        """write the cache atomically"""
+        with self.lock:
+            entries = dict(self.entries)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+class ConditionalFetchMiddleware:
+    """
+    Scrapy downloader middleware: requests of cached pages are sent with their validators,
+    a 304 answer is replaced by the cached body so that its links are still followed"""
+
+    def process_request(self, request, spider):
+        cache = getattr(spider, 'cache', None)
+        if cache is None or request.method != 'GET':
+            return None
+        for name, value in cache.conditional_headers(request.url).items():
+            request.headers.setdefault(name, value)
+        return None
+
+    def process_response(self, request, response, spider):
+        cache = getattr(spider, 'cache', None)
+        if cache is None:
+            return response
+        if request.headers.get('If-None-Match') or request.headers.get('If-Modified-Since'):
+            with cache.lock:
+                cache.stats['revalidated'] += 1
+        if response.status != 304:
+            return response
+        entry = cache.get(request.url)
+        if entry is None or not os.path.exists(entry.get('body') or ''):
+            return response
+        with open(entry['body'], 'rb') as f:
+            body = f.read()
+        with cache.lock:
+            cache.stats['not_modified'] += 1
+        return HtmlResponse(url=response.url, status=200, headers=response.headers, body=body, encoding='utf-8',
+                            request=request, flags=response.flags + ['cached'])
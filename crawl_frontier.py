@@ -0,0 +1,50 @@
+"""This class decides which documentation pages are worth crawling and in which order"""
+import re
+from urllib.parse import urlparse
+from .url_utils import canonicalize_url
+from .file_filter import split_setting
+
+# comma separated regular expressions matched against the url path and query
+DEFAULT_EXCLUDE_URL_PATTERNS = (r"/changelog,/change-log,/release-notes,/releases/,/blog/,/news/,/tags?/,/archives?/,/page/\d+,[?&]page=\d+,"
+                                r"/search,/login,/signin,/signup,/(ja|zh|zh-cn|zh-tw|ko|fr|de|es|pt|pt-br|ru|it|tr|pl|uk|vi)(/|$)")
+# path words of the pages most useful to answer questions about a library
+VALUABLE_WORDS = ('api', 'reference', 'references', 'guide', 'guides', 'docs', 'documentation', 'tutorial', 'tutorials', 'manual',
+                  'howto', 'how-to', 'getting-started', 'quickstart', 'usage', 'examples', 'concepts', 'config', 'configuration', 'cli')
+WORD_SPLIT = re.compile(r'[/_.\-]+')
+
+class CrawlFrontier:
+    """Include/exclude url patterns plus a score used as Scrapy request priority (higher is crawled first)"""
+
+    def __init__(self, start_url, include_patterns = '', exclude_patterns = DEFAULT_EXCLUDE_URL_PATTERNS):
+        self.start_path = urlparse(canonicalize_url(start_url)).path.rstrip('/')
+        self.include = [re.compile(pattern, re.IGNORECASE) for pattern in split_setting(include_patterns)]
+        start_target = self._target(start_url)
+        # an exclude pattern matching the start url (e.g. a /fr/ documentation) would stop the whole crawl
+        self.exclude = [re.compile(pattern, re.IGNORECASE) for pattern in split_setting(exclude_patterns)
+                        if not re.search(pattern, start_target, re.IGNORECASE)]
+
+    @staticmethod
+    def _target(url):
+        parts = urlparse(canonicalize_url(url))
+        return parts.path + (f"?{parts.query}" if parts.query else '')
+
+    def allowed(self, url):
+        """false for the pages excluded by the patterns, or not matching any include pattern when there are some"""
+        target = self._target(url)
+        if any(pattern.search(target) for pattern in self.exclude):
+            return False
+        return len(self.include) == 0 or any(pattern.search(target) for pattern in self.include)
+
+    def score(self, url, sitemap_priority = None):
+        """
+        pages below the start url come first, then the pages that look like api/reference/guide pages,
+        then the sitemap priority, then the shallow pages"""
+        path = urlparse(canonicalize_url(url)).path
+        score = 100 if self.start_path == '' or path == self.start_path or path.startswith(self.start_path + '/') else 0
+        words = set(WORD_SPLIT.split(path.lower()))
+        score += min(30, 10 * len(words.intersection(VALUABLE_WORDS)))
+        try:
+            score += int(float(sitemap_priority) * 10)
+        except (TypeError, ValueError):
+            score += 5
+        return score - path.count('/')
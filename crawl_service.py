@@ -0,0 +1,182 @@
+"""This class runs the documentation crawls in one long-lived worker process with a running Twisted reactor"""
+import sys
+import time
+import queue
+import itertools
+import threading
+from multiprocessing import Process, Queue
+from cat.log import log
+
+# seconds the parent keeps waiting after the crawl timeout, the worker needs some time to close the spider
+STOP_GRACE = 60
+
+class JobEvents:
+    """page queue handed to a spider, every event is tagged with the id of its crawl job"""
+
+    def __init__(self, events, job_id):
+        self.events = events
+        self.job_id = job_id
+
+    def put(self, event):
+        self.events.put((self.job_id,) + tuple(event))
+
+def serve(jobs, events):
+    """worker process: run the reactor forever, start and stop crawls as commands arrive on the jobs queue"""
+    if 'twisted.internet.reactor' not in sys.modules:
+        from scrapy.utils.reactor import install_reactor
+        install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+    from twisted.internet import reactor
+    from twisted.python.failure import Failure
+    from scrapy.crawler import CrawlerRunner
+    from .my_spider import MySpider
+
+    runner = CrawlerRunner()
+    crawlers = {}
+
+    def start(job):
+        job_id = job['id']
+        try:
+            crawler = runner.create_crawler(MySpider.with_settings(**job['settings']))
+            deferred = runner.crawl(crawler, job['url'], set(), page_queue=JobEvents(events, job_id), **job['spider_args'])
+        except Exception as e:
+            events.put((job_id, 'error', repr(e)))
+            return
+        crawlers[job_id] = crawler
+        timer = reactor.callLater(job['timeout'], stop, job_id, 'timeout')
+
+        def finished(result):
+            if timer.active():
+                timer.cancel()
+            crawlers.pop(job_id, None)
+            if isinstance(result, Failure):
+                events.put((job_id, 'error', result.getErrorMessage()))
+            else:
+                events.put((job_id, 'done'))
+
+        deferred.addBoth(finished)
+
+    def stop(job_id, reason):
+        crawler = crawlers.get(job_id)
+        if crawler is not None and crawler.crawling:
+            events.put((job_id, 'stopping', reason))
+            crawler.stop()
+
+    def read_jobs():
+        while True:
+            command = jobs.get()
+            if command is None:
+                reactor.callFromThread(reactor.stop)
+                return
+            kind, payload = command
+            if kind == 'crawl':
+                reactor.callFromThread(start, payload)
+            elif kind == 'cancel':
+                reactor.callFromThread(stop, payload, 'cancelled')
+
+    threading.Thread(target=read_jobs, name='catoverflow-crawl-jobs', daemon=True).start()
+    reactor.run(installSignalHandlers=False)
+
+class CrawlService:
+    """
+    Parent side of the crawl worker: the process is started once and reused by every crawl,
+    several crawls run at the same time in its reactor and their pages are streamed back while they are found"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.jobs = None
+        self.events = None
+        self.listeners = {}
+        self.ids = itertools.count(1)
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                return
+            self.jobs = Queue()
+            self.events = Queue()
+            self.process = Process(target=serve, args=(self.jobs, self.events), name='catoverflow-crawler', daemon=True)
+            self.process.start()
+            log.info(f"crawl worker started, pid {self.process.pid}")
+            threading.Thread(target=self._dispatch, args=(self.process, self.events), name='catoverflow-crawl-events', daemon=True).start()
+
+    def _dispatch(self, process, events):
+        """route the events of the worker to the crawls waiting for them"""
+        while True:
+            try:
+                event = events.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    # a crashed worker must not leave the crawls waiting forever, the next crawl starts a new one
+                    for listener in list(self.listeners.values()):
+                        listener.put(('error', f"crawl worker exited with code {process.exitcode}"))
+                    return
+                continue
+            listener = self.listeners.get(event[0])
+            if listener is not None:
+                listener.put(event[1:])
+
+    def cancel(self, job_id):
+        """stop a running crawl, the pages already found are kept"""
+        if self.jobs is not None:
+            self.jobs.put(('cancel', job_id))
+
+    def crawl(self, url, timeout=600, concurrent_requests=8, autothrottle_target=2.0, **spider_args):
+        """
+        run a crawl in the worker, yielding (url, body_path, changed) tuples while pages are found.
+        spider_args are the keyword arguments of MySpider (n, max_pages, save_pages, output_folder, ...)"""
+        self._ensure_started()
+        job_id = next(self.ids)
+        listener = queue.Queue()
+        self.listeners[job_id] = listener
+        self.jobs.put(('crawl', {
+            'id': job_id,
+            'url': url,
+            'timeout': timeout,
+            'settings': {'n': spider_args.get('n', 3), 'max_pages': spider_args.get('max_pages', 10),
+                         'concurrent_requests': concurrent_requests, 'autothrottle_target': autothrottle_target},
+            'spider_args': spider_args,
+        }))
+        deadline = time.monotonic() + timeout + STOP_GRACE
+        finished = False
+        try:
+            while True:
+                try:
+                    event = listener.get(timeout=max(0.1, deadline - time.monotonic()))
+                except queue.Empty:
+                    log.error(f"crawl {job_id} of {url} did not stop after {timeout}s, giving up")
+                    return
+                kind = event[0]
+                if kind == 'page':
+                    yield event[1], event[2], event[3]
+                elif kind == 'stopping':
+                    log.info(f"crawl {job_id} of {url} is stopping: {event[1]}")
+                elif kind == 'error':
+                    finished = True
+                    raise Exception(f"crawl of {url} failed: {event[1]}")
+                else:
+                    finished = True
+                    return
+        finally:
+            self.listeners.pop(job_id, None)
+            if not finished:
+                # the consumer stopped early or the crawl timed out
+                self.cancel(job_id)
+
+    def shutdown(self):
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                self.jobs.put(None)
+                self.process.join(timeout=10)
+            self.process = None
+
+_CRAWL_SERVICE = None
+_CRAWL_SERVICE_LOCK = threading.Lock()
+
+def get_crawl_service():
+    """crawl service shared by every documentation crawl of the plugin"""
+    global _CRAWL_SERVICE
+    with _CRAWL_SERVICE_LOCK:
+        if _CRAWL_SERVICE is None:
+            _CRAWL_SERVICE = CrawlService()
+        return _CRAWL_SERVICE
@@ -0,0 +1,147 @@
+"""This class skips content that has already been embedded for a library"""
+import os
+import re
+import json
+import hashlib
+import threading
+from cat.log import log
+
+FRONT_MATTER_PATTERN = re.compile(r'\A---\n.*?\n---\n', re.DOTALL)
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+SIMHASH_BITS = 64
+# 4 bands of 16 bits: two hashes within 3 bits of each other share at least one band
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+def content_hash(text):
+    """sha256 of a text, ignoring the front matter (its source url changes between duplicates) and the whitespace"""
+    text = FRONT_MATTER_PATTERN.sub('', text)
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+def simhash(text):
+    """64 bit SimHash of the word 3-shingles of a text"""
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) < 3:
+        features = tokens
+    else:
+        features = [' '.join(tokens[i:i + 3]) for i in range(len(tokens) - 2)]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+class Deduplicator:
+    """
+    Persistent fingerprint index of a library: exact hashes of whole files plus SimHash of chunks.
+    Files and chunks already embedded (or near duplicates of them) are not sent to the vector memory again"""
+
+    def __init__(self, index_folder, library, max_distance = 3):
+        self.max_distance = min(int(max_distance), SIMHASH_BANDS - 1)
+        safe_name = re.sub(r'[^\w.-]+', '_', library)
+        self.path = f"{index_folder}/{safe_name}.json"
+        self.lock = threading.Lock()
+        self.files = set()
+        self.chunks = set()
+        self.bands = [{} for _ in range(SIMHASH_BANDS)]
+        self.stats = {'files': 0, 'duplicate_files': 0, 'chunks': 0, 'duplicate_chunks': 0}
+        os.makedirs(index_folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"unable to read fingerprint index {self.path}: {e}")
+            return
+        self.files = set(data.get('files', []))
+        for fingerprint in data.get('chunks', []):
+            self._add_chunk(int(fingerprint, 16))
+
+    def save(self):
+        """write the index atomically"""
+        with self.lock:
+            data = {'files': sorted(self.files), 'chunks': [f"{fingerprint:016x}" for fingerprint in sorted(self.chunks)]}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _add_chunk(self, fingerprint):
+        self.chunks.add(fingerprint)
+        for band in range(SIMHASH_BANDS):
+            key = fingerprint >> (band * BAND_BITS) & BAND_MASK
+            self.bands[band].setdefault(key, []).append(fingerprint)
+
+    def _remove_chunk(self, fingerprint):
+        self.chunks.discard(fingerprint)
+        for band in range(SIMHASH_BANDS):
+            key = fingerprint >> (band * BAND_BITS) & BAND_MASK
+            candidates = self.bands[band].get(key, [])
+            if fingerprint in candidates:
+                candidates.remove(fingerprint)
+
+    def _is_near_duplicate(self, fingerprint):
+        if fingerprint in self.chunks:
+            return True
+        for band in range(SIMHASH_BANDS):
+            key = fingerprint >> (band * BAND_BITS) & BAND_MASK
+            for candidate in self.bands[band].get(key, []):
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    return True
+        return False
+
+    def check_file(self, file_path):
+        """return a (duplicate, fingerprint) tuple, duplicate is true if the same content has already been embedded"""
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            fingerprint = content_hash(f.read())
+        with self.lock:
+            self.stats['files'] += 1
+            if fingerprint in self.files:
+                self.stats['duplicate_files'] += 1
+                return True, fingerprint
+        return False, fingerprint
+
+    def record_file(self, fingerprint):
+        """mark a file content as embedded"""
+        with self.lock:
+            self.files.add(fingerprint)
+
+    def filter_documents(self, docs):
+        """
+        keep only the chunks (langchain documents) that are not near duplicates of embedded chunks.
+        Returns the kept documents and their fingerprints, already recorded so concurrent files see them"""
+        kept = []
+        fingerprints = []
+        candidates = [(doc, simhash(doc.page_content)) for doc in docs]
+        with self.lock:
+            for doc, fingerprint in candidates:
+                self.stats['chunks'] += 1
+                if self._is_near_duplicate(fingerprint):
+                    self.stats['duplicate_chunks'] += 1
+                    continue
+                self._add_chunk(fingerprint)
+                kept.append(doc)
+                fingerprints.append(fingerprint)
+        return kept, fingerprints
+
+    def forget_chunks(self, fingerprints):
+        """drop the fingerprints of chunks that could not be stored"""
+        with self.lock:
+            for fingerprint in fingerprints:
+                self._remove_chunk(fingerprint)
+
+    def summary(self):
+        """dedup ratios of the current run"""
+        with self.lock:
+            stats = dict(self.stats)
+        file_ratio = 100 * stats['duplicate_files'] / stats['files'] if stats['files'] else 0
+        chunk_ratio = 100 * stats['duplicate_chunks'] / stats['chunks'] if stats['chunks'] else 0
+        log.info(f"deduplication statistics: {stats}")
+        return (f"deduplication: {stats['duplicate_files']}/{stats['files']} duplicate files ({file_ratio:.0f}%), "
+                f"{stats['duplicate_chunks']}/{stats['chunks']} duplicate chunks ({chunk_ratio:.0f}%)")
@@ -0,0 +1,119 @@
+"""This class streams crawled pages to the page downloader and saved pages to ingestion"""
+import os
+import time
+import asyncio
+import threading
+from cat.log import log
+from .url_utils import canonicalize_url
+
+class DocPipeline:
+    """
+    Producer/consumer pipeline: crawl -> save (static or rendered) -> ingest.
+    The three stages run at the same time, connected by queues"""
+
+    def __init__(self, crawl, page_downloader, ingestion_pool, ingest, progress = None, progress_every = 10, cancel_event = None, metrics = None):
+        # crawl is an iterable of (url, body_path, changed) tuples, e.g. MySpider.stream(...)
+        self.crawl = crawl
+        self.page_downloader = page_downloader
+        self.ingestion_pool = ingestion_pool
+        # ingest(file_path) sends a saved page to the rabbit hole
+        self.ingest = ingest
+        self.progress = progress
+        self.progress_every = progress_every
+        # when set, the crawl is stopped and the pages still queued are dropped
+        self.cancel_event = cancel_event
+        # when set (a RunMetrics), every saved page is recorded with the time from its crawl to its save
+        self.metrics = metrics
+        self.crawled_at = {}
+        # raised by run() once the pages found before the crawl failed are saved and ingested
+        self.crawl_error = None
+        self.lock = threading.Lock()
+        self.stats = {
+            'crawled': 0,
+            'saved': 0,
+            'static': 0,
+            'rendered': 0,
+            'failed': 0,
+            'unchanged': 0,
+            'crawl_elapsed': 0.0,
+            'elapsed': 0.0,
+            'first_page_saved_after': None,
+        }
+        self.pages = []
+
+    def _crawl(self, loop, page_queue, started_at):
+        try:
+            for page_url, body_path, changed in self.crawl:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    break
+                with self.lock:
+                    self.stats['crawled'] += 1
+                    self.pages.append(page_url)
+                if not changed and self._already_saved(page_url):
+                    # same content as the last crawl: nothing to render or ingest again
+                    with self.lock:
+                        self.stats['unchanged'] += 1
+                    continue
+                with self.lock:
+                    self.crawled_at[canonicalize_url(page_url)] = time.monotonic()
+                loop.call_soon_threadsafe(page_queue.put_nowait, (page_url, body_path))
+        except Exception as e:
+            log.error(f"crawl failed: {e}")
+            self.crawl_error = e
+        finally:
+            if hasattr(self.crawl, 'close'):
+                # stops the crawl worker when the loop ended early
+                self.crawl.close()
+            self.stats['crawl_elapsed'] = round(time.monotonic() - started_at, 2)
+            loop.call_soon_threadsafe(page_queue.put_nowait, None)
+
+    def _already_saved(self, page_url):
+        file_path = self.page_downloader.page_index.get(page_url)
+        return file_path is not None and os.path.exists(file_path)
+
+    def _on_saved(self, page_url, file_path, rendered):
+        with self.lock:
+            crawled_at = self.crawled_at.pop(canonicalize_url(page_url), None)
+            self.stats['saved'] += 1
+            if self.stats['first_page_saved_after'] is None:
+                self.stats['first_page_saved_after'] = round(time.monotonic() - self.started_at, 2)
+            saved = self.stats['saved']
+        if self.metrics is not None and crawled_at is not None:
+            size = os.path.getsize(file_path) if os.path.exists(file_path) else None
+            self.metrics.record('page', page_url, time.monotonic() - crawled_at, 'rendered' if rendered else 'static', size)
+        # blocks while the ingestion pool is full, slowing down the producers
+        self.ingestion_pool.submit(file_path, self.ingest, file_path)
+        if self.progress is not None and saved % self.progress_every == 0:
+            self.progress(self.throughput())
+
+    def throughput(self):
+        """one line report of the throughput of every stage"""
+        elapsed = max(time.monotonic() - self.started_at, 0.001)
+        with self.lock:
+            stats = dict(self.stats)
+        ingestion = self.ingestion_pool.stats
+        return (
+            f"crawled {stats['crawled']} pages ({stats['crawled'] / elapsed:.1f}/s, {stats['unchanged']} unchanged), "
+            f"saved {stats['saved']} ({stats['saved'] / elapsed:.1f}/s), "
+            f"ingested {ingestion['ingested']} ({ingestion['ingested'] / elapsed:.1f}/s)"
+        )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        page_queue = asyncio.Queue()
+        crawler = threading.Thread(target=self._crawl, args=(loop, page_queue, self.started_at), name='catoverflow-crawl', daemon=True)
+        crawler.start()
+        download_stats = await self.page_downloader.stream_download(page_queue, self._on_saved)
+        crawler.join()
+        return download_stats
+
+    def run(self):
+        """run the whole pipeline, the ingestion pool must already be entered, a failed crawl is raised at the end"""
+        self.started_at = time.monotonic()
+        download_stats = asyncio.run(self._run())
+        self.stats.update(download_stats)
+        self.stats['elapsed'] = round(time.monotonic() - self.started_at, 2)
+        log.info(f"documentation pipeline statistics: {self.stats}")
+        if self.crawl_error is not None:
+            raise self.crawl_error
+        return self.stats
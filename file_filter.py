@@ -0,0 +1,179 @@
+"""This class decides which files are worth sending to the rabbit hole"""
+import os
+import fnmatch
+import mimetypes
+from cat.log import log
+
+DEFAULT_EXCLUDE_GLOBS = "*.min.js,*.min.css,*.map,*.lock,package-lock.json,yarn.lock,pnpm-lock.yaml,poetry.lock,Cargo.lock,*.pyc,*.class,*.o,*.so,*.dll,*.exe"
+# directories starting with / are only pruned at the root of the repository (src/build may be a real package)
+DEFAULT_EXCLUDED_DIRS = ".git,.hg,.svn,node_modules,bower_components,/vendor,/third_party,/dist,/build,__pycache__,.venv,venv,.tox,.idea,.vscode"
+DEFAULT_MAX_FILE_SIZE_KB = 512
+SNIFF_SIZE = 1024
+
+# source and text files are accepted before the mime heuristic, whose table depends on the host (/etc/mime.types maps .ts to video/mp2t)
+TEXT_EXTENSIONS = {
+    'py', 'pyi', 'js', 'jsx', 'mjs', 'cjs', 'ts', 'tsx', 'mts', 'cts', 'java', 'kt', 'kts', 'scala', 'swift', 'go', 'rs',
+    'c', 'h', 'cc', 'cpp', 'cxx', 'hpp', 'hh', 'cs', 'php', 'dart', 'rb', 'lua', 'r', 'jl', 'sh', 'bash', 'zsh', 'ps1', 'sql',
+    'md', 'mdx', 'rst', 'txt', 'adoc', 'json', 'yaml', 'yml', 'toml', 'ini', 'cfg', 'xml', 'html', 'htm', 'css', 'scss',
+    'sass', 'less', 'vue', 'svelte', 'ipynb', 'proto', 'graphql', 'gradle', 'cmake', 'tex',
+}
+
+BINARY_MIME_PREFIXES = ('image/', 'audio/', 'video/', 'font/')
+BINARY_MIME_TYPES = {
+    'application/zip',
+    'application/gzip',
+    'application/x-tar',
+    'application/x-bzip2',
+    'application/x-7z-compressed',
+    'application/java-archive',
+    'application/octet-stream',
+    'application/vnd.ms-fontobject',
+    'application/x-font-ttf',
+    'application/wasm',
+}
+
+# magic numbers of common binary formats found in repositories
+BINARY_SIGNATURES = (
+    b'\x89PNG',
+    b'\xff\xd8\xff',
+    b'GIF8',
+    b'PK\x03\x04',
+    b'\x1f\x8b',
+    b'\x7fELF',
+    b'MZ',
+    b'wOFF',
+    b'wOF2',
+)
+
+def split_setting(value):
+    """split a comma separated setting into a list of stripped, non empty values"""
+    if value in [None, '']:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip() != '']
+    return [item.strip() for item in str(value).split(',') if item.strip() != '']
+
+class FileFilter:
+    """Filter stage in front of ingestion: extensions, globs, size cap, binary sniffing and directory pruning"""
+
+    def __init__(self, include_extensions = None, include_globs = None, exclude_globs = DEFAULT_EXCLUDE_GLOBS,
+                 excluded_dirs = DEFAULT_EXCLUDED_DIRS, max_file_size_kb = DEFAULT_MAX_FILE_SIZE_KB, use_gitignore = True):
+        self.include_extensions = {ext.lower().lstrip('.') for ext in split_setting(include_extensions)}
+        self.include_globs = split_setting(include_globs)
+        self.exclude_globs = split_setting(exclude_globs)
+        self.excluded_dirs = split_setting(excluded_dirs)
+        self.max_file_size = int(max_file_size_kb) * 1024 if max_file_size_kb not in [None, ''] else 0
+        self.use_gitignore = use_gitignore
+
+    @classmethod
+    def from_settings(cls, settings):
+        """build a filter from the plugin settings"""
+        return cls(
+            include_extensions = settings.get('ingestion_include_extensions', ''),
+            include_globs = settings.get('ingestion_include_globs', ''),
+            exclude_globs = settings.get('ingestion_exclude_globs', DEFAULT_EXCLUDE_GLOBS),
+            excluded_dirs = settings.get('ingestion_excluded_dirs', DEFAULT_EXCLUDED_DIRS),
+            max_file_size_kb = settings.get('ingestion_max_file_size_kb', DEFAULT_MAX_FILE_SIZE_KB),
+        )
+
+    def load_gitignore(self, folder):
+        """add the plain directory patterns found in .gitignore files under folder (an extraction folder) to the pruned directories"""
+        if not self.use_gitignore:
+            return
+        for root, dirs, files in os.walk(folder):
+            # the top level folder of the extraction folder is the archive root (e.g. repository-main)
+            self.prune_dirs(dirs, '/'.join(os.path.relpath(root, folder).replace(os.sep, '/').split('/')[1:]))
+            if '.gitignore' not in files:
+                continue
+            try:
+                with open(os.path.join(root, '.gitignore'), 'r', encoding='utf-8', errors='ignore') as f:
+                    self.add_gitignore_patterns(f.read())
+            except OSError:
+                continue
+        log.info(f"excluded directories after reading .gitignore files: {self.excluded_dirs}")
+
+    def add_gitignore_patterns(self, text):
+        """add the plain directory patterns of a .gitignore file to the pruned directories"""
+        for line in text.splitlines():
+            line = line.strip()
+            # only directory patterns are used, file patterns and negations are too ambiguous
+            if line == '' or line.startswith('#') or line.startswith('!') or not line.endswith('/'):
+                continue
+            pattern = line.strip('/')
+            if pattern != '' and '/' not in pattern and pattern not in self.excluded_dirs:
+                self.excluded_dirs.append(pattern)
+
+    def is_excluded_dir(self, dir_path):
+        """
+        true if a directory must be pruned, dir_path is relative to the repository root (e.g. src/build),
+        patterns starting with / only match the directories at the root of the repository"""
+        dir_path = dir_path.strip('/')
+        name = dir_path.rsplit('/', 1)[-1]
+        for pattern in self.excluded_dirs:
+            if pattern.startswith('/'):
+                if fnmatch.fnmatch(dir_path, pattern.lstrip('/')):
+                    return True
+            elif fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    def is_excluded_path(self, relpath):
+        """true if a file (path relative to the repository root) is inside a pruned directory"""
+        parts = relpath.strip('/').split('/')[:-1]
+        return any(self.is_excluded_dir('/'.join(parts[:index + 1])) for index in range(len(parts)))
+
+    def prune_dirs(self, dirs, parent = ''):
+        """remove excluded directories in place, parent is the path of their folder relative to the repository root, return how many were removed"""
+        kept = [d for d in dirs if not self.is_excluded_dir(f"{parent}/{d}" if parent else d)]
+        pruned = len(dirs) - len(kept)
+        dirs[:] = kept
+        return pruned
+
+    def reject_reason_for_name(self, relpath, size = None):
+        """checks that only need the file path (and optionally its size), None if the file is accepted"""
+        name = os.path.basename(relpath)
+        extension = os.path.splitext(name)[1].lower().lstrip('.')
+        if any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern) for pattern in self.exclude_globs):
+            return 'excluded_glob'
+        included_by_glob = any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern) for pattern in self.include_globs)
+        if self.include_extensions and extension not in self.include_extensions and not included_by_glob:
+            return 'extension'
+        if self.include_globs and not self.include_extensions and not included_by_glob:
+            return 'not_included'
+        if size is not None:
+            if size == 0:
+                return 'empty'
+            if self.max_file_size and size > self.max_file_size:
+                return 'size'
+        if extension in TEXT_EXTENSIONS:
+            return None
+        mime_type, _ = mimetypes.guess_type(name)
+        if mime_type is not None and (mime_type.startswith(BINARY_MIME_PREFIXES) or mime_type in BINARY_MIME_TYPES):
+            return 'mime'
+        return None
+
+    @staticmethod
+    def reject_reason_for_head(head):
+        """sniff the first bytes of a file, None if it looks like text"""
+        if b'\x00' in head:
+            return 'binary'
+        if head.startswith(BINARY_SIGNATURES):
+            return 'mime'
+        return None
+
+    def reject_reason(self, file_path, relpath = None):
+        """full check of a file on disk, None if the file must be ingested"""
+        relpath = relpath if relpath is not None else os.path.basename(file_path)
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return 'unreadable'
+        reason = self.reject_reason_for_name(relpath, size)
+        if reason is not None:
+            return reason
+        try:
+            with open(file_path, 'rb') as f:
+                head = f.read(SNIFF_SIZE)
+        except OSError:
+            return 'unreadable'
+        return self.reject_reason_for_head(head)
@@ -1,26 +1,43 @@
 """This class is used to download a repository from GitHub API"""
 import os
-import threading
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
 from github import Github, Auth
 from cat.log import log
 from .base_downloader import BaseDownloader
+from .github_scheduler import get_scheduler, PRIORITY_METADATA, PRIORITY_DOWNLOAD, GITHUB_RAW_URL, GITHUB_API_URL
 #import pdb
 
+# (connect, read) timeouts in seconds
+DOWNLOAD_TIMEOUT = (10, 60)
+
 #https://docs.github.com/en/search-github/github-code-search/understanding-github-code-search-syntax#query-for-an-exact-match
 class GhApiRepoDownloader(BaseDownloader):
     """Download a repository from GitHub API"""
 
-    def __init__(self, name, output_folder, key = None):
+    def __init__(self, name, output_folder, key = None, ref = None, workers = 8, file_filter = None):
         self.repository_name = name
         self.output_directory = output_folder
         self.auth_key = key
+        self.ref = ref
+        self.workers = max(1, int(workers))
+        self.file_filter = file_filter
+        self.stats = {'files': 0, 'bytes': 0, 'unchanged': 0, 'filtered': 0, 'removed': 0, 'errors': 0}
 
         # Authenticate with GitHub
         if self.auth_key is not None:
             auth = Auth.Token(self.auth_key)
-            self.g = Github(auth=auth)
+            self.g = Github(auth=auth, base_url=GITHUB_API_URL)
+            self.scheduler = get_scheduler()
             # Access the repository
-            self.repo = self.g.get_repo(self.repository_name)
+            self.repo = self._api_call(self.g.get_repo, self.repository_name)
+            # the default branch comes with the repository metadata, no extra request is needed
+            self.branch = self.ref if self.ref is not None else self.repo.default_branch
+            # same layout of the extracted zip archives: <owner>/<repository>/<repository>-<branch>/...
+            self.extraction_folder = f"{self.output_directory}/{self.repo.full_name}"
+            self.tree_folder = f"{self.extraction_folder}/{self.repo.name}-{self.branch.replace('/', '-')}"
         else:
             raise ValueError('No auth key provided')
         
@@ -32,77 +49,151 @@ class GhApiRepoDownloader(BaseDownloader):
         else:
             log.info(f"output directory already exists: {archive_path}")
 
-    def _download_files_recursively(self, content_path = ""):
-        # Retrieve the list of files and directories in the current directory
-        #pdb.set_trace()
-        os.makedirs(os.path.join(f"{self.output_directory}/{self.repo.full_name}", content_path), exist_ok=True)
-        contents = []
-        try:
-            contents = self.repo.get_contents(content_path)
-        except Exception as e:
-            log.error(f"Error occurred: {e}")
-
-        threads = []
-
-        # Iterate through each file or directory
-        for content in contents:
-            # if os.path.exists(os.path.join(self.output_directory, content.name)):
-            #   log.info(f"Skipping: {content.name}")
-            #   continue
-            if content.type == "file":
+    def _api_call(self, func, *args, **kwargs):
+        """run a PyGithub call through the shared scheduler and feed it the rate limit PyGithub has seen"""
+        result = self.scheduler.call(func, *args, priority=PRIORITY_METADATA, resource='core', **kwargs)
+        remaining, limit = self.g.rate_limiting
+        if limit > 0:
+            self.scheduler.set_budget('core', remaining, limit, self.g.rate_limiting_resettime)
+        return result
+
+    def _list_tree(self, sha, prefix = ""):
+        """list the blobs of a tree with one recursive Trees API call (more calls only if GitHub truncates it)"""
+        tree = self._api_call(self.repo.get_git_tree, sha, recursive=True)
+        if not tree.raw_data.get('truncated', False):
+            return [(prefix + entry.path, entry) for entry in tree.tree if entry.type == 'blob']
+
+        log.info(f"tree {prefix or '/'} is truncated, listing its subtrees")
+        blobs = []
+        for entry in self._api_call(self.repo.get_git_tree, sha, recursive=False).tree:
+            if entry.type == 'blob':
+                blobs.append((prefix + entry.path, entry))
+            elif entry.type == 'tree':
+                if self.file_filter is not None and self.file_filter.is_excluded_dir(prefix + entry.path):
+                    continue
+                blobs.extend(self._list_tree(entry.sha, f"{prefix}{entry.path}/"))
+        return blobs
+
+    def _accept(self, path, size):
+        if self.file_filter is None:
+            return True
+        if self.file_filter.is_excluded_path(path):
+            return False
+        return self.file_filter.reject_reason_for_name(path, size) is None
+
+    def _remove_stale_files(self, paths):
+        """remove the trees of other refs and the files no longer in the tree, only the current tree must be ingested"""
+        if not os.path.isdir(self.extraction_folder):
+            return
+        for name in os.listdir(self.extraction_folder):
+            entry_path = os.path.join(self.extraction_folder, name)
+            if os.path.normpath(entry_path) == os.path.normpath(self.tree_folder):
+                continue
+            log.info(f"removing stale tree: {entry_path}")
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+        for root, dirs, files in os.walk(self.tree_folder, topdown=False):
+            for file in files:
+                file_path = os.path.join(root, file)
+                if os.path.relpath(file_path, self.tree_folder).replace(os.sep, '/') not in paths:
+                    os.remove(file_path)
+                    self.stats['removed'] += 1
+            if root != self.tree_folder and len(os.listdir(root)) == 0:
+                os.rmdir(root)
+
+    def _download_tree(self):
+        # the raw urls are pinned to the commit the tree was listed from, a push during the download cannot mix two commits
+        self.commit_sha = self._api_call(self.repo.get_commit, self.branch).sha
+        blobs = self._list_tree(self.commit_sha)
+        log.info(f"{len(blobs)} files found in {self.repo.full_name}@{self.branch} ({self.commit_sha[:12]})")
+        blob_index_path = f"{self.extraction_folder}.blobs.json"
+        blob_index = self._read_blob_index(blob_index_path)
+        accepted = []
+        for path, entry in blobs:
+            if not self._accept(path, entry.size):
+                self.stats['filtered'] += 1
+                continue
+            accepted.append((path, entry))
+        accepted_paths = {path for path, entry in accepted}
+        self._remove_stale_files(accepted_paths)
+        blob_index = {path: sha for path, sha in blob_index.items() if path in accepted_paths}
+        downloads = []
+        for path, entry in accepted:
+            output_path = os.path.join(self.tree_folder, *path.split('/'))
+            if blob_index.get(path) == entry.sha and os.path.exists(output_path):
+                log.info(f"Skipping: {path}")
+                self.stats['unchanged'] += 1
+                continue
+            downloads.append((path, entry.sha, output_path))
+
+        log.info(f"downloading {len(downloads)} files with {self.workers} workers ({self.scheduler.budget_summary()})")
+        errors = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catoverflow-download') as executor:
+            futures = {executor.submit(self._download_file, path, output_path): (path, sha) for path, sha, output_path in downloads}
+            for future in as_completed(futures):
+                path, sha = futures[future]
                 try:
-                    # Download the file
-                    t = threading.Thread(target=self._download_file, kwargs={'file': content})
-                    threads.append(t)
+                    self.stats['bytes'] += future.result()
+                    self.stats['files'] += 1
+                    blob_index[path] = sha
                 except Exception as e:
-                    log.info(f"Error occurred during download_file: {e}")
-            elif content.type == "dir":
-                # Recursively call the function for subdirectories
-                if content_path != "":
-                    next_path = content_path + "/" + content.name
-                else:
-                    next_path = content.name
-                #log.info(f"next_path: {next_path}")
-                t = threading.Thread(target=self._download_files_recursively, kwargs={'content_path': next_path})
-                threads.append(t)
-
-        for t in threads:
-            t.start()
-            t.join()
-        return True
+                    errors += 1
+                    self.stats['errors'] += 1
+                    log.error(f"Error occurred during download_file {path}: {e}")
+        self._write_blob_index(blob_index_path, blob_index)
+        # the download fails only when every file failed
+        return len(downloads) == 0 or errors < len(downloads)
+
+    @staticmethod
+    def _read_blob_index(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_blob_index(path, blob_index):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(blob_index, f, indent=1, sort_keys=True)
 
     # download file
-    def _download_file(self, file):
-        # Download the file
-        content = file.decoded_content
-        output_path = os.path.join(f"{self.output_directory}/{self.repo.full_name}", file.path)
-        if not os.path.exists(output_path):
-            with open(output_path, "wb") as f:
-                f.write(content)
-            log.info(f"Downloaded: {file.path}")
-        else:
-            log.info(f"Skipping: {file.path}")
+    def _download_file(self, path, output_path):
+        # raw downloads do not count against the API rate limit
+        url = f"{GITHUB_RAW_URL}/{self.repo.full_name}/{self.commit_sha}/{quote(path)}"
+        # the scheduler shares one keep-alive session between all the download workers
+        response = self.scheduler.request('GET', url, priority=PRIORITY_DOWNLOAD, resource='raw',
+                                          headers={'Authorization': f"token {self.auth_key}"}, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(response.content)
+        log.info(f"Downloaded: {path}")
+        return len(response.content)
 
     def download_files_from_repo(self):
         """download files from repo"""
 
         if self.auth_key is not None:
-            result = self._download_files_recursively()
+            result = self._download_tree()
             file_path = f"{self.output_directory}/{self.repo.full_name}.zip"
-            return {"result": result, "path": file_path, "branch": self.repo.default_branch}
+            return {"result": result, "path": file_path, "branch": self.branch}
         else:
             log.error('No auth key provided')
             raise ValueError('No auth key provided')
 
-    def extract_archive(self, result):
-        """extract previously downloaded archive"""
+    def extract_archive(self, result, stream = False):
+        """extract previously downloaded archive (files are already on disk, there is nothing to stream)"""
 
         if result['result'] is True:
             log.info(f"start extracting archive: {result['path']}")
             #archive_path = result['path']
             branch_name = result['branch']
-            if self.auth_key is not None:
-                extraction_folder = f"{self.output_directory}/{self.repo.full_name}"
+            extraction_folder = self.extraction_folder
             return { "result": result['result'], "path": result['path'], "branch": branch_name, "extraction_folder": extraction_folder}
         else:
             message = 'Something went wrong during archive download'
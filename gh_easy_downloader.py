@@ -1,18 +1,31 @@
 """This class is used to download a repository from GitHub without any authentication"""
 #import pdb
 import os
+import json
+import shutil
+import hashlib
 import zipfile
 import requests
 from cat.log import log
 from .base_downloader import BaseDownloader
+from .github_scheduler import get_scheduler, PRIORITY_DOWNLOAD, GITHUB_WEB_URL
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_ATTEMPTS = 3
+# (connect, read) timeouts in seconds
+DOWNLOAD_TIMEOUT = (10, 60)
 
 # https://docs.github.com/en/search-github/github-code-search/understanding-github-code-search-syntax#query-for-an-exact-match
 class GhEasyDownloader(BaseDownloader):
     """Download a repository from GitHub without any authentication"""
 
-    def __init__(self, name, output_folder):
+    def __init__(self, name, output_folder, ref = None, branch_resolver = None):
         self.repository_name = name
         self.output_directory = output_folder
+        self.ref = ref
+        self.branch_resolver = branch_resolver
+        self.not_modified = False
+        self.stats = {'attempts': 0, 'bytes': 0, 'resumed': 0, 'not_modified': 0}
 
         #pdb.set_trace()
         archive_path = f"{self.output_directory}/{self.repository_name.split('/')[0]}"
@@ -23,31 +36,152 @@ class GhEasyDownloader(BaseDownloader):
             log.info(f"output directory already exists: {archive_path}")
 
 
-    # download zip archive
-    def _download_zip_archive(self, branch):
-        url = f'https://github.com/{self.repository_name}/archive/refs/heads/{branch}.zip'
+    def _archive_file_path(self):
+        archive_path = f"{self.output_directory}/{self.repository_name.split('/')[0]}"
+        return f"{archive_path}/{self.repository_name.split('/')[-1]}.zip"
+
+    @staticmethod
+    def _read_metadata(path):
+        if not os.path.exists(path):
+            return {}
         try:
-            r = requests.get(url, stream=True)
-            r.raise_for_status()  # Raise exception for any HTTP errors
-            archive_path = f"{self.output_directory}/{self.repository_name.split('/')[0]}"
-            file_path = f"{archive_path}/{self.repository_name.split('/')[-1]}.zip"
-            log.info(f"writing file in: {file_path}")
-            with open(file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=16*1024):
-                    f.write(chunk)
-            f.close()
-            log.info(f'archive from branch {branch} downloaded successfully')
-            return True
-        except requests.exceptions.RequestException as e:
-            log.error(f"Error occurred: {e}")
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_metadata(path, metadata):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=1, sort_keys=True)
+
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest
+
+    def verify_archive(self, file_path):
+        """check the archive against the sha256 recorded when its bytes were streamed"""
+        metadata = self._read_metadata(f"{file_path}.meta.json")
+        if not os.path.exists(file_path) or 'sha256' not in metadata:
             return False
+        return self._file_hash(file_path).hexdigest() == metadata['sha256'] and zipfile.is_zipfile(file_path)
+
+    # download zip archive, a pinned ref can be a branch, a tag or a commit
+    def _download_zip_archive(self, branch, pinned = False):
+        """
+        Download the archive of a ref.
+        An archive downloaded before is revalidated with ETag/Last-Modified (a 304 costs no transfer),
+        an interrupted download is resumed with a Range request from the .part file"""
+        if pinned:
+            url = f'{GITHUB_WEB_URL}/{self.repository_name}/archive/{branch}.zip'
+        else:
+            url = f'{GITHUB_WEB_URL}/{self.repository_name}/archive/refs/heads/{branch}.zip'
+        file_path = self._archive_file_path()
+        part_path = f"{file_path}.part"
+        metadata_path = f"{file_path}.meta.json"
+        part_metadata_path = f"{part_path}.meta.json"
+        self.not_modified = False
+
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            self.stats['attempts'] += 1
+            metadata = self._read_metadata(metadata_path)
+            part_metadata = self._read_metadata(part_metadata_path)
+            if part_metadata.get('url') != url and os.path.exists(part_path):
+                # a partial download of another ref can not be resumed
+                os.remove(part_path)
+
+            headers = {}
+            resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if resume_from > 0:
+                headers['Range'] = f"bytes={resume_from}-"
+                if part_metadata.get('etag'):
+                    headers['If-Range'] = part_metadata['etag']
+            elif metadata.get('url') == url and os.path.exists(file_path):
+                if metadata.get('etag'):
+                    headers['If-None-Match'] = metadata['etag']
+                if metadata.get('last_modified'):
+                    headers['If-Modified-Since'] = metadata['last_modified']
+
+            try:
+                with get_scheduler().request('GET', url, priority=PRIORITY_DOWNLOAD, resource='web', stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as r:
+                    if r.status_code == 304:
+                        if self.verify_archive(file_path):
+                            log.info(f'archive from branch {branch} not modified: {file_path}')
+                            self.not_modified = True
+                            self.stats['not_modified'] += 1
+                            return True
+                        log.info(f'archive {file_path} does not match its checksum, downloading it again')
+                        os.remove(metadata_path)
+                        continue
+                    if r.status_code == 416:
+                        os.remove(part_path)
+                        continue
+                    r.raise_for_status()  # Raise exception for any HTTP errors
+
+                    if r.status_code == 206:
+                        log.info(f"resuming download of {url} from byte {resume_from}")
+                        self.stats['resumed'] += 1
+                        digest = self._file_hash(part_path)
+                        mode = 'ab'
+                        expected_size = resume_from + int(r.headers.get('Content-Length', 0)) if 'Content-Length' in r.headers else None
+                    else:
+                        digest = hashlib.sha256()
+                        mode = 'wb'
+                        expected_size = int(r.headers['Content-Length']) if 'Content-Length' in r.headers else None
+                    if r.headers.get('Content-Encoding') not in [None, 'identity']:
+                        # Content-Length counts the encoded bytes, not the ones written on disk
+                        expected_size = None
+
+                    part_metadata = {
+                        'url': url,
+                        'etag': r.headers.get('ETag'),
+                        'last_modified': r.headers.get('Last-Modified'),
+                    }
+                    self._write_metadata(part_metadata_path, part_metadata)
+
+                    log.info(f"writing file in: {part_path}")
+                    with open(part_path, mode) as f:
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            self.stats['bytes'] += len(chunk)
+
+                size = os.path.getsize(part_path)
+                if expected_size is not None and size != expected_size:
+                    raise requests.exceptions.ConnectionError(f"incomplete download: {size}/{expected_size} bytes")
+
+                os.replace(part_path, file_path)
+                part_metadata.update({'sha256': digest.hexdigest(), 'size': size, 'branch': branch})
+                self._write_metadata(metadata_path, part_metadata)
+                os.remove(part_metadata_path)
+                log.info(f'archive from branch {branch} downloaded successfully')
+                return True
+            except requests.exceptions.HTTPError as e:
+                log.error(f"Error occurred: {e}")
+                return False
+            except requests.exceptions.RequestException as e:
+                log.error(f"Error occurred (attempt {attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
+        return False
 
     def download_files_from_repo(self):
         """download files from repo"""
         try:
             #pdb.set_trace()
             result = True
-            if self._download_zip_archive(branch='main'):
+            branch = None
+            if self.ref is None and self.branch_resolver is not None:
+                branch = self.branch_resolver.resolve(self.repository_name)
+
+            if self.ref is not None:
+                branch = self.ref
+                result = self._download_zip_archive(branch=self.ref, pinned=True)
+            elif branch is not None and self._download_zip_archive(branch=branch):
+                pass
+            elif self._download_zip_archive(branch='main'):
                 branch = 'main'
             elif self._download_zip_archive(branch='master'):
                 branch = 'master'
@@ -56,21 +190,48 @@ class GhEasyDownloader(BaseDownloader):
             else:
                 result = False
             log.info(f"download result: {result}")
-            file_path = f"{self.output_directory}/{self.repository_name.split('/')[0]}/{self.repository_name.split('/')[-1]}.zip"
-            return {"result": result, "path": file_path, "branch": branch}
+            file_path = self._archive_file_path()
+            return {"result": result, "path": file_path, "branch": branch, "not_modified": result and self.not_modified}
         except requests.exceptions.RequestException:
             pass
 
-    def extract_archive(self, result):
-        """extract previously downloaded archive"""
+    def extract_archive(self, result, stream = False):
+        """
+        extract previously downloaded archive.
+        When stream is True nothing is written: members are decompressed one by one during ingestion"""
 
         if result['result'] is True:
-            log.info(f"start extracting archive: {result['path']}")
             archive_path = result['path']
             branch_name = result['branch']
             extraction_folder = f"{self.output_directory}/{self.repository_name.split('/')[0]}/{self.repository_name.split('/')[-1]}"
+            if not self.verify_archive(archive_path):
+                message = f'archive checksum verification failed: {archive_path}'
+                log.error(message)
+                raise Exception(message)
+            if stream and os.path.exists(archive_path):
+                log.info(f"archive will be streamed to ingestion: {archive_path}")
+                return {
+                    "result": result['result'],
+                    "path": archive_path,
+                    "branch": branch_name,
+                    "extraction_folder": extraction_folder,
+                    "streamed": True
+                }
+            if result.get('not_modified') is True and os.path.isdir(extraction_folder) and os.listdir(extraction_folder):
+                log.info(f"archive not modified, reusing extraction folder: {extraction_folder}")
+                return {
+                    "result": result['result'],
+                    "path": archive_path,
+                    "branch": branch_name,
+                    "extraction_folder": extraction_folder,
+                    "streamed": False
+                }
+            log.info(f"start extracting archive: {result['path']}")
             if os.path.exists(archive_path):
                 with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+                    # drop the previous extraction, it may come from another ref
+                    if os.path.exists(extraction_folder):
+                        shutil.rmtree(extraction_folder)
                     os.makedirs(extraction_folder, exist_ok=True)
                     zip_ref.extractall(extraction_folder)
                 log.info(f"archive extracted successfully to {extraction_folder}")
@@ -80,7 +241,8 @@ class GhEasyDownloader(BaseDownloader):
                 "result": result['result'], 
                 "path": result['path'], 
                 "branch": branch_name, 
-                "extraction_folder": extraction_folder
+                "extraction_folder": extraction_folder,
+                "streamed": False
             }
         else:
             message = 'Something went wrong during archive download'
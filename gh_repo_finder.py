@@ -1,12 +1,16 @@
 """This class is used to search a repository in GitHub with or without authentication"""
 import requests
 from cat.log import log
+from .github_scheduler import get_scheduler, PRIORITY_SEARCH, GITHUB_WEB_URL, GITHUB_API_URL
 #import pdb
 class GhRepoFinder:
     """This class is used to search a repository in GitHub with or without authentication"""
 
-    def __init__(self, github_key = None) -> None:
+    def __init__(self, github_key = None, cache = None, cache_ttl = 3600, negative_cache_ttl = 300) -> None:
         self.github_key = github_key
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.negative_cache_ttl = negative_cache_ttl
 
     def parse_raw_response(self, data):
         """Parse the raw response from GitHub search"""
@@ -17,7 +21,7 @@ class GhRepoFinder:
                 name = name.replace("<em>","")
                 name = name.replace("</em>","")
                 name = name.replace("&#x2F;","/")
-                url = f"https://github.com/{name}"
+                url = f"{GITHUB_WEB_URL}/{name}"
                 results.append({'name': name, 'url': url})
         except KeyError as error:
             log.error(f'wrong result data object: {data.keys()}')
@@ -40,18 +44,22 @@ class GhRepoFinder:
     def search_library(self, library_name):
         """Search for a library in GitHub repositories"""
 
+        headers = {}
         if self.github_key in [None, '']:
-            url = f"https://github.com/search?q={library_name}+in%3Aname&type=repositories"
+            url = f"{GITHUB_WEB_URL}/search?q={library_name}+in%3Aname&type=repositories"
+            resource = 'web'
         else:
             # GitHub API endpoint for repository search
-            url = 'https://api.github.com/search/repositories'
+            url = f'{GITHUB_API_URL}/search/repositories'
+            headers['Authorization'] = f"token {self.github_key}"
+            resource = 'search'
 
         # Parameters for the search query
         params = {'q': library_name}
 
         try:
             # Sending GET request to GitHub API
-            response = requests.get(url, params=params, timeout=5)
+            response = get_scheduler().request('GET', url, priority=PRIORITY_SEARCH, resource=resource, params=params, headers=headers, timeout=5)
             response.raise_for_status()  # Raise exception for any HTTP errors
 
             # Extracting JSON data from the response
@@ -67,11 +75,25 @@ class GhRepoFinder:
         """find repo in github"""
 
         log.info(f"start search for: {repo_name}")
-        api_response = self.search_library(repo_name)
-        if self.github_key in [None, '']:
-            search_results = self.parse_raw_response(api_response)
-        else:
-            search_results = self.parse_api_response(api_response)
+        search_results = None
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(repo_name, self.github_key not in [None, ''])
+            search_results = self.cache.get(cache_key, self.cache_ttl, self.negative_cache_ttl)
+            if search_results is not None:
+                log.info(f"search results from cache for: {cache_key}")
+
+        if search_results is None:
+            api_response = self.search_library(repo_name)
+            if api_response is None:
+                # request failed: nothing to parse and nothing to cache
+                return None
+            if self.github_key in [None, '']:
+                search_results = self.parse_raw_response(api_response)
+            else:
+                search_results = self.parse_api_response(api_response)
+            if self.cache is not None:
+                self.cache.put(cache_key, search_results)
         log.info(search_results)
         for dict_item in search_results:
             if dict_item['name'] == repo_name:
@@ -0,0 +1,245 @@
+"""This class schedules every request sent to GitHub according to its rate limits"""
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from cat.log import log
+
+# lower number means higher priority
+PRIORITY_SEARCH = 0
+PRIORITY_METADATA = 1
+PRIORITY_DOWNLOAD = 2
+
+# share of the budget that lower priority classes can not use
+PRIORITY_RESERVE = {
+    PRIORITY_SEARCH: 0.0,
+    PRIORITY_METADATA: 0.05,
+    PRIORITY_DOWNLOAD: 0.2,
+}
+
+RETRY_STATUS = (403, 429, 500, 502, 503, 504)
+
+# base urls of GitHub, overridable through environment variables (e.g. to run the benchmarks against local stand-ins)
+GITHUB_WEB_URL = os.environ.get('CATOVERFLOW_GITHUB_WEB_URL', 'https://github.com').rstrip('/')
+GITHUB_API_URL = os.environ.get('CATOVERFLOW_GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+GITHUB_RAW_URL = os.environ.get('CATOVERFLOW_GITHUB_RAW_URL', 'https://raw.githubusercontent.com').rstrip('/')
+
+class GitHubScheduler:
+    """
+    Token buckets seeded from the X-RateLimit-* headers (one per GitHub resource: core, search, ...),
+    priority classes so searches are not starved by blob fetches and jittered exponential backoff"""
+
+    def __init__(self, max_retries = 5, base_delay = 1.0, max_delay = 60.0, pool_size = 32):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.condition = threading.Condition()
+        self.buckets = {}
+        self.waiting = {PRIORITY_SEARCH: 0, PRIORITY_METADATA: 0, PRIORITY_DOWNLOAD: 0}
+        self.blocked_until = 0.0
+        self.wait_time = 0.0
+        self.requests = 0
+        self.retries = 0
+
+    def _can_run(self, resource, priority, now):
+        if now < self.blocked_until:
+            return False
+        if any(self.waiting[p] > 0 for p in self.waiting if p < priority) and self._is_scarce(resource, now):
+            return False
+        bucket = self.buckets.get(resource)
+        if bucket is None or bucket['reset'] <= now:
+            return True
+        reserve = int(bucket['limit'] * PRIORITY_RESERVE[priority])
+        return bucket['remaining'] > reserve
+
+    def _is_scarce(self, resource, now):
+        bucket = self.buckets.get(resource)
+        if bucket is None or bucket['reset'] <= now:
+            return False
+        return bucket['remaining'] <= bucket['limit'] * PRIORITY_RESERVE[PRIORITY_DOWNLOAD]
+
+    def _next_wakeup(self, resource, now):
+        candidates = [self.blocked_until]
+        bucket = self.buckets.get(resource)
+        if bucket is not None:
+            candidates.append(bucket['reset'])
+        wakeup = max(candidates)
+        # wake up at least every few seconds to notice other threads updating the buckets
+        return min(max(wakeup - now, 0.05), 5.0)
+
+    def acquire(self, resource, priority = PRIORITY_METADATA):
+        """wait until a request of this priority can be sent, then consume one token"""
+        started_at = time.monotonic()
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    if self._can_run(resource, priority, now):
+                        break
+                    self.condition.wait(self._next_wakeup(resource, now))
+                bucket = self.buckets.get(resource)
+                if bucket is not None and bucket['reset'] > time.time():
+                    bucket['remaining'] -= 1
+            finally:
+                self.waiting[priority] -= 1
+        waited = time.monotonic() - started_at
+        if waited > 0.5:
+            with self.condition:
+                self.wait_time += waited
+            log.info(f"waited {waited:.1f}s for the GitHub {resource} budget ({self.budget_summary()})")
+        return waited
+
+    def update(self, headers, resource = None):
+        """seed the token bucket from the X-RateLimit-* headers of a response"""
+        if headers is None or 'X-RateLimit-Remaining' not in headers:
+            return
+        resource = headers.get('X-RateLimit-Resource', resource or 'core')
+        try:
+            bucket = {
+                'limit': int(headers.get('X-RateLimit-Limit', 0)),
+                'remaining': int(headers['X-RateLimit-Remaining']),
+                'reset': float(headers.get('X-RateLimit-Reset', time.time() + 60)),
+            }
+        except ValueError:
+            return
+        with self.condition:
+            self.buckets[resource] = bucket
+            self.condition.notify_all()
+        if bucket['limit'] > 0 and bucket['remaining'] < bucket['limit'] * 0.1:
+            log.info(f"GitHub {resource} budget is running low: {self.budget_summary()}")
+
+    def set_budget(self, resource, remaining, limit, reset):
+        """seed a bucket from values read elsewhere (e.g. PyGithub rate_limiting)"""
+        self.update({
+            'X-RateLimit-Resource': resource,
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Reset': str(reset),
+        }, resource)
+
+    def backoff_delay(self, attempt, headers = None):
+        """delay before the next attempt: Retry-After, the rate limit reset or a jittered exponential backoff"""
+        headers = headers or {}
+        if 'Retry-After' in headers:
+            try:
+                return float(headers['Retry-After'])
+            except ValueError:
+                pass
+        if headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in headers:
+            try:
+                return max(float(headers['X-RateLimit-Reset']) - time.time(), 0) + 1
+            except ValueError:
+                pass
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _block(self, delay):
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+            self.wait_time += delay
+            self.condition.notify_all()
+
+    def request(self, method, url, priority = PRIORITY_METADATA, resource = 'core', **kwargs):
+        """send a request through the shared pooled session, retrying rate limited and failed requests"""
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self.acquire(resource, priority)
+            self._count(attempt)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                log.info(f"request to {url} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.update(response.headers, resource)
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+            if response.status_code == 403 and not is_rate_limited(response.headers, response.text):
+                # a plain forbidden answer (missing scope, private repository), retrying will not help
+                return response
+
+            delay = self.backoff_delay(attempt, response.headers)
+            log.info(f"GitHub answered {response.status_code} for {url}, retrying in {delay:.1f}s ({self.budget_summary()})")
+            response.close()
+            if response.status_code in (403, 429):
+                # rate limits are global: every request waits, not only this one
+                self._block(delay)
+            else:
+                time.sleep(delay)
+        return response
+
+    def call(self, func, *args, priority = PRIORITY_METADATA, resource = 'core', **kwargs):
+        """run a PyGithub call under the scheduler, retrying on rate limit exceptions"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(resource, priority)
+            self._count(attempt)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, 'status', None)
+                if status not in (403, 429) or attempt == self.max_retries:
+                    raise
+                if status == 403 and not is_rate_limited(getattr(e, 'headers', None), str(getattr(e, 'data', ''))):
+                    raise
+                delay = self.backoff_delay(attempt, getattr(e, 'headers', None))
+                log.info(f"GitHub API rate limited ({status}), retrying in {delay:.1f}s")
+                self._block(delay)
+        return None
+
+    def _count(self, attempt):
+        with self.condition:
+            self.requests += 1
+            if attempt > 0:
+                self.retries += 1
+
+    def counters(self):
+        """requests sent, retries and seconds spent waiting for the rate limit since the scheduler was created"""
+        with self.condition:
+            return {'requests': self.requests, 'retries': self.retries, 'wait_seconds': self.wait_time}
+
+    def budget_summary(self):
+        """human readable state of the rate limit budget"""
+        now = time.time()
+        with self.condition:
+            buckets = dict(self.buckets)
+            wait_time = self.wait_time
+        if not buckets:
+            return f"no rate limit information yet (waited {wait_time:.1f}s)"
+        parts = []
+        for resource, bucket in sorted(buckets.items()):
+            reset_in = max(int(bucket['reset'] - now), 0)
+            parts.append(f"{resource}: {bucket['remaining']}/{bucket['limit']} (reset in {reset_in}s)")
+        return ', '.join(parts) + f" (waited {wait_time:.1f}s)"
+
+def is_rate_limited(headers, text):
+    """
+    True when a 403 answer is a rate limit: api.github.com sends X-RateLimit-Remaining with every answer,
+    only an exhausted budget, a Retry-After or a rate limit message tell a rate limit from a permission error"""
+    headers = headers or {}
+    if str(headers.get('X-RateLimit-Remaining', headers.get('x-ratelimit-remaining', ''))).strip() == '0':
+        return True
+    if headers.get('Retry-After', headers.get('retry-after')) is not None:
+        return True
+    return 'rate limit' in (text or '').lower()
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+def get_scheduler():
+    """shared scheduler used by every GitHub call of the plugin"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = GitHubScheduler()
+        return _SCHEDULER
@@ -0,0 +1,112 @@
+"""This class keeps track of the files already ingested from an extraction folder"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from cat.log import log
+
+class IngestionManifest:
+    """Persistent manifest (path -> size, mtime, sha256, branch, ingested_at) stored next to an extraction folder"""
+
+    def __init__(self, extraction_folder, branch = ''):
+        self.extraction_folder = extraction_folder.rstrip('/')
+        self.branch = branch
+        self.path = f"{self.extraction_folder}.manifest.json"
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.seen = set()
+        # files handed to another stage (the raw fallback), recorded only once that stage has ingested them
+        self.deferred = {}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('files', {})
+        except (OSError, ValueError) as e:
+            log.error(f"unable to read ingestion manifest {self.path}: {e}")
+            return {}
+
+    def relative_path(self, file_path):
+        """path of a file relative to the extraction folder, used as manifest key"""
+        return os.path.relpath(file_path, self.extraction_folder)
+
+    @staticmethod
+    def file_hash(file_path):
+        """sha256 of a file content"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def check(self, file_path):
+        """
+        Return a (changed, entry) tuple for a file.
+        Size and mtime are compared first, the sha256 is computed only when they differ"""
+        key = self.relative_path(file_path)
+        stat = os.stat(file_path)
+        with self.lock:
+            self.seen.add(key)
+            previous = self.entries.get(key)
+        if previous is not None and previous.get('branch') == self.branch \
+                and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+            return False, previous
+        entry = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': self.file_hash(file_path),
+            'branch': self.branch,
+        }
+        if previous is not None and previous.get('sha256') == entry['sha256']:
+            # same content extracted again: only refresh the cheap attributes
+            entry['ingested_at'] = previous.get('ingested_at')
+            with self.lock:
+                self.entries[key] = entry
+            return False, entry
+        return True, entry
+
+    def record(self, file_path, entry):
+        """mark a file as ingested"""
+        entry = dict(entry)
+        entry['ingested_at'] = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            self.entries[self.relative_path(file_path)] = entry
+
+    def defer(self, file_path, entry):
+        """keep the entry of a file handed to another stage, complete() records it"""
+        with self.lock:
+            self.deferred[self.relative_path(file_path)] = entry
+
+    def complete(self, file_path, ingested = True):
+        """record a deferred file once the other stage has ingested it, or drop it when that stage failed"""
+        with self.lock:
+            entry = self.deferred.pop(self.relative_path(file_path), None)
+        if ingested and entry is not None:
+            self.record(file_path, entry)
+
+    def forget(self, file_path):
+        """drop a file from the manifest, it will be ingested again by the next run"""
+        with self.lock:
+            self.entries.pop(self.relative_path(file_path), None)
+
+    def prune(self):
+        """forget files that are no longer in the extraction folder, return how many were removed"""
+        with self.lock:
+            removed = [key for key in self.entries if key not in self.seen]
+            for key in removed:
+                del self.entries[key]
+        return len(removed)
+
+    def save(self):
+        """write the manifest atomically"""
+        with self.lock:
+            data = {'extraction_folder': self.extraction_folder, 'branch': self.branch, 'files': self.entries}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        log.info(f"ingestion manifest saved: {self.path} ({len(data['files'])} files)")
@@ -0,0 +1,166 @@
+"""This class runs file ingestion through a bounded pool of workers"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from cat.log import log
+
+class IngestionPool:
+    """Bounded ingestion pool with backpressure, per-file error isolation and statistics"""
+
+    def __init__(self, workers = 4, manifest = None, file_filter = None, root_folder = None, cancel_event = None, metrics = None,
+                 executor = None):
+        self.workers = max(1, int(workers))
+        # when given, the files run on this executor (shared by several pools) instead of a pool of their own
+        self.shared_executor = executor
+        self.futures = set()
+        # when set (a RunMetrics), every file is recorded with its time, size and outcome
+        self.metrics = metrics
+        # when set, the files not ingested yet are skipped
+        self.cancel_event = cancel_event
+        self.manifest = manifest
+        self.file_filter = file_filter
+        self.root_folder = root_folder
+        # at most 2 * workers files are queued or running, the producer waits for a free slot
+        self.pending_slots = threading.BoundedSemaphore(self.workers * 2)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.started_at = None
+        self.executor = None
+        self.stats = {
+            'files': 0,
+            'ingested': 0,
+            'unchanged': 0,
+            # rejected by the rabbit hole and queued to the raw github fallback
+            'fallback': 0,
+            'removed': 0,
+            'errors': 0,
+            'workers': self.workers,
+            'max_concurrency': 0,
+            'elapsed': 0.0,
+            'skipped': {},
+        }
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        if self.shared_executor is not None:
+            self.executor = self.shared_executor
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catoverflow-ingestion')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.shared_executor is not None:
+            # the executor belongs to somebody else, only the files of this pool are waited for
+            with self.lock:
+                futures = list(self.futures)
+            wait(futures)
+        else:
+            self.executor.shutdown(wait=True)
+        if self.manifest is not None:
+            # an interrupted run has not seen every file, pruning the manifest would forget the files it did not reach
+            if exc_type is None and not self.cancelled:
+                self.stats['removed'] = self.manifest.prune()
+            # the files ingested before a cancel or an error are not sent to the rabbit hole again by the next run
+            self.manifest.save()
+        self.stats['elapsed'] = round(time.monotonic() - self.started_at, 2)
+        log.info(f"ingestion statistics: {self.stats}")
+        return False
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def count(self, key, amount = 1):
+        """increment a statistics counter"""
+        with self.lock:
+            self.stats[key] += amount
+
+    def count_skipped(self, reason, amount = 1):
+        """increment the skip counter of a reason"""
+        with self.lock:
+            self.stats['skipped'][reason] = self.stats['skipped'].get(reason, 0) + amount
+
+    def prune_dirs(self, dirs, parent = ''):
+        """prune excluded directories in place during os.walk, parent is their folder relative to the repository root"""
+        if self.file_filter is None:
+            return
+        pruned = self.file_filter.prune_dirs(dirs, parent)
+        if pruned > 0:
+            self.count_skipped('directory', pruned)
+
+    def submit(self, file_path, ingest, *args, prepare = None, cleanup = False):
+        """
+        Queue a file for ingestion, blocking while the pool is full.
+        ingest(*args) returns 'fallback' when the file has been handed to the raw fallback instead of being ingested.
+        prepare is called by the worker before the checks (e.g. to spool the file on disk),
+        cleanup removes the file once it has been processed"""
+        if self.cancelled:
+            self.count_skipped('cancelled')
+            return
+        self.pending_slots.acquire()
+        self.count('files')
+        try:
+            future = self.executor.submit(self._work, file_path, ingest, args, prepare, cleanup)
+            if self.shared_executor is not None:
+                with self.lock:
+                    self.futures.add(future)
+                future.add_done_callback(self._forget_future)
+        except RuntimeError:
+            self.pending_slots.release()
+            raise
+
+    def _forget_future(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _work(self, file_path, ingest, args, prepare, cleanup):
+        with self.lock:
+            self.active += 1
+            self.stats['max_concurrency'] = max(self.stats['max_concurrency'], self.active)
+        started_at = time.monotonic()
+        status, size = 'error', None
+        try:
+            if self.cancelled:
+                self.count_skipped('cancelled')
+                status = 'cancelled'
+                return
+            if prepare is not None:
+                prepare()
+            if self.file_filter is not None:
+                relpath = os.path.relpath(file_path, self.root_folder) if self.root_folder else None
+                reason = self.file_filter.reject_reason(file_path, relpath)
+                if reason is not None:
+                    self.count_skipped(reason)
+                    status = f"skipped {reason}"
+                    return
+            entry = None
+            if self.manifest is not None:
+                changed, entry = self.manifest.check(file_path)
+                if not changed:
+                    self.count('unchanged')
+                    status = 'unchanged'
+                    return
+            size = os.path.getsize(file_path)
+            if ingest(*args) == 'fallback':
+                # the fallback records the file in the manifest once it has been ingested
+                if self.manifest is not None:
+                    self.manifest.defer(file_path, entry)
+                self.count('fallback')
+                status = 'fallback'
+                return
+            if self.manifest is not None:
+                self.manifest.record(file_path, entry)
+            self.count('ingested')
+            status = 'ingested'
+        except Exception as e:
+            log.error(f"error while ingesting file {file_path}: {e}")
+            self.count('errors')
+        finally:
+            if self.metrics is not None:
+                self.metrics.record('file', file_path, time.monotonic() - started_at, status, size)
+            if cleanup and os.path.exists(file_path):
+                os.remove(file_path)
+            with self.lock:
+                self.active -= 1
+            self.pending_slots.release()
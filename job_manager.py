@@ -0,0 +1,169 @@
+"""This class runs the long @getcode / @getcodedoc work in background jobs"""
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cat.log import log
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+class JobCancelled(Exception):
+    """raised inside a job when it has been cancelled"""
+
+class Job:
+    """A background job: status, current stage, last progress message and the chats that follow it"""
+
+    def __init__(self, job_id, kind, key, description):
+        self.id = job_id
+        self.kind = kind
+        # jobs with the same key (e.g. the same repository) are merged while they are active
+        self.key = key
+        self.description = description
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.last_message = ''
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.subscribers = []
+        # when set (a RunMetrics), every stage is timed and the run report is exported when the job is over
+        self.metrics = None
+
+    def subscribe(self, cat):
+        with self.lock:
+            if cat not in self.subscribers:
+                self.subscribers.append(cat)
+
+    def progress(self, message):
+        """send a progress message to every chat following the job"""
+        with self.lock:
+            self.last_message = message
+            subscribers = list(self.subscribers)
+        for cat in subscribers:
+            try:
+                cat.send_ws_message(content=f"[job {self.id}] {message}", msg_type="chat")
+            except Exception as e:
+                log.error(f"unable to send job {self.id} progress: {e}")
+
+    def set_stage(self, stage):
+        """move to the next stage, a cancelled job stops here"""
+        self.check_cancelled()
+        self.stage = stage
+        if self.metrics is not None:
+            self.metrics.stage(stage)
+        log.info(f"job {self.id} ({self.description}): {stage}")
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"job {self.id} has been cancelled")
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def summary(self):
+        """one line status of the job"""
+        end = self.finished_at or time.time()
+        elapsed = end - (self.started_at or end)
+        line = f"job {self.id} [{self.status}] {self.description} - stage: {self.stage}, elapsed: {elapsed:.0f}s"
+        if self.error:
+            line += f", error: {self.error}"
+        elif self.last_message and self.status in ACTIVE_STATUSES:
+            line += f", last update: {self.last_message[:200]}"
+        return line
+
+class JobManager:
+    """Bounded pool of background jobs with merging of duplicate requests, status and cooperative cancellation"""
+
+    def __init__(self, workers = 2, history = 50):
+        self.workers = max(1, int(workers))
+        self.history = history
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catoverflow-job')
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.ids = itertools.count(1)
+
+    def submit(self, kind, key, description, cat, run, metrics = None):
+        """
+        Start run(job) in background and return a (job, merged) tuple.
+        When an active job has the same key the chat just follows it and merged is True (metrics are then dropped)"""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.status in ACTIVE_STATUSES:
+                    job.subscribe(cat)
+                    return job, True
+            job = Job(next(self.ids), kind, key, description)
+            job.metrics = metrics
+            if metrics is not None:
+                metrics.stage('queued')
+            job.subscribe(cat)
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        self.executor.submit(self._run, job, run)
+        return job, False
+
+    def _run(self, job, run):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.check_cancelled()
+            job.result = run(job)
+            job.status = 'finished'
+            job.stage = 'finished'
+            job.progress(job.result)
+        except JobCancelled:
+            job.status = 'cancelled'
+            job.progress(f"{job.description} has been cancelled during the {job.stage} stage")
+        except Exception as e:
+            log.error(f"job {job.id} ({job.description}) failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.progress(f"{job.description} failed during the {job.stage} stage: {e}")
+        finally:
+            job.finished_at = time.time()
+            if job.metrics is not None:
+                self._finish_metrics(job)
+
+    def _finish_metrics(self, job):
+        """export the run report and send its summary table to the chats following the job"""
+        try:
+            job.metrics.finish(job.status)
+            job.progress(job.metrics.summary_table())
+        except Exception as e:
+            log.error(f"unable to export the metrics of job {job.id}: {e}")
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.status not in ACTIVE_STATUSES]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(finished) - self.history)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.id)
+
+    def cancel(self, job_id):
+        """ask a job to stop, return False if it is unknown or already over"""
+        job = self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return False
+        job.cancel_event.set()
+        return True
+
+_JOB_MANAGER = None
+_JOB_MANAGER_LOCK = threading.Lock()
+
+def get_job_manager(workers = 2):
+    """job manager shared by every tool of the plugin, the workers of the first call are kept"""
+    global _JOB_MANAGER
+    with _JOB_MANAGER_LOCK:
+        if _JOB_MANAGER is None:
+            _JOB_MANAGER = JobManager(workers)
+        return _JOB_MANAGER
@@ -0,0 +1,207 @@
+"""This class collects the timings and the counters of a @getcode / @getcodedoc run"""
+import os
+import re
+import json
+import time
+import threading
+from cat.log import log
+
+# slowest files / pages kept in the report for every kind of item
+SLOWEST_ITEMS = 10
+
+class RunMetrics:
+    """
+    Sequential stage spans, per item spans (files, pages), counters and GitHub rate limit waits of one run.
+    The run is exported as a JSON report, as Prometheus text and as a short summary table"""
+
+    def __init__(self, kind, target, report_folder = None, prometheus_file = None, scheduler = None):
+        self.kind = kind
+        self.target = target
+        self.report_folder = report_folder
+        self.prometheus_file = prometheus_file or None
+        # requests, retries and waits of the GitHub scheduler are read at the start and at the end of the run
+        # (the scheduler is shared: runs at the same time see each other's requests)
+        self.scheduler = scheduler
+        self.scheduler_counters = scheduler.counters() if scheduler is not None else None
+        self.started_at = time.time()
+        safe_target = re.sub(r'[^\w.-]+', '_', target).strip('_')[:60]
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{kind}-{safe_target}"
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.current_stage = None
+        self.stage_started_at = None
+        self.items = {}
+        self.counters = {}
+        self.status = 'running'
+        self.finished_at = None
+
+    def stage(self, name):
+        """close the current stage and open the next one"""
+        with self.lock:
+            self._close_stage()
+            self.current_stage = name
+            self.stage_started_at = time.monotonic()
+
+    def _close_stage(self):
+        if self.current_stage is not None:
+            elapsed = time.monotonic() - self.stage_started_at
+            self.stages[self.current_stage] = self.stages.get(self.current_stage, 0.0) + elapsed
+            self.current_stage = None
+
+    def record(self, kind, name, seconds, status = 'ok', size = None):
+        """record the span of a single item (a file, a page), kind groups the items in the report"""
+        with self.lock:
+            item = self.items.setdefault(kind, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0, 'statuses': {}, 'slowest': []})
+            item['count'] += 1
+            item['seconds'] += seconds
+            item['max_seconds'] = max(item['max_seconds'], seconds)
+            item['bytes'] += size or 0
+            item['statuses'][status] = item['statuses'].get(status, 0) + 1
+            item['slowest'].append((seconds, name, status))
+            if len(item['slowest']) > SLOWEST_ITEMS:
+                item['slowest'].sort(reverse=True)
+                del item['slowest'][SLOWEST_ITEMS:]
+
+    def count(self, name, amount = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_counters(self, prefix, stats):
+        """copy the numeric values of a statistics dict (e.g. IngestionPool.stats), nested dicts included"""
+        for key, value in stats.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, dict):
+                self.add_counters(name, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.count(name, value)
+
+    def finish(self, status):
+        """close the run and export it, return the report"""
+        with self.lock:
+            self._close_stage()
+            self.status = status
+            self.finished_at = time.time()
+        if self.scheduler is not None:
+            for key, value in self.scheduler.counters().items():
+                self.count(f"github_{key}", round(value - self.scheduler_counters.get(key, 0), 2))
+        report = self.report()
+        if self.report_folder is not None:
+            self.save(report)
+        if self.prometheus_file is not None:
+            write_prometheus(self.prometheus_file, report)
+        return report
+
+    def report(self):
+        with self.lock:
+            items = {}
+            for kind, item in self.items.items():
+                items[kind] = {
+                    'count': item['count'],
+                    'seconds': round(item['seconds'], 3),
+                    'avg_seconds': round(item['seconds'] / item['count'], 3) if item['count'] else 0.0,
+                    'max_seconds': round(item['max_seconds'], 3),
+                    'bytes': item['bytes'],
+                    'statuses': dict(item['statuses']),
+                    'slowest': [{'name': name, 'seconds': round(seconds, 3), 'status': status}
+                                for seconds, name, status in sorted(item['slowest'], reverse=True)],
+                }
+            end = self.finished_at or time.time()
+            return {
+                'run_id': self.run_id,
+                'kind': self.kind,
+                'target': self.target,
+                'status': self.status,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': round(end - self.started_at, 3),
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'items': items,
+                'counters': {name: round(value, 3) if isinstance(value, float) else value for name, value in sorted(self.counters.items())},
+            }
+
+    def save(self, report):
+        """write the report in the report folder, the file is replaced atomically"""
+        try:
+            os.makedirs(self.report_folder, exist_ok=True)
+            path = f"{self.report_folder}/{self.run_id}.json"
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=1)
+            os.replace(tmp_path, path)
+            log.info(f"run report saved in {path}")
+        except OSError as e:
+            log.error(f"unable to save the run report {self.run_id}: {e}")
+
+    def summary_table(self):
+        """short markdown table of the stages and of the items of the run"""
+        report = self.report()
+        lines = [f"Run {report['run_id']} ({report['status']}, {report['elapsed']:.1f}s)", "", "| stage | seconds |", "|---|---:|"]
+        for name, seconds in report['stages'].items():
+            lines.append(f"| {name} | {seconds:.2f} |")
+        for kind, item in report['items'].items():
+            statuses = ', '.join(f"{status}: {count}" for status, count in sorted(item['statuses'].items()))
+            line = f"{kind}s: {item['count']} ({statuses}), {item['bytes'] / 1024:.0f} KB, avg {item['avg_seconds']:.2f}s"
+            if item['slowest']:
+                line += f", slowest {item['slowest'][0]['name']} ({item['slowest'][0]['seconds']:.1f}s)"
+            lines += ["", line]
+        counters = report['counters']
+        if 'github_requests' in counters:
+            lines += ["", f"GitHub: {counters['github_requests']} requests, {counters.get('github_retries', 0)} retries, "
+                          f"{counters.get('github_wait_seconds', 0):.1f}s waiting for the rate limit"]
+        return "\n".join(lines)
+
+# kind -> report of the last run, the Prometheus file always describes the last run of every kind
+_LAST_RUNS = {}
+_LAST_RUNS_LOCK = threading.Lock()
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text(reports):
+    """Prometheus text exposition of the last run of every kind"""
+    metrics = {
+        'catoverflow_run_seconds': ('wall clock time of the last run', []),
+        'catoverflow_run_timestamp_seconds': ('end of the last run', []),
+        'catoverflow_run_success': ('1 when the last run finished without errors', []),
+        'catoverflow_stage_seconds': ('time spent in every stage of the last run', []),
+        'catoverflow_items': ('files and pages processed by the last run, per status', []),
+        'catoverflow_item_seconds': ('time spent on the files and pages of the last run', []),
+        'catoverflow_item_bytes': ('bytes of the files and pages of the last run', []),
+        'catoverflow_counter': ('counters of the last run', []),
+    }
+    for kind, report in sorted(reports.items()):
+        labels = f'kind="{_label(kind)}"'
+        metrics['catoverflow_run_seconds'][1].append((labels, report['elapsed']))
+        metrics['catoverflow_run_timestamp_seconds'][1].append((labels, report['finished_at'] or report['started_at']))
+        metrics['catoverflow_run_success'][1].append((labels, 1 if report['status'] == 'finished' else 0))
+        for stage, seconds in report['stages'].items():
+            metrics['catoverflow_stage_seconds'][1].append((f'{labels},stage="{_label(stage)}"', seconds))
+        for item_kind, item in report['items'].items():
+            item_labels = f'{labels},item="{_label(item_kind)}"'
+            for status, count in item['statuses'].items():
+                metrics['catoverflow_items'][1].append((f'{item_labels},status="{_label(status)}"', count))
+            metrics['catoverflow_item_seconds'][1].append((item_labels, item['seconds']))
+            metrics['catoverflow_item_bytes'][1].append((item_labels, item['bytes']))
+        for name, value in report['counters'].items():
+            metrics['catoverflow_counter'][1].append((f'{labels},name="{_label(name)}"', value))
+    lines = []
+    for name, (help_text, samples) in metrics.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path, report):
+    """rewrite the Prometheus text file (e.g. for the node_exporter textfile collector) with the last run of every kind"""
+    with _LAST_RUNS_LOCK:
+        _LAST_RUNS[report['kind']] = report
+        text = prometheus_text(_LAST_RUNS)
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.error(f"unable to write the prometheus metrics in {path}: {e}")
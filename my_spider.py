@@ -1,51 +1,209 @@
+import hashlib
 import traceback
-from urllib.parse import urlparse
+from datetime import datetime
+from urllib.parse import urlparse, urldefrag
 from pathlib import Path
 import scrapy
+from scrapy.http import TextResponse
 from scrapy.linkextractors import LinkExtractor
 from scrapy.spiders import CrawlSpider, Rule
-from scrapy.extensions.logstats import LogStats
-from scrapy.extensions.closespider import CloseSpider
-from scrapy.spidermiddlewares.depth import DepthMiddleware
-from scrapy.crawler import CrawlerProcess, CrawlerRunner
-from twisted.internet import reactor
-from multiprocessing import Process, Queue
+from scrapy.extensions.throttle import AutoThrottle
+from cat.log import log
+from .url_utils import canonicalize_url
+from .crawl_cache import CrawlCache, ConditionalFetchMiddleware
+from .sitemap_discovery import parse_robots, sitemap_entries, parse_lastmod, MAX_CRAWL_DELAY
+from .crawl_frontier import CrawlFrontier, DEFAULT_EXCLUDE_URL_PATTERNS
+from .crawl_service import get_crawl_service
 # import pdb
 
 class MySpider(CrawlSpider):
     name = 'my_spider'
 
-    def __init__(self, url, found_pages, n=3, max_pages=10, save_pages=False, output_folder = 'pages', *args, **kwargs):
+    custom_settings = {
+        # revalidates the pages of the crawl cache with conditional requests
+        "DOWNLOADER_MIDDLEWARES": {ConditionalFetchMiddleware: 580},
+    }
+
+    def __init__(self, url, found_pages, n=3, max_pages=10, save_pages=False, output_folder = 'pages', page_queue = None, cache_path = None,
+                 use_sitemap = True, include_patterns = '', exclude_patterns = DEFAULT_EXCLUDE_URL_PATTERNS, *args, **kwargs):
         super(MySpider, self).__init__(*args, **kwargs)
+        # when set, every page is sent to the parent process as soon as it is found
+        self.page_queue = page_queue
         self.start_urls = [url]
         domain = urlparse(url).netloc
-        self.allowed_domains = [domain]
+        # the offsite filter takes host names, a netloc with a port would filter out every link
+        self.allowed_domains = [urlparse(url).hostname]
         self.n = int(n)
         self.max_pages = int(max_pages)
         self.save_pages = save_pages in [True, 'True', 'true', 't', 1, '1'] 
         self.output_folder = output_folder
         Path(f"{self.output_folder}").mkdir(parents=True, exist_ok=True)
-        if self.save_pages:
+        # when set, the pages of past crawls are revalidated and the unchanged ones are reported as such
+        self.cache = CrawlCache(cache_path) if cache_path else None
+        if self.save_pages or self.cache is not None:
             Path(f"{self.output_folder}/{domain}").mkdir(parents=True, exist_ok=True)
         self.found_pages = found_pages  # Initialize an empty set to store unique pages
-        self.custom_settings = {
+        self.saved_pages = {}  # url -> file with the body downloaded by the spider
+        # canonical urls already requested, the variants of a page (slash, index.html, tracking parameters) are requested once
+        self.requested = {canonicalize_url(url)}
+        # robots.txt and sitemap.xml seed the crawl, following links remains the fallback
+        self.use_sitemap = use_sitemap in [True, 'True', 'true', 't', 1, '1']
+        self.robots = None
+        self.seeds = 0
+        # low-value pages are skipped, the most useful ones are requested first
+        self.frontier = CrawlFrontier(url, include_patterns, exclude_patterns)
+
+    @classmethod
+    def with_settings(cls, n=3, max_pages=10, concurrent_requests=8, autothrottle_target=2.0):
+        """subclass carrying the settings of one crawl, Scrapy reads custom_settings from the class before creating the spider"""
+        custom_settings = dict(cls.custom_settings)
+        custom_settings.update({
             "LOG_ENABLED": False,
             "LOG_LEVEL": "INFO",
-            "CLOSESPIDER_ITEMCOUNT": self.max_pages,
-            "CLOSESPIDER_PAGECOUNT": self.max_pages,
-            "DEPTH_LIMIT": self.n,
+            # the spider stops itself after max_pages pages, this is only a safety net
+            # (robots.txt, sitemaps, redirects and duplicate urls are responses too)
+            "CLOSESPIDER_PAGECOUNT": 2 * int(max_pages) + 10,
+            "DEPTH_LIMIT": int(n),
+            "CONCURRENT_REQUESTS": int(concurrent_requests),
+            "CONCURRENT_REQUESTS_PER_DOMAIN": int(concurrent_requests),
+            # adapts the delay to the latency of the site, aiming at autothrottle_target parallel requests
+            "AUTOTHROTTLE_ENABLED": float(autothrottle_target) > 0,
+            "AUTOTHROTTLE_TARGET_CONCURRENCY": max(float(autothrottle_target), 0.1),
+            "AUTOTHROTTLE_START_DELAY": 0.5,
+            # never below the crawl-delay a robots.txt may ask for
+            "AUTOTHROTTLE_MAX_DELAY": MAX_CRAWL_DELAY,
             "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7"
-        }
-    
+        })
+        return type(cls.__name__, (cls,), {'custom_settings': custom_settings})
+
     rules = (
-        Rule(LinkExtractor(), callback='parse_item', follow=True),
+        Rule(LinkExtractor(), callback='parse_item', follow=True, process_links='canonicalize_links', process_request='prioritize'),
     )
 
-    extensions = {
-        scrapy.extensions.closespider.CloseSpider: 1,
-        scrapy.spidermiddlewares.depth.DepthMiddleware: 1,
-        scrapy.extensions.logstats.LogStats: 0
-    }
+    def canonicalize_links(self, links):
+        """
+        request every page once: fragments, tracking parameters and slash variants lead to the same canonical url,
+        the link itself is requested as written since its canonical form may redirect or not exist on static hosts"""
+        unique_links = []
+        for link in links:
+            link.url = urldefrag(link.url).url
+            key = canonicalize_url(link.url)
+            # pages disallowed by robots.txt or excluded by the url patterns or already reported
+            # (e.g. unchanged according to the sitemap) are not requested
+            if key in self.requested or key in self.found_pages or not self.frontier.allowed(key) or not self.allowed_by_robots(link.url):
+                continue
+            self.requested.add(key)
+            unique_links.append(link)
+        return unique_links
+
+    def prioritize(self, request, response):
+        return request.replace(priority=self.frontier.score(request.url))
+
+    def allowed_by_robots(self, url):
+        return self.robots is None or self.robots.can_fetch('*', url)
+
+    def start_requests(self):
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True)
+        if self.use_sitemap:
+            parts = urlparse(self.start_urls[0])
+            yield scrapy.Request(f"{parts.scheme}://{parts.netloc}/robots.txt", callback=self.parse_robots, dont_filter=True,
+                                 priority=1000, meta={'handle_httpstatus_all': True})
+
+    async def start(self):
+        # Scrapy 2.13+ reads the start requests from start(), older versions from start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def parse_robots(self, response):
+        text = response.text if response.status == 200 and isinstance(response, TextResponse) else ''
+        self.robots, sitemaps, delay = parse_robots(text, self.start_urls[0])
+        if delay:
+            # politeness: every request to the site is spaced by the crawl-delay asked by robots.txt
+            self.download_delay = delay
+            for slot in self.crawler.engine.downloader.slots.values():
+                slot.delay = delay
+            # AutoThrottle rewrites the slot delays after every response, the crawl-delay becomes its floor
+            for extension in self.crawler.extensions.middlewares:
+                if isinstance(extension, AutoThrottle):
+                    extension.mindelay = max(extension.mindelay, delay)
+                    extension.maxdelay = max(extension.maxdelay, delay)
+        for sitemap_url in sitemaps:
+            yield scrapy.Request(sitemap_url, callback=self.parse_sitemap, priority=1000, meta={'handle_httpstatus_all': True})
+
+    def parse_sitemap(self, response):
+        if response.status != 200:
+            return
+        try:
+            sitemap_type, entries = sitemap_entries(response.body)
+        except Exception as e:
+            log.error(f"unable to read sitemap {response.url}: {e}")
+            return
+        if sitemap_type == 'sitemapindex':
+            for entry in entries:
+                if 'loc' in entry:
+                    yield scrapy.Request(entry['loc'], callback=self.parse_sitemap, priority=1000, meta={'handle_httpstatus_all': True})
+            return
+
+        domain = urlparse(self.start_urls[0]).netloc
+        candidates = []
+        for entry in entries:
+            loc = entry.get('loc', '').strip()
+            page_url = canonicalize_url(loc)
+            if urlparse(page_url).netloc != domain or page_url in self.found_pages or page_url in self.requested \
+                    or not self.frontier.allowed(page_url) or not self.allowed_by_robots(loc):
+                continue
+            candidates.append((self.frontier.score(page_url, entry.get('priority')), page_url, loc, entry.get('lastmod')))
+        # the crawl stops after max_pages pages, only the most relevant seeds are worth scheduling
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        for priority, page_url, loc, lastmod in candidates[:max(0, self.max_pages - self.seeds)]:
+            self.seeds += 1
+            self.requested.add(page_url)
+            cached_body = self.unchanged_since_last_crawl(page_url, lastmod)
+            if cached_body is not None:
+                if self.save_pages:
+                    self.saved_pages[page_url] = cached_body
+                self.report_page(page_url, loc, self.saved_pages.get(page_url), False)
+                continue
+            # no callback: the page goes through the crawl rules like the start url, its links are followed too
+            yield scrapy.Request(loc, priority=priority)
+
+    def unchanged_since_last_crawl(self, page_url, lastmod):
+        """return the cached body of a page whose sitemap lastmod is older than its last fetch, None if it must be fetched"""
+        lastmod = parse_lastmod(lastmod)
+        entry = self.cache.get(page_url) if self.cache is not None else None
+        if lastmod is None or entry is None or not entry.get('fetched_at') or not Path(entry.get('body') or '').exists():
+            return None
+        if lastmod > datetime.fromisoformat(entry['fetched_at']):
+            return None
+        with self.cache.lock:
+            self.cache.stats['unchanged'] += 1
+        return entry['body']
+
+    def report_page(self, page_url, fetch_url, body_path, changed):
+        """
+        add a page to the found pages (by canonical url), send the url it was fetched from to the parent process
+        and stop the crawl at max_pages"""
+        if self.page_queue is not None and page_url not in self.found_pages:
+            self.page_queue.put(('page', fetch_url, body_path, changed))
+        self.found_pages.add(page_url)
+        if (len(self.found_pages) >= self.max_pages):
+            self.crawler.engine.close_spider(self, "max page limit reached")
+
+    def parse_start_url(self, response):
+        # the start url and the sitemap pages are documentation pages too
+        return self.parse_item(response)
+
+    def page_url(self, response):
+        """canonical url of a page, the one declared by <link rel=canonical> when it is on the same site"""
+        page_url = canonicalize_url(response.url)
+        if isinstance(response, TextResponse):
+            canonical = response.xpath('//link[@rel="canonical"]/@href').get()
+            if canonical:
+                canonical = canonicalize_url(response.urljoin(canonical))
+                if urlparse(canonical).netloc == urlparse(page_url).netloc:
+                    page_url = canonical
+        return page_url
 
     def parse_item(self, response):
         if (len(self.found_pages) >= self.max_pages):
@@ -55,14 +213,27 @@ class MySpider(CrawlSpider):
 
         #print(f'page found: {response.url}')
         domain = urlparse(self.start_urls[0]).netloc
-        if self.save_pages:
-            filename = f"{self.output_folder}/{domain}/page_{response.url.split('/')[-2]}.html"
-            with open(filename, 'wb') as f:
-                f.write(response.body)
-        self.found_pages.add(response.url)  # Add the page url to the set
+        page_url = self.page_url(response)
+        if page_url not in self.found_pages:
+            changed = True
+            if (self.save_pages or self.cache is not None) and isinstance(response, TextResponse):
+                # the body is kept so that static pages do not need to be rendered again by a browser
+                # and so that a page revalidated by the crawl cache can still be parsed
+                filename = f"{self.output_folder}/{domain}/page_{hashlib.sha1(page_url.encode('utf-8')).hexdigest()[:16]}.html"
+                body = response.text.encode('utf-8')
+                if 'cached' not in response.flags:
+                    with open(filename, 'wb') as f:
+                        f.write(body)
+                if self.save_pages:
+                    self.saved_pages[page_url] = filename
+                if self.cache is not None:
+                    changed = self.cache.update(page_url, body, filename,
+                                                etag=response.headers.get('ETag', b'').decode('latin-1') or None,
+                                                last_modified=response.headers.get('Last-Modified', b'').decode('latin-1') or None)
+            # response.url is the url after the redirects, the one a browser can render again
+            self.report_page(page_url, response.url, self.saved_pages.get(page_url), changed)
         if (len(self.found_pages) >= self.max_pages):
             #print('max page limit reached')
-            self.crawler.engine.close_spider(self, "max page limit reached")
             return
         
         if response.meta.get('depth', 0) < self.n:
@@ -81,47 +252,39 @@ class MySpider(CrawlSpider):
         list_filename = Path(f"{self.output_folder}/{domain}.txt")
 
         with open(list_filename, 'wb') as f:
-            f.write(b'\n'.join(self.start_urls[0].encode('utf-8')))
+            f.write(self.start_urls[0].encode('utf-8'))
             for page in result['pages']:
                 f.write(b'\n')
                 f.write(page.encode('utf-8'))
+        if self.cache is not None:
+            self.cache.save()
+            result['cache'] = self.cache.stats
         print(result)
 
     @classmethod
-    def f(self, q, url, found_pages, n, max_pages, save_pages, output_folder):
-        try:
-            runner = CrawlerRunner()
-            deferred = runner.crawl(MySpider, url, found_pages, n=3, max_pages=10, save_pages=False)
-            deferred.addBoth(lambda _: reactor.stop())
-            reactor.run()
-            q.put(found_pages)
-        except Exception as e:
-            q.put(e)
+    def runme(self, url, found_pages, n=3, max_pages=10, save_pages=False, output_folder = 'pages', timeout = 600):
+        """run a crawl in the crawl worker and return the set of found pages"""
+        for page_url, body_path, changed in MySpider.stream(url, n=n, max_pages=max_pages, save_pages=save_pages, output_folder=output_folder,
+                                                            timeout=timeout):
+            found_pages.add(page_url)
+        return found_pages
 
     @classmethod
-    def runme(self, url, found_pages, n=3, max_pages=10, save_pages=False, output_folder = 'pages'):
-        q = Queue()
-        p = Process(target=MySpider.f, args=(q, url, found_pages, n, max_pages, save_pages, output_folder))
-        p.start()
-        result = q.get()
-        p.join()
-        # print("----")
-        # print(result)
-        # print("----")
-        return result
-
-        # runner = CrawlerRunner()
-        # d = runner.crawl(MySpider, url, found_pages, n=3, max_pages=10, save_pages=False)
-        # d.addBoth(lambda _: reactor.stop())
-        # reactor.run()
-        # return found_pages
+    def stream(self, url, n=3, max_pages=10, save_pages=False, output_folder = 'pages', cache_path = None, use_sitemap = True, timeout = 600,
+               include_patterns = '', exclude_patterns = DEFAULT_EXCLUDE_URL_PATTERNS, concurrent_requests = 8, autothrottle_target = 2.0):
+        """
+        run a crawl in the crawl worker yielding (url, body_path, changed) tuples while pages are found,
+        changed is False for the pages the crawl cache found identical to the last crawl"""
+        yield from get_crawl_service().crawl(url, timeout=timeout, concurrent_requests=concurrent_requests, autothrottle_target=autothrottle_target,
+                                             n=n, max_pages=max_pages, save_pages=save_pages, output_folder=output_folder,
+                                             cache_path=cache_path, use_sitemap=use_sitemap,
+                                             include_patterns=include_patterns, exclude_patterns=exclude_patterns)
 
 # Usage:
 # Run the spider using the following command:
 # scrapy runspider my_scraper.py -a url=https://surveyjs.io/documentation -a n=3 -a max_pages=10 -a save_pages=False --nolog
 
 if __name__ == "__main__":
-    from scrapy.crawler import CrawlerProcess
     url = 'https://surveyjs.io/documentation'
     found_pages = set()
     # runner = CrawlerRunner()
@@ -1,56 +1,230 @@
+import os
 import asyncio
 from playwright.async_api import async_playwright
-import random
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from cat.log import log
+from .render_heuristics import needs_js_rendering
+from .url_utils import canonicalize_url, url_to_path, PageIndex
 # import subprocess
 
 class PageDownloader:
     """This class is the base class for downloading a page source using  Playwright library"""
 
-    def __init__(self, output_folder, page_urls, use_chrome = True, use_firefox = False, use_webkit = False):
+    def __init__(self, output_folder, page_urls, use_chrome = True, use_firefox = False, use_webkit = False, concurrency = 4, page_timeout = 30,
+                 static_pages = None, extractor = None):
         self.page_urls = page_urls
+        # when set, only the main content of every page is saved, as markdown
+        self.extractor = extractor
+        # url -> body already downloaded by the spider, static pages are saved without a browser
+        self.static_pages = static_pages or {}
         self.output_folder = output_folder
+        # canonical url -> saved file, files mirror the url paths so different pages never overwrite each other
+        self.page_index = PageIndex(output_folder)
         self.use_chrome = use_chrome
         self.use_firefox = use_firefox
         self.use_webkit = use_webkit
+        self.concurrency = max(1, int(concurrency))
+        # seconds
+        self.page_timeout = max(1, int(page_timeout))
+        # launched by open_browsers, only when a page needs javascript
+        self.browsers = []
+        self.contexts = []
         if not (self.use_chrome or self.use_firefox or self.use_webkit):
-           raise Exception('please activate at least one browser engine')         
-            
-        # subprocess.run(["playwright", "install"]) 
-        # subprocess.run(["playwright", "install-deps"]) 
-
-    async def save_page(self, page_url, browser):
-        page = await browser.new_page()
-        await page.goto(page_url)
-        await page.wait_for_load_state('networkidle')
-        html = await page.content()
-        #save html content into output folder
-        with open(f"{self.output_folder}/{page_url.split('/')[-2]}.html", "w") as f:
-            f.write(html)
-        await page.close()
+           raise Exception('please activate at least one browser engine')
+
+        # subprocess.run(["playwright", "install"])
+        # subprocess.run(["playwright", "install-deps"])
+
+    async def save_page(self, page_url, context):
+        page = await context.new_page()
+        try:
+            await page.goto(page_url, timeout=self.page_timeout * 1000)
+            try:
+                await page.wait_for_load_state('networkidle', timeout=self.page_timeout * 1000)
+            except PlaywrightTimeoutError:
+                # pages that keep polling never become idle, their current content is good enough
+                log.info(f"network is still busy after {self.page_timeout}s, saving page anyway: {page_url}")
+            html = await page.content()
+            return self.write_page(page_url, html)
+        finally:
+            await page.close()
+
+    def write_page(self, page_url, html):
+        """save html content (or its markdown conversion) into output folder, return the file path"""
+        content, extension = html, '.html'
+        if self.extractor is not None:
+            try:
+                markdown = self.extractor.extract(html, page_url)
+                if markdown is not None:
+                    content, extension = markdown, '.md'
+            except Exception as e:
+                log.error(f"unable to extract the content of {page_url}, saving the whole page: {e}")
+        file_path = self.page_index.claim(page_url, f"{self.output_folder}/{url_to_path(page_url, extension)}")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as f:
+            f.write(content)
+        return file_path
+
+    def unique_urls(self, page_urls):
+        """urls of a list of pages, every page (by canonical url) once, as first written"""
+        unique_urls = {}
+        for page_url in page_urls:
+            unique_urls.setdefault(canonicalize_url(page_url), page_url)
+        return list(unique_urls.values())
+
+    def save_static_page(self, page_url, body_path):
+        """save a page downloaded by the spider if it does not need javascript, return the file path or None"""
+        if body_path is None or not os.path.exists(body_path):
+            return None
+        with open(body_path, 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+        needs_rendering, reason = needs_js_rendering(html)
+        if needs_rendering:
+            log.info(f"page needs javascript rendering ({reason}): {page_url}")
+            return None
+        return self.write_page(page_url, html)
+
+    def save_static_pages(self):
+        """save the pages that do not need javascript, return the urls that must be rendered by a browser"""
+        render_urls = []
+        static_pages = {canonicalize_url(page_url): body_path for page_url, body_path in self.static_pages.items()}
+        for page_url in self.unique_urls(self.page_urls):
+            if self.save_static_page(page_url, static_pages.get(canonicalize_url(page_url))) is None:
+                render_urls.append(page_url)
+        return render_urls
 
     def save_pages(self):
         #downloader = PageDownloader(output_folder=output_folder, page_urls=output, use_chrome=use_chrome, use_firefox=use_firefox, use_webkit=use_webkit)
         result = asyncio.run(self.launch_download())
         return result
 
-    async def launch_download(self):
-        """Download a repository from url"""
-        async with async_playwright() as p:
-            browsers = []
+    async def open_browsers(self, p):
+        """launch every enabled engine and a pool of reusable contexts spread over them, nothing is left open if a launch fails"""
+        self.browsers = []
+        self.contexts = []
+        try:
             if self.use_chrome:
                 chromium = await p.chromium.launch()
-                browsers.append(chromium)
+                self.browsers.append(chromium)
             if self.use_firefox:
                 firefox = await p.firefox.launch()
-                browsers.append(firefox)
+                self.browsers.append(firefox)
             if self.use_webkit:
                 webkit = await p.webkit.launch()
-                browsers.append(webkit)
+                self.browsers.append(webkit)
+
+            contexts_per_browser = -(-self.concurrency // len(self.browsers))
+            for _ in range(contexts_per_browser):
+                for browser in self.browsers:
+                    self.contexts.append(await browser.new_context())
+        except Exception:
+            await self.close_browsers()
+            raise
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.rendered = 0
+
+    async def close_browsers(self):
+        contexts, browsers = self.contexts, self.browsers
+        self.contexts, self.browsers = [], []
+        for closable in contexts + browsers:
+            try:
+                await closable.close()
+            except Exception as e:
+                log.error(f"unable to close the browser: {e}")
+
+    async def render(self, page_url):
+        """render a page with the next context of the pool, return the file path or None if it failed"""
+        async with self.semaphore:
+            # pages are assigned round robin to the contexts
+            context = self.contexts[self.rendered % len(self.contexts)]
+            self.rendered += 1
+            try:
+                # hard limit on top of the playwright timeouts, a stuck page must not stall the batch
+                return await asyncio.wait_for(self.save_page(page_url, context), timeout=self.page_timeout * 3)
+            except Exception as e:
+                log.error(f"unable to save page {page_url}: {e}")
+                return None
+
+    async def launch_download(self):
+        """Download a repository from url"""
+        render_urls = self.save_static_pages()
+        static_count = len(self.unique_urls(self.page_urls)) - len(render_urls)
+        if len(render_urls) == 0:
+            self.page_index.save()
+            return f"{static_count} static pages were saved, no page needed a browser"
+
+        async with async_playwright() as p:
+            try:
+                await self.open_browsers(p)
+            except Exception as e:
+                log.error(f"unable to launch the browsers, {len(render_urls)} pages needing javascript are not saved: {e}")
+                self.page_index.save()
+                return f"{static_count} static pages were saved, {len(render_urls)} failed (unable to launch the browsers: {e})"
+            try:
+                saved = await asyncio.gather(*(self.render(page_url) for page_url in render_urls))
+            finally:
+                await self.close_browsers()
+                self.page_index.save()
+            rendered = len([file_path for file_path in saved if file_path is not None])
+            return (f"{static_count} static pages were saved, {rendered} pages were rendered, {len(saved) - rendered} failed "
+                    f"(concurrency: {self.concurrency}, engines: {len(self.browsers)})")
+
+    async def stream_download(self, page_queue, on_saved):
+        """
+        Save the pages put in page_queue as (url, body_path) tuples until a None is received.
+        Static pages are saved right away, the browsers are launched only when the first page needs javascript.
+        on_saved(url, file_path, rendered) is called (in a worker thread) for every saved page"""
+        loop = asyncio.get_running_loop()
+        tasks = []
+        playwright = None
+        launch_error = None
+        stats = {'static': 0, 'rendered': 0, 'failed': 0, 'duplicates': 0}
+        seen = set()
+
+        async def render_and_notify(page_url):
+            file_path = await self.render(page_url)
+            if file_path is None:
+                stats['failed'] += 1
+                return
+            stats['rendered'] += 1
+            await loop.run_in_executor(None, on_saved, page_url, file_path, True)
 
-            browser = random.choice(browsers)    
-            for page_url in self.page_urls:
-                await self.save_page(page_url, browser)
-            return "all pages where saved"
+        try:
+            while True:
+                item = await page_queue.get()
+                if item is None:
+                    break
+                page_url, body_path = item
+                # pages are rendered at their own url, the canonical url only identifies them
+                key = canonicalize_url(page_url)
+                if key in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(key)
+                file_path = self.save_static_page(page_url, body_path)
+                if file_path is not None:
+                    stats['static'] += 1
+                    await loop.run_in_executor(None, on_saved, page_url, file_path, False)
+                    continue
+                if playwright is None and launch_error is None:
+                    try:
+                        playwright = await async_playwright().start()
+                        await self.open_browsers(playwright)
+                    except Exception as e:
+                        # the static pages are still saved, the pages needing javascript are counted as failed
+                        log.error(f"unable to launch the browsers, pages needing javascript are not saved: {e}")
+                        launch_error = e
+                if launch_error is not None:
+                    stats['failed'] += 1
+                    continue
+                tasks.append(asyncio.ensure_future(render_and_notify(page_url)))
+            await asyncio.gather(*tasks)
+        finally:
+            if playwright is not None:
+                await self.close_browsers()
+                await playwright.stop()
+            self.page_index.save()
+        return stats
 
 if __name__ == "__main__":
     pages = ['https://cheshire-cat-ai.github.io/docs/']
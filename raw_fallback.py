@@ -0,0 +1,107 @@
+"""This class ingests from raw.githubusercontent.com the files the rabbit hole could not ingest from disk"""
+import time
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cat.log import log
+from .github_scheduler import get_scheduler, PRIORITY_DOWNLOAD, GITHUB_RAW_URL
+
+DOWNLOAD_TIMEOUT = (10, 60)
+
+class RawFallback:
+    """
+    Batched fallback stage: files rejected by the rabbit hole are collected during ingestion,
+    then fetched concurrently over the pooled scheduler session with a single GET each,
+    and the downloaded bytes are ingested directly (no second download by the rabbit hole)"""
+
+    def __init__(self, repository_name, branch, workers = 8, github_key = None, dedup = None, manifest = None, metrics = None):
+        self.repository_name = repository_name
+        self.branch = branch
+        self.workers = max(1, int(workers))
+        self.github_key = github_key
+        self.dedup = dedup
+        # files are recorded in the manifest only once ingested from github, the next run tries the others again
+        self.manifest = manifest
+        # when set (a RunMetrics), every file is recorded with its time and outcome
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.files = []
+        self.stats = {'files': 0, 'ingested': 0, 'duplicates': 0, 'missing': 0, 'errors': 0, 'cancelled': 0}
+
+    def raw_url(self, relpath, file):
+        """raw url of a repository file, relpath is relative to the repository root (empty for top level files)"""
+        path = '/'.join(part for part in (relpath.strip('/'), file) if part)
+        return f"{GITHUB_RAW_URL}/{self.repository_name}/{quote(self.branch, safe='/')}/{quote(path)}"
+
+    def add(self, file_path, relpath, file):
+        """queue a file for the fallback stage"""
+        with self.lock:
+            self.files.append((file_path, self.raw_url(relpath, file)))
+
+    def _ingest(self, cat, raw_url, cancel_event):
+        if cancel_event is not None and cancel_event.is_set():
+            return 'cancelled'
+        headers = {'Authorization': f"token {self.github_key}"} if self.github_key else {}
+        r = get_scheduler().request('GET', raw_url, priority=PRIORITY_DOWNLOAD, resource='raw', headers=headers, timeout=DOWNLOAD_TIMEOUT)
+        if r.status_code == 404:
+            return 'missing'
+        r.raise_for_status()
+        content_type = r.headers.get('Content-Type', 'text/plain').split(';')[0].strip() or 'text/plain'
+        docs = cat.rabbit_hole.string_to_docs(cat, r.content, source=raw_url, content_type=content_type)
+        fingerprints = []
+        if self.dedup is not None:
+            docs, fingerprints = self.dedup.filter_documents(docs)
+            if len(docs) == 0:
+                return 'duplicates'
+        try:
+            cat.rabbit_hole.store_documents(cat, docs, raw_url)
+        except Exception:
+            if self.dedup is not None:
+                self.dedup.forget_chunks(fingerprints)
+            raise
+        return 'ingested'
+
+    def _timed_ingest(self, cat, raw_url, cancel_event):
+        started_at = time.monotonic()
+        outcome = 'errors'
+        try:
+            outcome = self._ingest(cat, raw_url, cancel_event)
+            return outcome
+        finally:
+            if self.metrics is not None:
+                self.metrics.record('fallback file', raw_url, time.monotonic() - started_at, outcome)
+
+    def run(self, cat, cancel_event = None):
+        """fetch and ingest every queued file, return the statistics"""
+        with self.lock:
+            files, self.files = self.files, []
+        self.stats['files'] += len(files)
+        if len(files) == 0:
+            return self.stats
+        log.info(f"raw github fallback for {len(files)} files of {self.repository_name}")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catoverflow-raw') as executor:
+            futures = {}
+            for file_path, raw_url in files:
+                futures[executor.submit(self._timed_ingest, cat, raw_url, cancel_event)] = (file_path, raw_url)
+            for future in as_completed(futures):
+                file_path, raw_url = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    log.error(f"raw github fallback failed for {raw_url}: {e}")
+                    outcome = 'errors'
+                if outcome == 'missing':
+                    log.error(f"raw github url not found: {raw_url}")
+                if self.manifest is not None:
+                    self.manifest.complete(file_path, outcome in ('ingested', 'duplicates'))
+                with self.lock:
+                    self.stats[outcome] += 1
+        if self.manifest is not None:
+            self.manifest.save()
+        return self.stats
+
+    def summary(self):
+        """one line report of the fallback stage"""
+        stats = self.stats
+        return (f"raw github fallback: {stats['ingested']}/{stats['files']} files ingested, {stats['duplicates']} duplicates, "
+                f"{stats['missing']} not found, {stats['errors']} errors")
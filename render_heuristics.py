@@ -0,0 +1,44 @@
+"""Cheap heuristics to decide whether a crawled page needs a headless browser"""
+import re
+
+SCRIPT_STYLE_PATTERN = re.compile(r'<(script|style|noscript|template)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+BODY_PATTERN = re.compile(r'<body\b[^>]*>(.*)</body\s*>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+NOSCRIPT_PATTERN = re.compile(r'<noscript\b[^>]*>(.*?)</noscript\s*>', re.IGNORECASE | re.DOTALL)
+
+# empty mount points of the most common single page application frameworks
+SPA_ROOT_PATTERNS = (
+    re.compile(r'<div\s+id=["\'](root|app|__next|__nuxt|svelte)["\'][^>]*>\s*</div>', re.IGNORECASE),
+    re.compile(r'<app-root\b[^>]*>\s*</app-root>', re.IGNORECASE),
+    re.compile(r'<div\s+id=["\']docusaurus["\'][^>]*>\s*</div>', re.IGNORECASE),
+)
+
+MIN_TEXT_LENGTH = 200
+MIN_TEXT_RATIO = 0.02
+
+def visible_text(html):
+    """text of the body without scripts, styles and tags"""
+    match = BODY_PATTERN.search(html)
+    body = match.group(1) if match is not None else html
+    body = SCRIPT_STYLE_PATTERN.sub(' ', body)
+    return ' '.join(TAG_PATTERN.sub(' ', body).split())
+
+def needs_js_rendering(html):
+    """
+    Return a (needs_rendering, reason) tuple.
+    A page needs rendering when its body is (almost) empty, when it only contains a SPA mount point
+    or when its text is a tiny fraction of the markup"""
+    if html is None or html.strip() == '':
+        return True, 'empty document'
+    text = visible_text(html)
+    for pattern in SPA_ROOT_PATTERNS:
+        if pattern.search(html) is not None and len(text) < MIN_TEXT_LENGTH * 5:
+            return True, 'spa root'
+    for noscript in NOSCRIPT_PATTERN.findall(html):
+        if 'javascript' in noscript.lower() and len(text) < MIN_TEXT_LENGTH * 5:
+            return True, 'javascript required'
+    if len(text) < MIN_TEXT_LENGTH:
+        return True, 'empty body'
+    if len(text) / len(html) < MIN_TEXT_RATIO:
+        return True, 'low text ratio'
+    return False, 'static'
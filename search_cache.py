@@ -0,0 +1,77 @@
+"""This class caches the GitHub search results in memory and on disk"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from cat.log import log
+
+class SearchCache:
+    """LRU cache of search results with a TTL, empty results are cached with a shorter TTL"""
+
+    def __init__(self, cache_folder, max_entries = 256):
+        self.max_entries = max_entries
+        self.cache_path = f"{cache_folder}/search.json"
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        os.makedirs(cache_folder, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(query, authenticated):
+        """normalized query plus auth mode, results differ between github.com search and the API"""
+        normalized = ' '.join(str(query).strip().lower().split())
+        return f"{'api' if authenticated else 'web'}:{normalized}"
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"unable to read search cache {self.cache_path}: {e}")
+            return
+        for key, entry in sorted(data.items(), key=lambda item: item[1].get('stored_at', 0)):
+            self.entries[key] = entry
+
+    def _save(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.entries), f, indent=1)
+        os.replace(tmp_path, self.cache_path)
+
+    def get(self, key, ttl, negative_ttl):
+        """cached results, None on a miss or when the entry is expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            max_age = ttl if len(entry['results']) > 0 else negative_ttl
+            if time.time() - entry['stored_at'] > max_age:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry['results']
+
+    def put(self, key, results):
+        """store results, evicting the least recently used entries"""
+        with self.lock:
+            self.entries[key] = {'results': results, 'stored_at': time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            try:
+                self._save()
+            except OSError as e:
+                log.error(f"unable to write search cache {self.cache_path}: {e}")
+
+_SEARCH_CACHES = {}
+_SEARCH_CACHES_LOCK = threading.Lock()
+
+def get_search_cache(cache_folder):
+    """shared cache instance for a folder, so the in-memory LRU survives between tool calls"""
+    with _SEARCH_CACHES_LOCK:
+        if cache_folder not in _SEARCH_CACHES:
+            _SEARCH_CACHES[cache_folder] = SearchCache(cache_folder)
+        return _SEARCH_CACHES[cache_folder]
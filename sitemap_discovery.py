@@ -0,0 +1,42 @@
+"""Helpers reading robots.txt and sitemap.xml files to seed the crawl of a documentation site"""
+import gzip
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from scrapy.utils.sitemap import Sitemap
+
+# a crawl-delay above this is not worth waiting for, the crawl is capped by scraping_max_pages anyway
+MAX_CRAWL_DELAY = 30
+GZIP_MAGIC = b'\x1f\x8b'
+
+def parse_robots(text, site_url, user_agent = '*'):
+    """return a (robots parser, sitemap urls, crawl delay) tuple, /sitemap.xml is assumed when robots.txt lists no sitemap"""
+    robots = RobotFileParser()
+    robots.parse(text.splitlines())
+    sitemaps = robots.site_maps() or []
+    if len(sitemaps) == 0:
+        parts = urlparse(site_url)
+        sitemaps = [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+    delay = robots.crawl_delay(user_agent)
+    delay = min(float(delay), MAX_CRAWL_DELAY) if delay else None
+    return robots, sitemaps, delay
+
+def sitemap_entries(body):
+    """return a (type, entries) tuple of a sitemap body (plain or gzip), type is 'urlset' or 'sitemapindex'"""
+    if body[:2] == GZIP_MAGIC:
+        body = gzip.decompress(body)
+    sitemap = Sitemap(body)
+    return sitemap.type, list(sitemap)
+
+def parse_lastmod(value):
+    """W3C datetime of a sitemap lastmod as an aware datetime, a bare date means the end of that day"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        if len(value) == 10:
+            return datetime.fromisoformat(value).replace(tzinfo=timezone.utc) + timedelta(days=1)
+        lastmod = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return lastmod if lastmod.tzinfo is not None else lastmod.replace(tzinfo=timezone.utc)
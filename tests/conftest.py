@@ -0,0 +1,49 @@
+"""Register the plugin as the catoverflow package, with the stand-ins of the Cheshire Cat modules used by the benchmarks"""
+import os
+import sys
+import types
+import importlib
+import threading
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules reading the GitHub urls of github_scheduler at import time
+GITHUB_URL_MODULES = ('github_scheduler', 'branch_resolver', 'gh_easy_downloader', 'gh_api_downloader', 'gh_repo_finder', 'raw_fallback', 'cat_overflow')
+
+def pytest_configure(config):
+    # the Cheshire Cat imports every module of the plugin: nothing is registered unless pytest is running
+    sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+    import stub_cat
+    stub_cat.install_cat_modules()
+    if 'catoverflow' not in sys.modules:
+        package = types.ModuleType('catoverflow')
+        package.__path__ = [ROOT]
+        sys.modules['catoverflow'] = package
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    """the fake GitHub of the benchmarks, every GitHub url of the plugin points to it"""
+    fake_servers = importlib.import_module('fake_servers')
+    server = serve(fake_servers.FakeGitHub(search_results=3))
+    urls = {'GITHUB_WEB_URL': server.base_url, 'GITHUB_API_URL': f"{server.base_url}/api", 'GITHUB_RAW_URL': f"{server.base_url}/raw"}
+    for name in GITHUB_URL_MODULES:
+        module = importlib.import_module(f"catoverflow.{name}")
+        for constant, url in urls.items():
+            if hasattr(module, constant):
+                monkeypatch.setattr(module, constant, url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def fake_docs_site():
+    """the fake documentation site of the benchmarks, 12 pages"""
+    fake_servers = importlib.import_module('fake_servers')
+    server = serve(fake_servers.FakeDocsSite(pages=12))
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,26 @@
+import os
+import zipfile
+import importlib
+
+def test_archive_members_are_ingested_one_at_a_time_without_extracting_the_archive(tmp_path, monkeypatch):
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    file_filter = importlib.import_module('catoverflow.file_filter')
+    archive_path = tmp_path / 'repository.zip'
+    with zipfile.ZipFile(archive_path, 'w') as zip_file:
+        zip_file.writestr('repository-main/README.md', '# repository\n')
+        zip_file.writestr('repository-main/src/app.py', 'app = 1\n')
+        zip_file.writestr('repository-main/node_modules/left-pad/index.js', 'module.exports = 1\n')
+        zip_file.writestr('repository-main/package-lock.json', '{}\n')
+    extraction_folder = tmp_path / 'repository'
+    ingested = []
+
+    def ingest_archive(cat, root, relpath, file, *args):
+        # the member is on disk only while it is being ingested
+        assert os.path.exists(os.path.join(root, file))
+        ingested.append('/'.join(part for part in (relpath, file) if part))
+
+    monkeypatch.setattr(cat_overflow, 'ingest_archive', ingest_archive)
+    stats = cat_overflow.run_archive_ingestion(None, str(archive_path), str(extraction_folder), workers=2, file_filter=file_filter.FileFilter())
+    assert sorted(ingested) == ['README.md', 'src/app.py']
+    assert stats['skipped'] == {'directory': 1, 'excluded_glob': 1}
+    assert [path for path in extraction_folder.rglob('*') if path.is_file()] == []
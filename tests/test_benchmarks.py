@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import subprocess
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_benchmarks(output, *args):
+    command = [sys.executable, os.path.join(ROOT, 'benchmarks', 'run_benchmarks.py'), '--components', 'find_repo,ingestion', '--repo-sizes', '20',
+               '--search-sizes', '3', '--site-sizes', '', '--repeat', '1', '--lookups', '2', '--output', str(output), *args]
+    return subprocess.run(command, capture_output=True, text=True, timeout=300)
+
+def test_the_benchmarks_run_offline_and_report_regressions(tmp_path):
+    completed = run_benchmarks(tmp_path / 'baseline.json')
+    assert completed.returncode == 0, completed.stderr
+    with open(tmp_path / 'baseline.json', 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    assert [(entry['component'], entry['size'], entry['status']) for entry in report['results']] == [('find_repo', 3, 'ok'), ('ingestion', 20, 'ok')]
+    assert all(entry['items'] > 0 and entry['requests'] > 0 for entry in report['results'])
+
+    # a baseline 1000 times faster turns every result into a regression
+    for entry in report['results']:
+        entry['seconds'] /= 1000
+    with open(tmp_path / 'fast.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f)
+    completed = run_benchmarks(tmp_path / 'results.json', '--baseline', str(tmp_path / 'fast.json'))
+    assert completed.returncode == 1
+    with open(tmp_path / 'results.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['regressions'] == ['find_repo [3]', 'ingestion [20]']
+
+def test_components_without_their_dependencies_are_skipped():
+    run_benchmarks_module = importlib.import_module('run_benchmarks')
+    args = run_benchmarks_module.parse_args(['--repeat', '1'])
+    context = run_benchmarks_module.Context(args, type('Server', (), {'requests': 0})(), {})
+
+    def missing(context, size, work_folder):
+        raise ImportError("No module named 'playwright'")
+
+    run_benchmarks_module.BENCHMARKS['missing'] = (missing, 'site_sizes')
+    try:
+        entry = run_benchmarks_module.run_benchmark(context, 'missing', 20)
+    finally:
+        del run_benchmarks_module.BENCHMARKS['missing']
+    assert entry == {'component': 'missing', 'size': 20, 'status': 'skipped', 'reason': "missing dependency: No module named 'playwright'"}
@@ -0,0 +1,50 @@
+import json
+import importlib
+import threading
+
+def test_resolvers_of_a_batch_save_the_cache_concurrently(tmp_path):
+    branch_resolver = importlib.import_module('catoverflow.branch_resolver')
+    errors = []
+
+    def save(index):
+        resolver = branch_resolver.BranchResolver(str(tmp_path))
+        try:
+            for attempt in range(20):
+                with resolver.lock:
+                    cache = resolver._load_cache()
+                    cache[f"owner/repository-{index}"] = {'branch': 'main', 'resolved_at': attempt}
+                    resolver._save_cache(cache)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(tmp_path / 'branches.json', 'r', encoding='utf-8') as f:
+        assert len(json.load(f)) == 8
+    assert [path.name for path in tmp_path.iterdir()] == ['branches.json']
+
+def test_the_default_branch_is_resolved_with_one_request_and_cached(tmp_path, fake_github):
+    branch_resolver = importlib.import_module('catoverflow.branch_resolver')
+    resolver = branch_resolver.BranchResolver(str(tmp_path))
+    assert resolver.resolve('bench/files-3') == 'main'
+    assert fake_github.requests == 1
+    assert branch_resolver.BranchResolver(str(tmp_path)).resolve('bench/files-3') == 'main'
+    assert fake_github.requests == 1
+
+def test_an_expired_branch_is_resolved_again(tmp_path, fake_github):
+    branch_resolver = importlib.import_module('catoverflow.branch_resolver')
+    with open(tmp_path / 'branches.json', 'w', encoding='utf-8') as f:
+        json.dump({'bench/files-3': {'branch': 'master', 'resolved_at': 0}}, f)
+    assert branch_resolver.BranchResolver(str(tmp_path), ttl=60).resolve('bench/files-3') == 'main'
+    assert fake_github.requests == 1
+
+def test_a_pinned_ref_downloads_its_archive_without_resolving_the_branch(tmp_path, fake_github):
+    gh_easy_downloader = importlib.import_module('catoverflow.gh_easy_downloader')
+    downloader = gh_easy_downloader.GhEasyDownloader('bench/files-3', str(tmp_path), ref='v1.0.0')
+    result = downloader.download_files_from_repo()
+    assert result['result'] is True and result['branch'] == 'v1.0.0'
+    assert fake_github.requests == 1
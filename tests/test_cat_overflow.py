@@ -0,0 +1,112 @@
+import time
+import importlib
+import threading
+import pytest
+
+def test_repositories_of_a_batch_are_ingested_once():
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    repositories = cat_overflow.parse_repositories('a/b@main A/B@v2 c/d a/b')
+    assert cat_overflow.unique_repositories(repositories) == ([('a/b', 'main'), ('c/d', None)], [('A/B', 'v2'), ('a/b', None)])
+
+def test_jobs_of_the_same_repository_do_not_overlap(monkeypatch):
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    running, overlaps, stages = [], [], []
+
+    def download_and_ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event, **kwargs):
+        running.append(repository_ref)
+        if len(running) > 1:
+            overlaps.append(list(running))
+        time.sleep(0.2)
+        running.remove(repository_ref)
+        return repository_ref
+
+    monkeypatch.setattr(cat_overflow, 'download_and_ingest_repository', download_and_ingest_repository)
+    results = []
+
+    def ingest(name, ref):
+        results.append(cat_overflow.ingest_repository(None, {}, {}, {'name': name, 'url': ''}, ref, stages.append, lambda message: None,
+                                                      threading.Event()))
+
+    threads = [threading.Thread(target=ingest, args=('owner/Repository', 'main')), threading.Thread(target=ingest, args=('owner/repository', 'v2'))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+    assert sorted(results) == ['main', 'v2']
+    assert stages == ['wait for repository']
+
+def test_a_cancelled_job_stops_waiting_for_its_repository():
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    job_manager = importlib.import_module('catoverflow.job_manager')
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with cat_overflow.repository_lock('owner/busy'):
+        with pytest.raises(job_manager.JobCancelled):
+            cat_overflow.ingest_repository(None, {}, {}, {'name': 'owner/busy', 'url': ''}, None, lambda step: None, lambda message: None,
+                                           cancel_event)
+
+class FakeJob:
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.messages = []
+
+    def check_cancelled(self):
+        pass
+
+    def progress(self, message):
+        self.messages.append(message)
+
+def test_a_batch_waits_for_the_repositories_ingested_by_other_jobs(monkeypatch):
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    finished = []
+
+    def download_and_ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event, **kwargs):
+        finished.append(repository['name'])
+        return 'ok'
+
+    monkeypatch.setattr(cat_overflow, 'download_and_ingest_repository', download_and_ingest_repository)
+    monkeypatch.setattr(cat_overflow, 'repository_finder', lambda options: None)
+    lock = cat_overflow.repository_lock('batch/shared')
+    lock.acquire()
+    threading.Timer(0.3, lock.release).start()
+    job = FakeJob()
+    cat_overflow.ingest_repositories(None, {}, {'ingestion_workers': 1}, [('batch/shared', None), ('batch/alone', None)], job)
+    assert finished == ['batch/alone', 'batch/shared']
+    assert 'batch/shared: wait for repository' in job.messages
+
+def test_the_getcode_input_is_split_into_repositories():
+    parse_repositories = importlib.import_module('catoverflow.cat_overflow').parse_repositories
+    assert parse_repositories('cheshire cat') == [('cheshire cat', None)]
+    assert parse_repositories('"owner/core@v1.2"') == [('owner/core', 'v1.2')]
+    assert parse_repositories('owner/core owner/docs@main') == [('owner/core', None), ('owner/docs', 'main')]
+    assert parse_repositories('fastapi, owner/docs') == [('fastapi', None), ('owner/docs', None)]
+
+def test_the_repositories_of_a_batch_are_ingested_concurrently(monkeypatch):
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    running, overlaps = [], []
+
+    def download_and_ingest_repository(cat, settings, options, repository, repository_ref, stage, progress, cancel_event, **kwargs):
+        running.append(repository['name'])
+        overlaps.append(len(running))
+        time.sleep(0.2)
+        running.remove(repository['name'])
+        if repository['name'] == 'batch/broken':
+            raise Exception('archive is corrupted')
+        return 'ingested'
+
+    class Finder:
+        def find_repo(self, name):
+            return [{'name': f"batch/{name}", 'url': ''}] if name != 'unknown' else None
+
+    monkeypatch.setattr(cat_overflow, 'download_and_ingest_repository', download_and_ingest_repository)
+    monkeypatch.setattr(cat_overflow, 'repository_finder', lambda options: Finder())
+    repositories = [('batch/first', None), ('batch/second', 'v1'), ('broken', None), ('unknown', None), ('first', None)]
+    summary = cat_overflow.ingest_repositories(None, {}, {'ingestion_workers': 2}, repositories, FakeJob())
+    # the three repositories found are downloaded at the same time
+    assert max(overlaps) == 3
+    lines = summary.splitlines()
+    assert lines[:5] == ['batch/first: ingested', 'batch/second: ingested', 'broken: failed (archive is corrupted)',
+                         'unknown: sorry, no repository found', 'first: batch/first is already part of this batch']
+    assert lines[5].startswith('5 repositories processed')
@@ -0,0 +1,171 @@
+import importlib
+
+def chunk(text, language):
+    chunker = importlib.import_module('catoverflow.code_chunker').CodeChunker('owner/repository', 'main')
+    return [(symbol['symbol'], symbol['kind'], symbol['start_line'], symbol['end_line']) for symbol in chunker.chunk(text, language)]
+
+def names(text, language):
+    return [(symbol, kind) for symbol, kind, _, _ in chunk(text, language)]
+
+JAVASCRIPT = """import React from 'react';
+
+const funnel = createFunnel({
+  steps: 3,
+});
+
+const defaults = {
+  retries: 2,
+};
+
+export default function App() {
+  return null;
+}
+
+const add = (a, b) => a + b;
+function twice(x) { return 2 * x; }
+
+export class Store extends Base {
+  constructor() { super(); }
+  get(key) {
+    return this.items[key];
+  }
+}
+"""
+
+TYPESCRIPT = """export interface Props {
+  title: string;
+}
+
+export type State = {
+  open: boolean;
+};
+
+export const handler: Handler = async (event) => {
+  return event;
+};
+
+export async function load(id: string): Promise<Item> {
+  return fetchItem(id);
+}
+"""
+
+GO = """package server
+
+import "net/http"
+
+// Server serves the api
+type Server struct {
+	mux *http.ServeMux
+}
+
+func (s *Server) Start(addr string) error {
+	return http.ListenAndServe(addr, s.mux)
+}
+
+func (s Server) Len() int { return 0 }
+
+func New() *Server {
+	return &Server{}
+}
+"""
+
+RUST = """use std::fmt;
+
+pub struct Point<'a> { name: &'a str }
+
+impl<'a> fmt::Display for Point<'a> {
+    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
+        write!(f, "{}", self.name)
+    }
+}
+
+pub fn defaults() -> Point<'static> {
+    Point { name: "origin" }
+}
+"""
+
+def test_javascript_names():
+    assert names(JAVASCRIPT, 'javascript') == [
+        ('<module>', 'code'),
+        ('funnel', 'code'),
+        ('defaults', 'code'),
+        ('App', 'function'),
+        ('add', 'function'),
+        ('twice', 'function'),
+        ('Store', 'class'),
+        ('Store.constructor', 'method'),
+        ('Store.get', 'method'),
+    ]
+
+def test_javascript_line_ranges():
+    symbols = {symbol: (start, end) for symbol, _, start, end in chunk(JAVASCRIPT, 'javascript')}
+    assert symbols['App'] == (11, 13)
+    assert symbols['add'] == (15, 15)
+    assert symbols['Store.get'] == (20, 22)
+
+def test_typescript_names():
+    assert names(TYPESCRIPT, 'typescript') == [
+        ('Props', 'class'),
+        ('State', 'type'),
+        ('handler', 'function'),
+        ('load', 'function'),
+    ]
+
+def test_go_methods_keep_their_receiver():
+    assert names(GO, 'go') == [
+        ('<module>', 'code'),
+        ('Server', 'class'),
+        ('Server.Start', 'method'),
+        ('Server.Len', 'method'),
+        ('New', 'function'),
+    ]
+
+def test_rust_names():
+    assert names(RUST, 'rust') == [
+        ('<module>', 'code'),
+        ('Point', 'class'),
+        ('Point', 'class'),
+        ('Point.fmt', 'method'),
+        ('defaults', 'function'),
+    ]
+
+def test_python_methods_and_module_code():
+    text = "import os\n\n@cache\ndef load():\n    return 1\n\nclass Repo:\n    name = 'x'\n\n    def fetch(self):\n        pass\n"
+    assert chunk(text, 'python') == [
+        ('<module>', 'code', 1, 1),
+        ('load', 'function', 3, 5),
+        ('Repo', 'class', 7, 8),
+        ('Repo.fetch', 'method', 10, 11),
+    ]
+
+def test_documents_carry_the_location_of_their_symbol(tmp_path):
+    chunker = importlib.import_module('catoverflow.code_chunker').CodeChunker('owner/repository', 'main')
+    source = tmp_path / 'server.go'
+    source.write_text(GO)
+    docs = chunker.file_to_docs(str(source), 'pkg/server.go')
+    start = [doc for doc in docs if doc.metadata['symbol'] == 'Server.Start'][0]
+    assert start.metadata == {'repository': 'owner/repository', 'branch': 'main', 'path': 'pkg/server.go', 'language': 'go',
+                              'symbol': 'Server.Start', 'kind': 'method', 'start_line': 10, 'end_line': 12}
+    assert start.page_content.startswith('pkg/server.go: Server.Start (lines 10-12)\n\nfunc (s *Server) Start(addr string) error {')
+    assert chunker.stats['files'] == 1 and chunker.stats['chunks'] == len(docs)
+
+def test_long_symbols_are_split_at_line_boundaries():
+    code_chunker = importlib.import_module('catoverflow.code_chunker')
+    chunker = code_chunker.CodeChunker('owner/repository', 'main', max_chunk_chars=500)
+    body = ''.join(f"    value_{n} = compute({n}, factor={n * 2})\n" for n in range(60))
+    symbol = chunker.chunk(f"def big():\n{body}", 'python')[0]
+    pieces = chunker._split(symbol)
+    assert len(pieces) > 1 and all(len(text) <= 500 for start_line, end_line, text in pieces)
+    assert pieces[0][0] == 1 and pieces[-1][1] == 61
+    assert all(pieces[n][1] + 1 == pieces[n + 1][0] for n in range(len(pieces) - 1))
+    assert '\n'.join(text for start_line, end_line, text in pieces) == symbol['text']
+
+def test_files_the_chunker_cannot_handle_go_to_the_rabbit_hole_splitter(tmp_path):
+    chunker = importlib.import_module('catoverflow.code_chunker').CodeChunker('owner/repository', 'main')
+    readme = tmp_path / 'README.md'
+    readme.write_text('# Title\n')
+    broken = tmp_path / 'broken.py'
+    broken.write_text('def broken(:\n    pass\n')
+    assert chunker.file_to_docs(str(readme), 'README.md') is None
+    assert chunker.file_to_docs(str(broken), 'broken.py') is None
+    assert chunker.stats['fallbacks'] == 1
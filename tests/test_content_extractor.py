@@ -0,0 +1,107 @@
+import importlib
+
+def extractor():
+    return importlib.import_module('catoverflow.content_extractor').ContentExtractor()
+
+PARAGRAPH = "The configuration file is read once at startup and every option can be overridden from the environment. "
+
+SPHINX_RTD_PAGE = f"""<html><head><title>Configuration &mdash; Project 1.0 documentation</title></head>
+<body class="wy-body-for-nav">
+<div class="wy-grid-for-nav">
+  <nav data-toggle="wy-nav-shift" class="wy-nav-side">
+    <div class="wy-side-scroll">
+      <div class="wy-side-nav-search"><a href="index.html">Project</a></div>
+      <div class="wy-menu wy-menu-vertical" role="navigation" aria-label="Navigation menu">
+        <ul><li><a href="install.html">Installation</a></li><li><a href="config.html">Configuration</a></li></ul>
+      </div>
+    </div>
+  </nav>
+  <section data-toggle="wy-nav-shift" class="wy-nav-content-wrap">
+    <nav class="wy-nav-top" aria-label="Mobile navigation menu"><a href="index.html">Project</a></nav>
+    <div class="wy-nav-content">
+      <div class="rst-content">
+        <div role="navigation" aria-label="Page navigation"><ul class="wy-breadcrumbs"><li><a href="index.html">Docs</a></li></ul></div>
+        <div role="main" class="document" itemscope="itemscope">
+          <div itemprop="articleBody">
+            <section id="configuration">
+              <h1>Configuration</h1>
+              <p>{PARAGRAPH * 3}</p>
+              <div class="highlight-python notranslate"><div class="highlight"><pre>settings = load("config.toml")</pre></div></div>
+              <p>{PARAGRAPH * 2}</p>
+            </section>
+          </div>
+        </div>
+        <footer><div role="contentinfo"><p>&copy; Copyright 2024.</p></div></footer>
+      </div>
+    </div>
+  </section>
+</div>
+</body></html>"""
+
+PAGE_WITHOUT_MAIN = f"""<html><head><title>Guide</title></head>
+<body>
+<div class="page-wrapper">
+  <div class="top-menu"><a href="/">Home</a> <a href="/guide">Guide</a> <a href="/api">API</a></div>
+  <div class="layout-with-sidebar">
+    <div class="sidebar"><ul><li><a href="/a">A</a></li><li><a href="/b">B</a></li><li><a href="/c">C</a></li></ul></div>
+    <div class="content">
+      <h1>Guide</h1>
+      <p>{PARAGRAPH * 3}</p>
+      <p>{PARAGRAPH * 2}</p>
+    </div>
+  </div>
+  <div class="footer"><p>Made with love</p></div>
+</div>
+</body></html>"""
+
+def test_sphinx_rtd_page_keeps_the_article_body():
+    markdown = extractor().extract(SPHINX_RTD_PAGE, 'https://project.readthedocs.io/en/latest/config.html')
+    assert '# Configuration' in markdown
+    assert markdown.count(PARAGRAPH.strip()) == 5
+    assert 'settings = load("config.toml")' in markdown
+    # the sidebar, the breadcrumbs and the footer are layout
+    assert 'Installation' not in markdown
+    assert 'Copyright' not in markdown
+
+def test_page_without_main_keeps_the_content_and_drops_the_layout():
+    markdown = extractor().extract(PAGE_WITHOUT_MAIN, 'https://example.org/guide')
+    assert '# Guide' in markdown
+    assert markdown.count(PARAGRAPH.strip()) == 5
+    assert '[A](https://example.org/a)' not in markdown
+    assert 'Made with love' not in markdown
+
+def test_near_empty_extraction_falls_back_to_the_whole_page():
+    html = f"""<html><body><main><p>Loading</p></main><div class="docs-body">{'<p>' + PARAGRAPH * 4 + '</p>'}</div></body></html>"""
+    content_extractor = extractor()
+    assert content_extractor.extract(html, 'https://example.org/') is None
+    assert content_extractor.stats['fallbacks'] == 1
+
+def test_markdown_keeps_links_code_lists_and_tables():
+    html = f"""<html><head><title>API</title><link rel="canonical" href="/api/"></head><body><main>
+<h2>Usage</h2>
+<p>{PARAGRAPH}Call <code>load()</code> as described in <a href="../install/">the installation</a>, it is <strong>fast</strong>.</p>
+<pre><code class="language-python">settings = load("config.toml")
+print(settings)</code></pre>
+<ol><li>first step<ul><li>nested detail</li></ul></li><li>second step</li></ol>
+<table><tr><th>Option</th><th>Default</th></tr><tr><td>timeout</td><td>30</td></tr></table>
+</main></body></html>"""
+    markdown = extractor().extract(html, 'https://example.org/docs/api/page.html')
+    assert markdown.startswith('---\ntitle: API\nurl: https://example.org/api/\nsource: https://example.org/docs/api/page.html\n---\n')
+    assert '# API' in markdown and '## Usage' in markdown
+    assert 'Call `load()` as described in [the installation](https://example.org/docs/install/), it is **fast**.' in markdown
+    assert '```python\nsettings = load("config.toml")\nprint(settings)\n```' in markdown
+    assert '1. first step\n\n  - nested detail\n\n2. second step' in markdown
+    assert '| Option | Default |\n| --- | --- |\n| timeout | 30 |' in markdown
+
+def test_blocks_repeated_on_many_pages_are_removed():
+    content_extractor = extractor()
+    banner = 'This documentation is for an unreleased version, see the stable release for the current documentation.'
+    markdowns = []
+    for index in range(4):
+        html = f"""<html><head><title>Page {index}</title></head><body><main>
+<h1>Page {index}</h1><p>{banner}</p><p>{PARAGRAPH * 2} Page number {index}.</p></main></body></html>"""
+        markdowns.append(content_extractor.extract(html, f"https://example.org/{index}"))
+    # the banner is boilerplate from the third page on
+    assert [banner in markdown for markdown in markdowns] == [True, True, False, False]
+    assert content_extractor.stats['boilerplate_blocks'] == 2
+    assert 'Page number 3.' in markdowns[3]
@@ -0,0 +1,54 @@
+import types
+import importlib
+from scrapy import Request
+from scrapy.http import Response
+
+def crawl_cache():
+    return importlib.import_module('catoverflow.crawl_cache')
+
+def cached_page(tmp_path, body = b'<html><body>guide</body></html>'):
+    cache = crawl_cache().CrawlCache(str(tmp_path / 'cache.json'))
+    body_path = tmp_path / 'guide.html'
+    body_path.write_bytes(body)
+    cache.update('https://docs.example.org/guide/', body, str(body_path), etag='"v1"', last_modified='Sat, 17 Oct 2026 10:00:00 GMT')
+    return cache, body_path
+
+def test_validators_are_sent_only_while_the_body_is_on_disk(tmp_path):
+    cache, body_path = cached_page(tmp_path)
+    assert cache.conditional_headers('https://docs.example.org/guide?utm_source=x') == {
+        'If-None-Match': '"v1"', 'If-Modified-Since': 'Sat, 17 Oct 2026 10:00:00 GMT'}
+    body_path.unlink()
+    assert cache.conditional_headers('https://docs.example.org/guide/') == {}
+
+def test_a_page_is_changed_only_when_its_content_is(tmp_path):
+    cache, body_path = cached_page(tmp_path)
+    cache.save()
+    reloaded = crawl_cache().CrawlCache(str(tmp_path / 'cache.json'))
+    assert reloaded.update('https://docs.example.org/guide/', body_path.read_bytes(), str(body_path)) is False
+    # validators missing from an answer are kept from the previous crawl
+    assert reloaded.get('https://docs.example.org/guide/')['etag'] == '"v1"'
+    assert reloaded.update('https://docs.example.org/guide/', b'<html><body>new guide</body></html>', str(body_path), etag='"v2"') is True
+    assert reloaded.stats['unchanged'] == 1 and reloaded.stats['changed'] == 1
+
+def test_a_not_modified_answer_is_replaced_by_the_cached_page(tmp_path):
+    cache, body_path = cached_page(tmp_path)
+    middleware = crawl_cache().ConditionalFetchMiddleware()
+    spider = types.SimpleNamespace(cache=cache)
+    request = Request('https://docs.example.org/guide/')
+    assert middleware.process_request(request, spider) is None
+    assert request.headers.get('If-None-Match') == b'"v1"'
+    response = middleware.process_response(request, Response(request.url, status=304, request=request), spider)
+    assert response.status == 200 and 'cached' in response.flags
+    assert response.body == body_path.read_bytes()
+    assert cache.stats['revalidated'] == 1 and cache.stats['not_modified'] == 1
+
+def test_pages_without_a_cache_entry_are_fetched_as_usual(tmp_path):
+    cache, body_path = cached_page(tmp_path)
+    middleware = crawl_cache().ConditionalFetchMiddleware()
+    spider = types.SimpleNamespace(cache=cache)
+    request = Request('https://docs.example.org/other/')
+    middleware.process_request(request, spider)
+    assert request.headers.get('If-None-Match') is None
+    response = Response(request.url, status=200, body=b'other', request=request)
+    assert middleware.process_response(request, response, spider) is response
+    assert cache.stats['revalidated'] == 0
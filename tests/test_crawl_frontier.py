@@ -0,0 +1,32 @@
+import importlib
+
+def frontier(start_url = 'https://docs.example.org/docs/', include_patterns = '', **kwargs):
+    module = importlib.import_module('catoverflow.crawl_frontier')
+    return module.CrawlFrontier(start_url, include_patterns, **kwargs)
+
+def test_low_value_pages_are_excluded():
+    crawl_frontier = frontier()
+    assert crawl_frontier.allowed('https://docs.example.org/docs/guide/install.html')
+    for url in ('https://docs.example.org/docs/changelog', 'https://docs.example.org/blog/2026/10/release',
+                'https://docs.example.org/docs/api?page=3', 'https://docs.example.org/fr/docs/guide', 'https://docs.example.org/search?q=x'):
+        assert not crawl_frontier.allowed(url), url
+
+def test_an_exclude_pattern_matching_the_start_url_is_ignored():
+    crawl_frontier = frontier('https://docs.example.org/fr/docs/')
+    assert crawl_frontier.allowed('https://docs.example.org/fr/docs/guide')
+    assert not crawl_frontier.allowed('https://docs.example.org/fr/docs/changelog')
+
+def test_include_patterns_restrict_the_crawl():
+    crawl_frontier = frontier(include_patterns='/docs/api/,/docs/guide/')
+    assert crawl_frontier.allowed('https://docs.example.org/docs/api/client')
+    assert not crawl_frontier.allowed('https://docs.example.org/docs/community/')
+
+def test_pages_below_the_start_url_and_reference_pages_come_first():
+    crawl_frontier = frontier()
+    below = crawl_frontier.score('https://docs.example.org/docs/intro')
+    outside = crawl_frontier.score('https://docs.example.org/about/intro')
+    reference = crawl_frontier.score('https://docs.example.org/docs/api/reference')
+    assert reference > below > outside
+    # then the sitemap priority, then the shallow pages
+    assert crawl_frontier.score('https://docs.example.org/docs/intro', '1.0') > crawl_frontier.score('https://docs.example.org/docs/intro', '0.1')
+    assert crawl_frontier.score('https://docs.example.org/docs/a') > crawl_frontier.score('https://docs.example.org/docs/a/b/c')
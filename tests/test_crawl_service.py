@@ -0,0 +1,33 @@
+import importlib
+import pytest
+
+@pytest.fixture
+def crawl_service():
+    service = importlib.import_module('catoverflow.crawl_service').CrawlService()
+    yield service
+    service.shutdown()
+
+def test_crawls_reuse_the_worker_and_stream_their_pages(crawl_service, fake_docs_site, tmp_path):
+    first = list(crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=2, max_pages=5, output_folder=str(tmp_path / 'first')))
+    pid = crawl_service.process.pid
+    second = list(crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=2, max_pages=3, output_folder=str(tmp_path / 'second')))
+    assert crawl_service.process.pid == pid
+    assert len(first) == 5 and len(second) == 3
+    assert all(url.startswith(fake_docs_site.base_url) and changed for url, body_path, changed in first)
+    assert crawl_service.listeners == {}
+
+def test_stopping_early_cancels_the_crawl(crawl_service, fake_docs_site, tmp_path):
+    pages = crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=3, max_pages=12, output_folder=str(tmp_path))
+    next(pages)
+    pages.close()
+    assert crawl_service.listeners == {}
+    # the worker keeps serving the next crawls
+    assert len(list(crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=1, max_pages=2, output_folder=str(tmp_path)))) == 2
+
+def test_a_crashed_worker_fails_the_crawl_and_is_restarted(crawl_service, fake_docs_site, tmp_path):
+    pages = crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=3, max_pages=12, output_folder=str(tmp_path))
+    next(pages)
+    crawl_service.process.kill()
+    with pytest.raises(Exception, match='crawl worker exited'):
+        list(pages)
+    assert len(list(crawl_service.crawl(fake_docs_site.start_url, timeout=60, n=1, max_pages=2, output_folder=str(tmp_path)))) == 2
@@ -0,0 +1,49 @@
+import types
+import importlib
+
+def dedup():
+    return importlib.import_module('catoverflow.dedup')
+
+TEXT = ("The scheduler keeps one token bucket per GitHub resource and seeds it from the rate limit headers of every answer. "
+        "Searches go first, metadata calls next and blob downloads last, so a large download never starves a search. ")
+
+def document(text):
+    return types.SimpleNamespace(page_content=text)
+
+def test_the_content_hash_ignores_the_front_matter_and_the_whitespace():
+    content_hash = dedup().content_hash
+    first = f"---\ntitle: Guide\nurl: https://example.org/guide\nsource: https://example.org/guide?ref=nav\n---\n\n{TEXT}"
+    second = f"---\ntitle: Guide\nurl: https://example.org/guide\nsource: https://example.org/guide\n---\n{TEXT.replace(' ', '  ')}\n"
+    assert content_hash(first) == content_hash(second)
+    assert content_hash(first) != content_hash(TEXT + 'More.')
+
+def test_the_simhash_of_near_duplicates_is_close():
+    simhash = dedup().simhash
+    near = bin(simhash(TEXT * 3) ^ simhash((TEXT * 3).replace('last,', 'last;'))).count('1')
+    far = bin(simhash(TEXT * 3) ^ simhash('A completely different chunk about rendering pages with a browser context pool.')).count('1')
+    assert near <= 3 < far
+
+def test_duplicate_files_are_skipped_across_runs(tmp_path):
+    module = dedup()
+    page = tmp_path / 'page.md'
+    page.write_text(TEXT)
+    deduplicator = module.Deduplicator(str(tmp_path / 'index'), 'owner/library')
+    duplicate, fingerprint = deduplicator.check_file(str(page))
+    assert duplicate is False
+    deduplicator.record_file(fingerprint)
+    deduplicator.save()
+    reloaded = module.Deduplicator(str(tmp_path / 'index'), 'owner/library')
+    assert reloaded.check_file(str(page)) == (True, fingerprint)
+    # the index is per library
+    assert module.Deduplicator(str(tmp_path / 'index'), 'owner/other').check_file(str(page))[0] is False
+
+def test_near_duplicate_chunks_are_dropped_and_forgotten_when_not_stored(tmp_path):
+    module = dedup()
+    deduplicator = module.Deduplicator(str(tmp_path), 'library')
+    chunk = TEXT * 3
+    kept, fingerprints = deduplicator.filter_documents([document(chunk), document(chunk.replace('last,', 'last;'))])
+    assert [doc.page_content for doc in kept] == [chunk]
+    assert deduplicator.stats == {'files': 0, 'duplicate_files': 0, 'chunks': 2, 'duplicate_chunks': 1}
+    deduplicator.forget_chunks(fingerprints)
+    kept, fingerprints = deduplicator.filter_documents([document(chunk)])
+    assert len(kept) == 1
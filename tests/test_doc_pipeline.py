@@ -0,0 +1,87 @@
+import asyncio
+import importlib
+import threading
+import pytest
+
+class FakeDownloader:
+    def __init__(self):
+        self.saved = []
+
+    async def stream_download(self, page_queue, on_saved):
+        while True:
+            item = await page_queue.get()
+            if item is None:
+                break
+            self.saved.append(item[0])
+            await asyncio.get_running_loop().run_in_executor(None, on_saved, item[0], item[0], False)
+        return {'static': len(self.saved)}
+
+class FakePool:
+    stats = {'ingested': 0}
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, key, func, *args):
+        self.submitted.append(key)
+
+def test_a_failed_crawl_fails_the_pipeline_after_saving_its_pages():
+    doc_pipeline = importlib.import_module('catoverflow.doc_pipeline')
+
+    def crawl():
+        yield 'https://docs.example.org/a', None, True
+        raise Exception('crawl of https://docs.example.org failed: worker died')
+
+    downloader, pool = FakeDownloader(), FakePool()
+    pipeline = doc_pipeline.DocPipeline(crawl(), downloader, pool, ingest=None)
+    with pytest.raises(Exception, match='worker died'):
+        pipeline.run()
+    assert downloader.saved == ['https://docs.example.org/a']
+    assert pool.submitted == ['https://docs.example.org/a']
+
+def static_site(tmp_path, pages):
+    fake_servers = importlib.import_module('fake_servers')
+    bodies = {}
+    for index in range(pages):
+        body_path = tmp_path / 'bodies' / f"{index}.html"
+        body_path.parent.mkdir(exist_ok=True)
+        body_path.write_text(fake_servers.STATIC_PAGE_TEMPLATE.format(index=index, links=''))
+        bodies[f"https://docs.example.org/page-{index}/"] = str(body_path)
+    return bodies
+
+def test_crawled_pages_are_saved_and_ingested_while_the_crawl_runs(tmp_path):
+    doc_pipeline = importlib.import_module('catoverflow.doc_pipeline')
+    page_downloader = importlib.import_module('catoverflow.page_downloader')
+    bodies = static_site(tmp_path, 5)
+    reports = []
+    downloader, pool = page_downloader.PageDownloader(str(tmp_path / 'site'), []), FakePool()
+    pipeline = doc_pipeline.DocPipeline(((url, body_path, True) for url, body_path in bodies.items()), downloader, pool,
+                                        ingest=None, progress=reports.append, progress_every=2)
+    stats = pipeline.run()
+    assert stats['crawled'] == stats['saved'] == stats['static'] == 5
+    assert len(pool.submitted) == 5 and all(path.startswith(str(tmp_path / 'site')) for path in pool.submitted)
+    assert len(reports) == 2 and reports[0].startswith('crawled')
+
+    # a second crawl finding the same content saves and ingests nothing
+    downloader, pool = page_downloader.PageDownloader(str(tmp_path / 'site'), []), FakePool()
+    pipeline = doc_pipeline.DocPipeline(((url, body_path, False) for url, body_path in bodies.items()), downloader, pool, ingest=None)
+    stats = pipeline.run()
+    assert stats['unchanged'] == 5 and stats['saved'] == 0 and pool.submitted == []
+
+def test_a_cancelled_pipeline_stops_the_crawl(tmp_path):
+    doc_pipeline = importlib.import_module('catoverflow.doc_pipeline')
+    cancel_event = threading.Event()
+    closed = []
+
+    def crawl():
+        try:
+            for index in range(100):
+                if index == 3:
+                    cancel_event.set()
+                yield f"https://docs.example.org/page-{index}/", None, True
+        finally:
+            closed.append(True)
+
+    downloader, pool = FakeDownloader(), FakePool()
+    stats = doc_pipeline.DocPipeline(crawl(), downloader, pool, ingest=None, cancel_event=cancel_event).run()
+    assert stats['crawled'] == 3 and closed == [True]
@@ -0,0 +1,37 @@
+import mimetypes
+import importlib
+
+def test_source_files_are_not_rejected_by_the_host_mime_table(monkeypatch):
+    file_filter = importlib.import_module('catoverflow.file_filter')
+    # the Apache table of /etc/mime.types maps .ts to MPEG transport streams
+    monkeypatch.setattr(mimetypes, 'guess_type', lambda name: ('video/mp2t', None) if name.endswith('.ts') else ('image/png', None))
+    checker = file_filter.FileFilter()
+    assert checker.reject_reason_for_name('src/index.ts', 120) is None
+    assert checker.reject_reason_for_name('docs/logo.png', 120) == 'mime'
+
+def test_build_folders_are_only_pruned_at_the_repository_root(tmp_path):
+    file_filter = importlib.import_module('catoverflow.file_filter')
+    checker = file_filter.FileFilter()
+    assert checker.is_excluded_dir('build')
+    assert not checker.is_excluded_dir('src/build')
+    assert checker.is_excluded_dir('web/node_modules')
+    assert checker.is_excluded_path('dist/bundle.js')
+    assert not checker.is_excluded_path('src/build/__init__.py')
+    assert checker.is_excluded_path('src/build/node_modules/a.js')
+    dirs = ['build', 'src', 'node_modules']
+    assert checker.prune_dirs(dirs) == 2 and dirs == ['src']
+    dirs = ['build', 'node_modules']
+    assert checker.prune_dirs(dirs, 'src') == 1 and dirs == ['build']
+
+def test_walked_repositories_keep_nested_build_packages(tmp_path, monkeypatch):
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    file_filter = importlib.import_module('catoverflow.file_filter')
+    root = tmp_path / 'repository-main'
+    for relpath in ('build/out.py', 'src/build/setup.py', 'src/app.py'):
+        (root / relpath).parent.mkdir(parents=True, exist_ok=True)
+        (root / relpath).write_text('x = 1\n')
+    ingested = []
+    monkeypatch.setattr(cat_overflow, 'ingest_archive', lambda cat, folder, relpath, file, *args: ingested.append(f"{relpath}/{file}".lstrip('/')))
+    stats = cat_overflow.run_ingestion(None, str(tmp_path), workers=1, file_filter=file_filter.FileFilter())
+    assert sorted(ingested) == ['src/app.py', 'src/build/setup.py']
+    assert stats['skipped'] == {'directory': 1}
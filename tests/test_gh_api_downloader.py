@@ -0,0 +1,92 @@
+import types
+import importlib
+
+class FakeScheduler:
+    def __init__(self, files):
+        self.files = files
+        self.urls = []
+
+    def call(self, func, *args, priority = None, resource = None, **kwargs):
+        return func(*args, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        self.urls.append(url)
+        return types.SimpleNamespace(content=self.files[url.split('/', 6)[-1]], raise_for_status=lambda: None)
+
+    def budget_summary(self):
+        return ''
+
+def downloader_for(tmp_path, files, branch):
+    gh_api_downloader = importlib.import_module('catoverflow.gh_api_downloader')
+    tree = [types.SimpleNamespace(path=path, type='blob', sha=f"sha-{path}-{len(data)}", size=len(data)) for path, data in files.items()]
+    listed = []
+
+    def get_git_tree(sha, recursive = True):
+        listed.append(sha)
+        return types.SimpleNamespace(raw_data={'truncated': False}, tree=tree)
+
+    downloader = object.__new__(gh_api_downloader.GhApiRepoDownloader)
+    downloader.auth_key = 'token'
+    downloader.workers = 2
+    downloader.file_filter = None
+    downloader.stats = {'files': 0, 'bytes': 0, 'unchanged': 0, 'filtered': 0, 'removed': 0, 'errors': 0}
+    downloader.g = types.SimpleNamespace(rate_limiting=(0, 0))
+    downloader.scheduler = FakeScheduler(files)
+    downloader.repo = types.SimpleNamespace(full_name='owner/repository', get_git_tree=get_git_tree,
+                                            get_commit=lambda ref: types.SimpleNamespace(sha=f"commit-of-{ref}"))
+    downloader.branch = branch
+    downloader.extraction_folder = str(tmp_path / 'owner' / 'repository')
+    downloader.tree_folder = f"{downloader.extraction_folder}/repository-{branch}"
+    return downloader, listed
+
+def test_files_are_downloaded_from_the_listed_commit(tmp_path):
+    downloader, listed = downloader_for(tmp_path, {'README.md': b'readme', 'src/a.py': b'a = 1'}, 'main')
+    assert downloader._download_tree() is True
+    assert listed == ['commit-of-main']
+    assert len(downloader.scheduler.urls) == 2
+    assert all('/owner/repository/commit-of-main/' in url for url in downloader.scheduler.urls)
+
+def test_only_the_current_tree_is_left_to_ingest(tmp_path):
+    downloader, listed = downloader_for(tmp_path, {'README.md': b'readme', 'src/a.py': b'a = 1'}, 'main')
+    downloader._download_tree()
+    downloader, listed = downloader_for(tmp_path, {'README.md': b'readme v2', 'docs/b.md': b'b'}, 'v2')
+    downloader._download_tree()
+    extraction_folder = tmp_path / 'owner' / 'repository'
+    assert [path.name for path in extraction_folder.iterdir()] == ['repository-v2']
+    downloader, listed = downloader_for(tmp_path, {'README.md': b'readme v2'}, 'v2')
+    downloader._download_tree()
+    files = sorted(str(path.relative_to(extraction_folder)) for path in extraction_folder.rglob('*'))
+    assert files == ['repository-v2', 'repository-v2/README.md']
+    assert downloader.stats['removed'] == 1
+    assert downloader.stats['unchanged'] == 1
+
+def test_unchanged_blobs_are_not_downloaded_again(tmp_path, fake_github):
+    gh_api_downloader = importlib.import_module('catoverflow.gh_api_downloader')
+    first = gh_api_downloader.GhApiRepoDownloader('bench/files-12', str(tmp_path), key='token', workers=4)
+    assert first.download_files_from_repo()['result'] is True
+    assert first.stats['files'] == len(fake_github.repository('bench/files-12').files)
+    requests = fake_github.requests
+    second = gh_api_downloader.GhApiRepoDownloader('bench/files-12', str(tmp_path), key='token', workers=4)
+    assert second.download_files_from_repo()['result'] is True
+    assert second.stats['files'] == 0 and second.stats['unchanged'] == first.stats['files']
+    # repository, commit and tree, no raw file
+    assert fake_github.requests - requests == 3
+
+def test_a_truncated_tree_is_listed_by_subtree_without_the_excluded_dirs(tmp_path):
+    file_filter = importlib.import_module('catoverflow.file_filter')
+    downloader, listed = downloader_for(tmp_path, {}, 'main')
+    downloader.file_filter = file_filter.FileFilter()
+    trees = {
+        'root': [types.SimpleNamespace(path='README.md', type='blob', sha='r', size=6),
+                 types.SimpleNamespace(path='src', type='tree', sha='src', size=0),
+                 types.SimpleNamespace(path='node_modules', type='tree', sha='node_modules', size=0)],
+        'src': [types.SimpleNamespace(path='a.py', type='blob', sha='a', size=5)],
+    }
+
+    def get_git_tree(sha, recursive = True):
+        listed.append(sha)
+        return types.SimpleNamespace(raw_data={'truncated': recursive and sha == 'root'}, tree=trees[sha])
+
+    downloader.repo.get_git_tree = get_git_tree
+    assert [path for path, entry in downloader._list_tree('root')] == ['README.md', 'src/a.py']
+    assert 'node_modules' not in listed
@@ -0,0 +1,46 @@
+import json
+import zipfile
+import importlib
+
+def downloader(tmp_path):
+    gh_easy_downloader = importlib.import_module('catoverflow.gh_easy_downloader')
+    return gh_easy_downloader.GhEasyDownloader('bench/files-20', str(tmp_path))
+
+def test_an_unchanged_archive_is_revalidated_without_downloading_it(tmp_path, fake_github):
+    first = downloader(tmp_path)
+    assert first.download_files_from_repo()['not_modified'] is False
+    second = downloader(tmp_path)
+    result = second.download_files_from_repo()
+    assert result['result'] is True and result['not_modified'] is True
+    assert second.stats['bytes'] == 0 and second.stats['not_modified'] == 1
+
+def test_an_interrupted_download_is_resumed(tmp_path, fake_github):
+    first = downloader(tmp_path)
+    archive_path = first.download_files_from_repo()['path']
+    with open(archive_path, 'rb') as f:
+        archive = f.read()
+    with open(f"{archive_path}.meta.json", 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    # the connection dropped after the first half of the archive
+    with open(f"{archive_path}.part", 'wb') as f:
+        f.write(archive[:len(archive) // 2])
+    with open(f"{archive_path}.part.meta.json", 'w', encoding='utf-8') as f:
+        json.dump({'url': metadata['url'], 'etag': metadata['etag']}, f)
+    (tmp_path / 'bench' / 'files-20.zip').unlink()
+    (tmp_path / 'bench' / 'files-20.zip.meta.json').unlink()
+
+    second = downloader(tmp_path)
+    assert second.download_files_from_repo()['result'] is True
+    assert second.stats['resumed'] == 1
+    assert second.stats['bytes'] == len(archive) - len(archive) // 2
+    assert second.verify_archive(archive_path) and zipfile.is_zipfile(archive_path)
+
+def test_a_corrupted_archive_is_downloaded_again(tmp_path, fake_github):
+    first = downloader(tmp_path)
+    archive_path = first.download_files_from_repo()['path']
+    with open(archive_path, 'r+b') as f:
+        f.write(b'corrupted')
+    second = downloader(tmp_path)
+    result = second.download_files_from_repo()
+    assert result['result'] is True and result['not_modified'] is False
+    assert second.verify_archive(archive_path)
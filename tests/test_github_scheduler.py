@@ -0,0 +1,110 @@
+import time
+import importlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def scheduler_module():
+    return importlib.import_module('catoverflow.github_scheduler')
+
+def test_forbidden_answers_are_not_rate_limits():
+    is_rate_limited = scheduler_module().is_rate_limited
+    assert not is_rate_limited({'X-RateLimit-Remaining': '4999'}, '{"message": "Resource not accessible by personal access token"}')
+    assert is_rate_limited({'X-RateLimit-Remaining': '0'}, '')
+    assert is_rate_limited({'x-ratelimit-remaining': '12', 'retry-after': '60'}, '')
+    assert is_rate_limited({'X-RateLimit-Remaining': '12'}, '{"message": "You have exceeded a secondary rate limit"}')
+
+class ForbiddenHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        ForbiddenHandler.requests += 1
+        body = b'{"message": "Must have admin rights to Repository."}'
+        self.send_response(403)
+        self.send_header('X-RateLimit-Limit', '5000')
+        self.send_header('X-RateLimit-Remaining', '4998')
+        self.send_header('X-RateLimit-Reset', '9999999999')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def test_a_permission_error_is_returned_at_once():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ForbiddenHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        scheduler = scheduler_module().GitHubScheduler()
+        response = scheduler.request('GET', f"http://127.0.0.1:{server.server_address[1]}/repos/owner/private", timeout=5)
+        assert response.status_code == 403
+        assert ForbiddenHandler.requests == 1
+        assert scheduler.counters()['wait_seconds'] == 0
+    finally:
+        server.shutdown()
+
+def seeded_scheduler(remaining, limit = 100):
+    module = scheduler_module()
+    scheduler = module.GitHubScheduler(base_delay=0.01)
+    scheduler.set_budget('core', remaining, limit, time.time() + 3600)
+    return module, scheduler
+
+def test_every_request_consumes_a_token():
+    module, scheduler = seeded_scheduler(50)
+    scheduler.acquire('core', module.PRIORITY_DOWNLOAD)
+    scheduler.acquire('core', module.PRIORITY_SEARCH)
+    assert scheduler.buckets['core']['remaining'] == 48
+
+def test_downloads_leave_the_reserve_to_higher_priorities():
+    module, scheduler = seeded_scheduler(20)
+    assert not scheduler._can_run('core', module.PRIORITY_DOWNLOAD, time.time())
+    assert scheduler._can_run('core', module.PRIORITY_METADATA, time.time())
+    module, scheduler = seeded_scheduler(5)
+    assert not scheduler._can_run('core', module.PRIORITY_METADATA, time.time())
+    assert scheduler._can_run('core', module.PRIORITY_SEARCH, time.time())
+
+def test_a_waiting_search_goes_before_downloads_when_the_budget_is_scarce():
+    module, scheduler = seeded_scheduler(15)
+    scheduler.waiting[module.PRIORITY_SEARCH] = 1
+    assert not scheduler._can_run('core', module.PRIORITY_METADATA, time.time())
+    # plenty of budget: nobody waits for the search
+    module, scheduler = seeded_scheduler(80)
+    scheduler.waiting[module.PRIORITY_SEARCH] = 1
+    assert scheduler._can_run('core', module.PRIORITY_DOWNLOAD, time.time())
+
+def test_a_download_waits_for_the_reserve_to_be_refilled():
+    module, scheduler = seeded_scheduler(20)
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(scheduler.acquire('core', module.PRIORITY_DOWNLOAD)))
+    thread.start()
+    time.sleep(0.2)
+    assert waited == []
+    scheduler.set_budget('core', 100, 100, time.time() + 3600)
+    thread.join(timeout=5)
+    assert len(waited) == 1 and waited[0] >= 0.2
+
+def test_the_retry_after_header_sets_the_backoff():
+    module, scheduler = seeded_scheduler(0)
+    assert scheduler.backoff_delay(3, {'Retry-After': '7'}) == 7.0
+    reset = time.time() + 30
+    assert 29 <= scheduler.backoff_delay(0, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset)}) <= 32
+    assert 0.005 <= scheduler.backoff_delay(0) <= 0.015
+
+class RateLimitError(Exception):
+    def __init__(self):
+        super().__init__('rate limited')
+        self.status = 403
+        self.headers = {'Retry-After': '0'}
+        self.data = {'message': 'API rate limit exceeded'}
+
+def test_rate_limited_calls_are_retried():
+    module, scheduler = seeded_scheduler(100)
+    answers = [RateLimitError(), RateLimitError(), 'repository']
+
+    def call():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert scheduler.call(call) == 'repository'
+    assert scheduler.counters()['requests'] == 3 and scheduler.counters()['retries'] == 2
@@ -0,0 +1,42 @@
+import os
+import importlib
+
+def manifest_module():
+    return importlib.import_module('catoverflow.ingestion_manifest')
+
+def test_only_new_or_changed_files_are_ingested_again(tmp_path):
+    folder = tmp_path / 'repository'
+    folder.mkdir()
+    (folder / 'a.py').write_text('a = 1\n')
+    (folder / 'b.py').write_text('b = 1\n')
+    manifest = manifest_module().IngestionManifest(str(folder), 'main')
+    for name in ('a.py', 'b.py'):
+        changed, entry = manifest.check(str(folder / name))
+        assert changed
+        manifest.record(str(folder / name), entry)
+    manifest.save()
+
+    (folder / 'b.py').write_text('b = 2\n')
+    # same content extracted again: a new mtime alone does not trigger an ingestion
+    os.utime(folder / 'a.py', (1, 1))
+    manifest = manifest_module().IngestionManifest(str(folder), 'main')
+    assert manifest.check(str(folder / 'a.py'))[0] is False
+    assert manifest.check(str(folder / 'b.py'))[0] is True
+
+def test_another_branch_is_checked_again_and_missing_files_are_pruned(tmp_path):
+    folder = tmp_path / 'repository'
+    folder.mkdir()
+    (folder / 'a.py').write_text('a = 1\n')
+    (folder / 'gone.py').write_text('gone = 1\n')
+    manifest = manifest_module().IngestionManifest(str(folder), 'main')
+    for name in ('a.py', 'gone.py'):
+        manifest.record(str(folder / name), manifest.check(str(folder / name))[1])
+    manifest.save()
+
+    (folder / 'gone.py').unlink()
+    manifest = manifest_module().IngestionManifest(str(folder), 'v2')
+    changed, entry = manifest.check(str(folder / 'a.py'))
+    # the content did not change between the branches, only the cheap attributes are refreshed
+    assert changed is False and entry['branch'] == 'v2'
+    assert manifest.prune() == 1
+    assert sorted(manifest.entries) == ['a.py']
@@ -0,0 +1,52 @@
+import json
+import threading
+import importlib
+
+def test_a_cancelled_run_saves_the_files_it_ingested(tmp_path):
+    ingestion_pool = importlib.import_module('catoverflow.ingestion_pool')
+    ingestion_manifest = importlib.import_module('catoverflow.ingestion_manifest')
+    folder = tmp_path / 'repository'
+    folder.mkdir()
+    for name in ('a.py', 'b.py', 'c.py'):
+        (folder / name).write_text(f"# {name}\n")
+    with open(f"{folder}.manifest.json", 'w', encoding='utf-8') as f:
+        json.dump({'files': {'old.py': {'size': 1, 'mtime': 0, 'sha256': '', 'branch': 'main'}}}, f)
+
+    manifest = ingestion_manifest.IngestionManifest(str(folder), 'main')
+    cancel_event = threading.Event()
+    with ingestion_pool.IngestionPool(1, manifest=manifest, cancel_event=cancel_event) as pool:
+        pool.submit(str(folder / 'a.py'), lambda: None)
+        pool.submit(str(folder / 'b.py'), cancel_event.set)
+        pool.submit(str(folder / 'c.py'), lambda: None)
+
+    with open(f"{folder}.manifest.json", 'r', encoding='utf-8') as f:
+        files = json.load(f)['files']
+    # the files not reached are neither recorded nor pruned
+    assert sorted(files) == ['a.py', 'b.py', 'old.py']
+
+def test_files_sent_to_the_fallback_are_recorded_once_it_ingests_them(tmp_path):
+    ingestion_pool = importlib.import_module('catoverflow.ingestion_pool')
+    ingestion_manifest = importlib.import_module('catoverflow.ingestion_manifest')
+    raw_fallback = importlib.import_module('catoverflow.raw_fallback')
+    cat_overflow = importlib.import_module('catoverflow.cat_overflow')
+    folder = tmp_path / 'repository'
+    (folder / 'repository-main').mkdir(parents=True)
+    for name in ('a.py', 'b.bin', 'c.bin'):
+        (folder / 'repository-main' / name).write_text(f"# {name}\n")
+
+    class RabbitHole:
+        def ingest_file(self, cat, file_path):
+            if file_path.endswith('.bin'):
+                raise ValueError('unsupported mime type')
+
+    cat = type('Cat', (), {'rabbit_hole': RabbitHole()})()
+    manifest = ingestion_manifest.IngestionManifest(str(folder), 'main')
+    fallback = raw_fallback.RawFallback('owner/repository', 'main', workers=1, manifest=manifest)
+    stats = cat_overflow.run_ingestion(cat, str(folder), fallback, workers=1, manifest=manifest)
+    assert (stats['ingested'], stats['fallback']) == (1, 2)
+    assert sorted(manifest.entries) == ['repository-main/a.py']
+
+    fallback._ingest = lambda cat, raw_url, cancel_event: 'ingested' if raw_url.endswith('/b.bin') else 'missing'
+    fallback.run(cat)
+    with open(f"{folder}.manifest.json", 'r', encoding='utf-8') as f:
+        assert sorted(json.load(f)['files']) == ['repository-main/a.py', 'repository-main/b.bin']
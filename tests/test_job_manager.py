@@ -0,0 +1,83 @@
+import time
+import threading
+import importlib
+
+class FakeCat:
+    def __init__(self):
+        self.messages = []
+
+    def send_ws_message(self, content, msg_type = 'chat'):
+        self.messages.append(content)
+
+def job_manager(workers = 2):
+    return importlib.import_module('catoverflow.job_manager').JobManager(workers)
+
+def wait_for(job, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while job.status in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+def test_a_request_for_an_active_job_follows_it():
+    manager = job_manager()
+    release = threading.Event()
+    runs = []
+
+    def run(job):
+        runs.append(job.id)
+        release.wait(5)
+        return 'repository ingested'
+
+    first_cat, second_cat = FakeCat(), FakeCat()
+    job, merged = manager.submit('code', 'repository:owner/name@main', 'owner/name', first_cat, run)
+    same_job, same_merged = manager.submit('code', 'repository:owner/name@main', 'owner/name', second_cat, run)
+    assert (merged, same_merged) == (False, True) and same_job is job
+    release.set()
+    assert wait_for(job) == 'finished'
+    assert runs == [job.id]
+    assert first_cat.messages == second_cat.messages == [f"[job {job.id}] repository ingested"]
+    # a finished job is not joined again
+    assert manager.submit('code', 'repository:owner/name@main', 'owner/name', first_cat, lambda job: 'again')[1] is False
+
+def test_a_cancelled_job_stops_at_its_next_stage():
+    manager = job_manager()
+    started = threading.Event()
+
+    def run(job):
+        job.set_stage('download')
+        started.set()
+        while not job.cancelled:
+            time.sleep(0.01)
+        job.set_stage('ingestion')
+        return 'not reached'
+
+    cat = FakeCat()
+    job, merged = manager.submit('code', 'key', 'owner/name', cat, run)
+    started.wait(5)
+    assert manager.cancel(job.id) is True
+    assert wait_for(job) == 'cancelled' and job.stage == 'download'
+    assert cat.messages[-1].endswith('owner/name has been cancelled during the download stage')
+    assert manager.cancel(job.id) is False and manager.cancel(12345) is False
+
+def test_failures_and_progress_are_in_the_status():
+    manager = job_manager()
+
+    def run(job):
+        job.set_stage('search')
+        job.progress('3 repositories found')
+        raise Exception('repository not found')
+
+    job, merged = manager.submit('code', 'key', 'owner/name', FakeCat(), run)
+    assert wait_for(job) == 'failed'
+    assert 'stage: search' in job.summary() and 'error: repository not found' in job.summary()
+    assert job.last_message == 'owner/name failed during the search stage: repository not found'
+
+def test_only_the_latest_finished_jobs_are_kept():
+    manager = job_manager(workers=1)
+    manager.history = 2
+    jobs = [manager.submit('code', f"key-{n}", f"job {n}", FakeCat(), lambda job: 'done')[0] for n in range(3)]
+    for job in jobs:
+        wait_for(job)
+    manager.submit('code', 'key-3', 'job 3', FakeCat(), lambda job: 'done')
+    assert [job.description for job in manager.list_jobs()][:2] == ['job 1', 'job 2']
+    assert manager.get(jobs[0].id) is None
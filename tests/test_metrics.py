@@ -0,0 +1,50 @@
+import json
+import importlib
+
+def metrics():
+    return importlib.import_module('catoverflow.metrics')
+
+class FakeScheduler:
+    def __init__(self):
+        self.values = {'requests': 10, 'retries': 1, 'wait_seconds': 0.5}
+
+    def counters(self):
+        return dict(self.values)
+
+def test_a_run_report_has_stages_items_and_counters(tmp_path):
+    scheduler = FakeScheduler()
+    run = metrics().RunMetrics('code', 'owner/name@main', report_folder=str(tmp_path), scheduler=scheduler)
+    run.stage('download')
+    run.stage('ingestion')
+    for n in range(15):
+        run.record('file', f"src/module_{n}.py", n / 10, 'ingested' if n % 5 else 'duplicates', 100)
+    run.add_counters('ingestion', {'ingested': 12, 'manifest': {'skipped': 3}, 'done': True})
+    scheduler.values = {'requests': 14, 'retries': 1, 'wait_seconds': 2.0}
+    report = run.finish('finished')
+    assert list(report['stages']) == ['download', 'ingestion']
+    files = report['items']['file']
+    assert files['count'] == 15 and files['bytes'] == 1500 and files['statuses'] == {'ingested': 12, 'duplicates': 3}
+    assert [item['name'] for item in files['slowest']][:2] == ['src/module_14.py', 'src/module_13.py']
+    assert len(files['slowest']) == metrics().SLOWEST_ITEMS
+    assert report['counters'] == {'github_requests': 4, 'github_retries': 0, 'github_wait_seconds': 1.5,
+                                  'ingestion_ingested': 12, 'ingestion_manifest_skipped': 3}
+    with open(tmp_path / f"{run.run_id}.json", 'r', encoding='utf-8') as f:
+        assert json.load(f) == report
+    table = run.summary_table()
+    assert '| ingestion |' in table and 'slowest src/module_14.py (1.4s)' in table and 'GitHub: 4 requests' in table
+
+def test_the_prometheus_file_holds_the_last_run_of_every_kind(tmp_path):
+    module = metrics()
+    prometheus_file = str(tmp_path / 'textfile' / 'catoverflow.prom')
+    for kind, target, status in (('code', 'first', 'finished'), ('code', 'second', 'failed'), ('doc', 'docs "site"', 'finished')):
+        run = module.RunMetrics(kind, target, prometheus_file=prometheus_file)
+        run.stage('crawl')
+        run.record('page', target, 0.1, 'static', 10)
+        run.finish(status)
+    with open(prometheus_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    assert '# TYPE catoverflow_run_seconds gauge' in text
+    assert 'catoverflow_run_success{kind="code"} 0' in text and 'catoverflow_run_success{kind="doc"} 1' in text
+    assert text.count('catoverflow_run_success{') == 2
+    assert 'catoverflow_items{kind="doc",item="page",status="static"} 1' in text
+    assert 'catoverflow_stage_seconds{kind="code",stage="crawl"}' in text
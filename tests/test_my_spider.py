@@ -0,0 +1,70 @@
+import types
+import importlib
+from scrapy.http import TextResponse
+from scrapy.extensions.throttle import AutoThrottle
+
+def test_robots_crawl_delay_is_the_autothrottle_floor(tmp_path):
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    spider = my_spider.MySpider('https://docs.example.org/', set(), output_folder=str(tmp_path))
+    throttle = object.__new__(AutoThrottle)
+    throttle.mindelay, throttle.maxdelay = 0.0, 1.0
+    slot = types.SimpleNamespace(delay=0.0)
+    spider.crawler = types.SimpleNamespace(extensions=types.SimpleNamespace(middlewares=[throttle]),
+                                           engine=types.SimpleNamespace(downloader=types.SimpleNamespace(slots={'docs.example.org': slot})))
+    response = TextResponse('https://docs.example.org/robots.txt', body=b"User-agent: *\nCrawl-delay: 5\n", encoding='utf-8')
+    list(spider.parse_robots(response))
+    assert spider.download_delay == 5
+    assert slot.delay == 5
+    assert throttle.mindelay == 5
+    assert throttle.maxdelay == 5
+
+def test_autothrottle_max_delay_allows_the_largest_crawl_delay():
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    settings = my_spider.MySpider.with_settings().custom_settings
+    assert settings['AUTOTHROTTLE_MAX_DELAY'] >= importlib.import_module('catoverflow.sitemap_discovery').MAX_CRAWL_DELAY
+
+def test_links_are_requested_as_written_once_per_canonical_url(tmp_path):
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    Link = importlib.import_module('scrapy.link').Link
+    spider = my_spider.MySpider('https://docs.example.org/', set(), output_folder=str(tmp_path))
+    links = [Link('https://docs.example.org/guide/#install'), Link('https://docs.example.org/guide/index.html'),
+             Link('https://docs.example.org/guide?utm_source=x'), Link('https://docs.example.org/index.html')]
+    assert [link.url for link in spider.canonicalize_links(links)] == ['https://docs.example.org/guide/']
+    assert spider.canonicalize_links([Link('https://docs.example.org/guide')]) == []
+
+def test_pages_are_reported_with_the_url_they_were_fetched_from(tmp_path):
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    page_queue = importlib.import_module('queue').Queue()
+    spider = my_spider.MySpider('https://docs.example.org/', set(), output_folder=str(tmp_path), page_queue=page_queue)
+    request = importlib.import_module('scrapy').Request('https://docs.example.org/guide/', meta={'depth': spider.n})
+    response = TextResponse(request.url, body=b"<html><body>guide</body></html>", encoding='utf-8', request=request)
+    list(spider.parse_item(response))
+    assert page_queue.get_nowait() == ('page', 'https://docs.example.org/guide/', None, True)
+    assert spider.found_pages == {'https://docs.example.org/guide'}
+
+def test_closed_writes_only_the_page_list(tmp_path):
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    spider = my_spider.MySpider('https://docs.example.org/', {'https://docs.example.org/guide'}, save_pages=True, output_folder=str(tmp_path))
+    spider.closed('finished')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['docs.example.org', 'docs.example.org.txt']
+    assert not hasattr(my_spider.MySpider, 'saved_pages_index')
+
+def test_sitemap_pages_unchanged_since_the_last_crawl_are_not_requested(tmp_path):
+    my_spider = importlib.import_module('catoverflow.my_spider')
+    page_queue = importlib.import_module('queue').Queue()
+    spider = my_spider.MySpider('https://docs.example.org/', set(), max_pages=10, output_folder=str(tmp_path), page_queue=page_queue,
+                                cache_path=str(tmp_path / 'cache.json'))
+    body_path = tmp_path / 'old.html'
+    body_path.write_bytes(b'<html><body>old</body></html>')
+    spider.cache.update('https://docs.example.org/old/', body_path.read_bytes(), str(body_path))
+    sitemap = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://docs.example.org/old/</loc><lastmod>2020-01-01</lastmod></url>
+  <url><loc>https://docs.example.org/new/</loc><lastmod>2020-01-01</lastmod></url>
+  <url><loc>https://elsewhere.example.org/page/</loc></url>
+</urlset>"""
+    request = importlib.import_module('scrapy').Request('https://docs.example.org/sitemap.xml')
+    requests = list(spider.parse_sitemap(TextResponse(request.url, body=sitemap, encoding='utf-8', request=request)))
+    assert [request.url for request in requests] == ['https://docs.example.org/new/']
+    assert page_queue.get_nowait() == ('page', 'https://docs.example.org/old/', None, False)
+    assert spider.cache.stats['unchanged'] == 1
@@ -0,0 +1,135 @@
+import asyncio
+import importlib
+import pytest
+
+class FakeBrowser:
+    def __init__(self, closed):
+        self.closed = closed
+
+    async def new_context(self):
+        return FakeBrowser(self.closed)
+
+    async def close(self):
+        self.closed.append(self)
+
+class FakeEngine:
+    def __init__(self, closed, error = None):
+        self.closed = closed
+        self.error = error
+
+    async def launch(self):
+        if self.error is not None:
+            raise Exception(self.error)
+        return FakeBrowser(self.closed)
+
+class FakePlaywright:
+    def __init__(self, firefox_error = None):
+        self.closed = []
+        self.stopped = False
+        self.chromium = FakeEngine(self.closed)
+        self.firefox = FakeEngine(self.closed, firefox_error)
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        self.stopped = True
+
+def test_browsers_are_closed_when_an_engine_fails_to_launch(tmp_path):
+    page_downloader = importlib.import_module('catoverflow.page_downloader')
+    downloader = page_downloader.PageDownloader(str(tmp_path / 'site'), [], use_firefox=True, concurrency=2)
+    playwright = FakePlaywright(firefox_error="Executable doesn't exist")
+    with pytest.raises(Exception, match="Executable doesn't exist"):
+        asyncio.run(downloader.open_browsers(playwright))
+    assert len(playwright.closed) == 1
+    assert downloader.browsers == [] and downloader.contexts == []
+
+def test_pages_needing_a_browser_fail_when_it_cannot_launch(tmp_path, monkeypatch):
+    page_downloader = importlib.import_module('catoverflow.page_downloader')
+    playwright = FakePlaywright()
+    playwright.chromium.error = "Executable doesn't exist"
+    monkeypatch.setattr(page_downloader, 'async_playwright', lambda: playwright)
+    downloader = page_downloader.PageDownloader(str(tmp_path / 'site'), [])
+    static_body = tmp_path / 'static.html'
+    static_body.write_text('<html><body><main>' + '<p>Static documentation page with plenty of text.</p>' * 20 + '</main></body></html>')
+    saved = []
+
+    async def run():
+        page_queue = asyncio.Queue()
+        for item in (('https://docs.example.org/js/', None), ('https://docs.example.org/static/', str(static_body)),
+                     ('https://docs.example.org/js2/', None), None):
+            page_queue.put_nowait(item)
+        return await downloader.stream_download(page_queue, lambda url, file_path, rendered: saved.append(url))
+
+    stats = asyncio.run(run())
+    assert stats == {'static': 1, 'rendered': 0, 'failed': 2, 'duplicates': 0}
+    assert saved == ['https://docs.example.org/static/']
+    assert playwright.stopped
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+
+    async def goto(self, url, timeout = None):
+        self.context.active.append(url)
+        self.context.max_active.append(len(self.context.active))
+        await asyncio.sleep(0.01)
+        self.context.active.remove(url)
+        if 'broken' in url:
+            raise Exception('net::ERR_CONNECTION_RESET')
+        self.url = url
+
+    async def wait_for_load_state(self, state, timeout = None):
+        pass
+
+    async def content(self):
+        return f"<html><body><main><p>{self.url}</p></main></body></html>"
+
+    async def close(self):
+        pass
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = browser.active
+        self.max_active = browser.max_active
+
+    async def new_page(self):
+        self.browser.used.append(self)
+        return FakePage(self)
+
+    async def close(self):
+        pass
+
+class PoolBrowser(FakeBrowser):
+    def __init__(self, closed, active, max_active, used):
+        super().__init__(closed)
+        self.active = active
+        self.max_active = max_active
+        self.used = used
+
+    async def new_context(self):
+        return FakeContext(self)
+
+def test_pages_are_rendered_round_robin_with_bounded_concurrency(tmp_path):
+    page_downloader = importlib.import_module('catoverflow.page_downloader')
+    urls = [f"https://docs.example.org/page-{n}/" for n in range(10)] + ['https://docs.example.org/broken/']
+    downloader = page_downloader.PageDownloader(str(tmp_path / 'site'), urls, use_firefox=True, concurrency=3)
+    playwright = FakePlaywright()
+    active, max_active, used = [], [], []
+    for engine in (playwright.chromium, playwright.firefox):
+        engine.launch = lambda: asyncio.sleep(0, PoolBrowser(playwright.closed, active, max_active, used))
+
+    async def run():
+        await downloader.open_browsers(playwright)
+        try:
+            return await asyncio.gather(*(downloader.render(url) for url in urls))
+        finally:
+            await downloader.close_browsers()
+
+    saved = asyncio.run(run())
+    # 3 pages at most at the same time, on 4 contexts spread over the 2 engines
+    assert max(max_active) == 3
+    assert len({id(context) for context in used}) == 4
+    assert len({id(context.browser) for context in used}) == 2
+    assert saved[-1] is None and all(file_path is not None for file_path in saved[:-1])
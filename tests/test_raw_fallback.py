@@ -0,0 +1,47 @@
+import threading
+import importlib
+
+def fallback_for(**kwargs):
+    raw_fallback = importlib.import_module('catoverflow.raw_fallback')
+    return raw_fallback.RawFallback('bench/files-20', 'main', workers=4, **kwargs)
+
+def test_raw_urls_are_relative_to_the_repository_root(fake_github):
+    fallback = fallback_for()
+    assert fallback.raw_url('', 'README.md') == f"{fake_github.base_url}/raw/bench/files-20/main/README.md"
+    assert fallback.raw_url('/docs/pkg0/', 'module 2.md').endswith('/bench/files-20/main/docs/pkg0/module%202.md')
+
+def test_every_file_is_fetched_once_and_ingested_from_memory(fake_github):
+    stub_cat = importlib.import_module('stub_cat')
+    cat = stub_cat.StubCat()
+    fallback = fallback_for()
+    fallback.add('/tmp/out/README.md', '', 'README.md')
+    fallback.add('/tmp/out/src/pkg0/module_0.py', 'src/pkg0', 'module_0.py')
+    fallback.add('/tmp/out/src/pkg0/gone.py', 'src/pkg0', 'gone.py')
+    requests = fake_github.requests
+    stats = fallback.run(cat)
+    assert fake_github.requests - requests == 3
+    assert stats == {'files': 3, 'ingested': 2, 'duplicates': 0, 'missing': 1, 'errors': 0, 'cancelled': 0}
+    assert cat.rabbit_hole.stats['strings'] == 2 and cat.rabbit_hole.stats['files'] == 0
+    # the queue is emptied by a run
+    assert fallback.run(cat)['files'] == 3
+
+def test_a_cancelled_fallback_fetches_nothing(fake_github):
+    stub_cat = importlib.import_module('stub_cat')
+    cancel_event = threading.Event()
+    cancel_event.set()
+    fallback = fallback_for()
+    fallback.add('/tmp/out/README.md', '', 'README.md')
+    requests = fake_github.requests
+    assert fallback.run(stub_cat.StubCat(), cancel_event)['cancelled'] == 1
+    assert fake_github.requests == requests
+
+def test_duplicate_chunks_are_not_stored_again(fake_github, tmp_path):
+    stub_cat = importlib.import_module('stub_cat')
+    dedup = importlib.import_module('catoverflow.dedup').Deduplicator(str(tmp_path), 'bench/files-20')
+    cat = stub_cat.StubCat()
+    for n in range(2):
+        fallback = fallback_for(dedup=dedup)
+        fallback.add('/tmp/out/README.md', '', 'README.md')
+        fallback.run(cat)
+    assert fallback.stats['duplicates'] == 1
+    assert cat.rabbit_hole.stats['documents'] == 1
@@ -0,0 +1,44 @@
+import importlib
+
+def needs_js_rendering(html):
+    return importlib.import_module('catoverflow.render_heuristics').needs_js_rendering(html)
+
+def fake_servers():
+    return importlib.import_module('fake_servers')
+
+ARTICLE = '<p>' + 'The option accepts a value and returns a result that depends only on the value. ' * 5 + '</p>'
+
+def test_a_server_rendered_page_is_static():
+    html = fake_servers().STATIC_PAGE_TEMPLATE.format(index=1, links='<a href="/page-2/">Page 2</a>')
+    assert needs_js_rendering(html) == (False, 'static')
+
+def test_an_empty_spa_root_needs_a_browser():
+    html = fake_servers().JS_PAGE_TEMPLATE.format(index=1, links='<a href="/page-2/">Page 2</a>')
+    assert needs_js_rendering(html) == (True, 'spa root')
+    assert needs_js_rendering('<html><body><app-root></app-root></body></html>')[0]
+
+def test_a_noscript_warning_needs_a_browser():
+    html = '<html><body><noscript>You need to enable JavaScript to run this app.</noscript><p>Loading</p></body></html>'
+    assert needs_js_rendering(html) == (True, 'javascript required')
+
+def test_scripts_are_not_text():
+    script = '<script>' + 'var x = "lots of text in a script";' * 50 + '</script>'
+    assert needs_js_rendering(f"<html><body>{script}<p>Loading</p></body></html>") == (True, 'empty body')
+    assert needs_js_rendering('') == (True, 'empty document')
+
+def test_a_page_buried_in_markup_needs_a_browser():
+    markup = '<div class="wrapper">' * 2000 + '</div>' * 2000
+    assert needs_js_rendering(f"<html><body>{markup}{ARTICLE}</body></html>") == (True, 'low text ratio')
+    assert needs_js_rendering(f"<html><body>{ARTICLE}</body></html>") == (False, 'static')
+
+def test_only_the_pages_needing_javascript_are_left_to_the_browser(tmp_path):
+    page_downloader = importlib.import_module('catoverflow.page_downloader')
+    static_path = tmp_path / 'static.html'
+    static_path.write_text(fake_servers().STATIC_PAGE_TEMPLATE.format(index=1, links=''))
+    js_path = tmp_path / 'js.html'
+    js_path.write_text(fake_servers().JS_PAGE_TEMPLATE.format(index=2, links=''))
+    urls = ['https://docs.example.org/static/', 'https://docs.example.org/js/', 'https://docs.example.org/unknown/']
+    downloader = page_downloader.PageDownloader(str(tmp_path / 'site'), urls, static_pages={
+        'https://docs.example.org/static/': str(static_path), 'https://docs.example.org/js/': str(js_path)})
+    assert downloader.save_static_pages() == urls[1:]
+    assert (tmp_path / 'site' / 'static.html').exists()
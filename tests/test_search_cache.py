@@ -0,0 +1,51 @@
+import time
+import importlib
+
+def search_cache():
+    return importlib.import_module('catoverflow.search_cache')
+
+def test_the_key_is_the_normalized_query_and_the_auth_mode():
+    SearchCache = search_cache().SearchCache
+    assert SearchCache.make_key('  Requests   Toolbelt ', False) == SearchCache.make_key('requests toolbelt', False)
+    assert SearchCache.make_key('requests', True) != SearchCache.make_key('requests', False)
+
+def test_empty_results_expire_sooner(tmp_path, monkeypatch):
+    cache = search_cache().SearchCache(str(tmp_path))
+    cache.put('web:found', [{'name': 'owner/found'}])
+    cache.put('web:missing', [])
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 60)
+    assert cache.get('web:found', 3600, 30) == [{'name': 'owner/found'}]
+    assert cache.get('web:missing', 3600, 30) is None
+    monkeypatch.setattr(time, 'time', lambda: now + 4000)
+    assert cache.get('web:found', 3600, 30) is None
+
+def test_the_least_recently_used_entry_is_evicted_and_the_rest_persisted(tmp_path):
+    module = search_cache()
+    cache = module.SearchCache(str(tmp_path), max_entries=2)
+    cache.put('web:a', [{'name': 'a'}])
+    cache.put('web:b', [{'name': 'b'}])
+    cache.get('web:a', 3600, 300)
+    cache.put('web:c', [{'name': 'c'}])
+    assert list(cache.entries) == ['web:a', 'web:c']
+    reloaded = module.SearchCache(str(tmp_path))
+    assert reloaded.get('web:c', 3600, 300) == [{'name': 'c'}]
+    assert reloaded.get('web:b', 3600, 300) is None
+
+def test_a_repeated_search_is_answered_from_the_cache(tmp_path, fake_github):
+    gh_repo_finder = importlib.import_module('catoverflow.gh_repo_finder')
+    finder = gh_repo_finder.GhRepoFinder(cache=search_cache().SearchCache(str(tmp_path)))
+    first = finder.find_repo('bench/files-3')
+    requests = fake_github.requests
+    assert finder.find_repo('bench/files-3') == first == [first[0]]
+    # the normalized query hits the same entry
+    finder.find_repo('Bench/Files-3 ')
+    assert fake_github.requests == requests
+
+def test_failed_searches_are_not_cached(tmp_path, monkeypatch):
+    gh_repo_finder = importlib.import_module('catoverflow.gh_repo_finder')
+    cache = search_cache().SearchCache(str(tmp_path))
+    finder = gh_repo_finder.GhRepoFinder(cache=cache)
+    monkeypatch.setattr(finder, 'search_library', lambda name: None)
+    assert finder.find_repo('requests') is None
+    assert len(cache.entries) == 0
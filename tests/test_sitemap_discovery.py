@@ -0,0 +1,50 @@
+import gzip
+import importlib
+from datetime import datetime, timezone
+
+def sitemap_discovery():
+    return importlib.import_module('catoverflow.sitemap_discovery')
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://docs.example.org/guide/</loc><lastmod>2026-10-01</lastmod><priority>0.8</priority></url>
+  <url><loc>https://docs.example.org/api/</loc></url>
+</urlset>"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://docs.example.org/sitemap-guide.xml.gz</loc></sitemap>
+</sitemapindex>"""
+
+def test_robots_lists_the_sitemaps_and_the_crawl_delay():
+    robots, sitemaps, delay = sitemap_discovery().parse_robots(
+        "User-agent: *\nDisallow: /private/\nCrawl-delay: 2\nSitemap: https://docs.example.org/sitemap-index.xml\n", 'https://docs.example.org/guide/')
+    assert sitemaps == ['https://docs.example.org/sitemap-index.xml']
+    assert delay == 2.0
+    assert not robots.can_fetch('*', 'https://docs.example.org/private/page')
+    assert robots.can_fetch('*', 'https://docs.example.org/guide/')
+
+def test_robots_without_sitemap_falls_back_to_the_usual_location_and_caps_the_delay():
+    module = sitemap_discovery()
+    robots, sitemaps, delay = module.parse_robots("User-agent: *\nCrawl-delay: 600\n", 'https://docs.example.org/guide/')
+    assert sitemaps == ['https://docs.example.org/sitemap.xml']
+    assert delay == module.MAX_CRAWL_DELAY
+    assert module.parse_robots('', 'https://docs.example.org/')[2] is None
+
+def test_plain_gzip_and_index_sitemaps_are_read():
+    sitemap_entries = sitemap_discovery().sitemap_entries
+    sitemap_type, entries = sitemap_entries(URLSET)
+    assert sitemap_type == 'urlset'
+    assert [entry['loc'] for entry in entries] == ['https://docs.example.org/guide/', 'https://docs.example.org/api/']
+    assert entries[0]['lastmod'] == '2026-10-01' and entries[0]['priority'] == '0.8'
+    assert sitemap_entries(gzip.compress(URLSET)) == (sitemap_type, entries)
+    sitemap_type, entries = sitemap_entries(SITEMAP_INDEX)
+    assert sitemap_type == 'sitemapindex' and entries[0]['loc'].endswith('sitemap-guide.xml.gz')
+
+def test_lastmod_dates_are_read_as_utc():
+    parse_lastmod = sitemap_discovery().parse_lastmod
+    # a bare date covers the whole day
+    assert parse_lastmod('2026-10-01') == datetime(2026, 10, 2, tzinfo=timezone.utc)
+    assert parse_lastmod('2026-10-01T12:30:00Z') == datetime(2026, 10, 1, 12, 30, tzinfo=timezone.utc)
+    assert parse_lastmod('2026-10-01T12:30:00') == datetime(2026, 10, 1, 12, 30, tzinfo=timezone.utc)
+    assert parse_lastmod('yesterday') is None and parse_lastmod(None) is None
@@ -0,0 +1,37 @@
+import importlib
+
+def test_page_index_claims_files_once(tmp_path):
+    url_utils = importlib.import_module('catoverflow.url_utils')
+    index = url_utils.PageIndex(str(tmp_path / 'site'))
+    assert index.claim('https://docs.example.org/a/', 'site/a.html') == 'site/a.html'
+    assert index.claim('https://docs.example.org/a/index.html', 'site/a.html') == 'site/a.html'
+    other = index.claim('https://docs.example.org/a.html', 'site/a.html')
+    assert other != 'site/a.html' and other.startswith('site/a__')
+    # a page saved again under another file releases its previous file
+    assert index.claim('https://docs.example.org/a', 'site/a.md') == 'site/a.md'
+    assert index.claim('https://docs.example.org/b', 'site/a.html') == 'site/a.html'
+    index.save()
+    reloaded = url_utils.PageIndex(str(tmp_path / 'site'))
+    assert reloaded.get('https://docs.example.org/b/') == 'site/a.html'
+    assert reloaded.owners['site/a.md'] == 'https://docs.example.org/a'
+
+def test_equivalent_urls_have_one_canonical_form():
+    canonicalize_url = importlib.import_module('catoverflow.url_utils').canonicalize_url
+    expected = 'https://docs.example.org/guide/start?lang=en&v=2'
+    for url in ('HTTPS://Docs.Example.org:443/guide/start/?v=2&lang=en',
+                'https://docs.example.org/guide//intro/../start/index.html?lang=en&v=2#install',
+                'https://docs.example.org/guide/start?utm_source=x&lang=en&ref=nav&v=2&gclid=1'):
+        assert canonicalize_url(url) == expected
+    assert canonicalize_url('http://docs.example.org:8080') == 'http://docs.example.org:8080/'
+    assert canonicalize_url('https://docs.example.org/a%20b') == canonicalize_url('https://docs.example.org/a b')
+
+def test_page_paths_mirror_the_url_without_collisions():
+    url_to_path = importlib.import_module('catoverflow.url_utils').url_to_path
+    assert url_to_path('https://docs.example.org/') == 'index.html'
+    assert url_to_path('https://docs.example.org/guide/install.html') == 'guide/install.html'
+    assert url_to_path('https://docs.example.org/guide/install/', '.md') == 'guide/install.md'
+    assert url_to_path('https://docs.example.org/api/My Class (v2)') == 'api/My_Class_v2_.html'
+    first, second = url_to_path('https://docs.example.org/search?q=a'), url_to_path('https://docs.example.org/search?q=b')
+    assert first != second and first.startswith('search__') and first.endswith('.html')
+    # query strings in another order are the same page
+    assert url_to_path('https://docs.example.org/p?a=1&b=2') == url_to_path('https://docs.example.org/p?b=2&a=1')
@@ -0,0 +1,97 @@
+"""URL canonicalization and collision-free page storage shared by the spider and the page downloader"""
+import os
+import re
+import json
+import hashlib
+import threading
+import posixpath
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote, quote
+
+TRACKING_PARAMS = {'ref', 'ref_src', 'ref_url', 'source', 'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'yclid', 'igshid'}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_')
+INDEX_FILES = ('index.html', 'index.htm', 'index.php', 'default.html', 'default.htm')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+UNSAFE_CHARS = re.compile(r'[^\w.\-]+')
+
+def canonicalize_url(url):
+    """
+    Canonical form of an url: lowercase scheme and host, no default port, no fragment,
+    no tracking parameters, sorted query, normalized path without index files and trailing slash"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if parts.port is not None and DEFAULT_PORTS.get(scheme) != parts.port:
+        netloc = f"{host}:{parts.port}"
+
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    path = posixpath.normpath(path) if path not in ('', '/') else '/'
+    if not path.startswith('/'):
+        path = '/' + path
+    segments = path.split('/')
+    if segments[-1].lower() in INDEX_FILES:
+        segments[-1] = ''
+    path = '/'.join(segments)
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+    path = quote(unquote(path), safe="/:@!$&'()*+,;=-._~")
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    query = urlencode(sorted(query))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+def url_to_path(url, extension = '.html'):
+    """path (relative to the domain folder) mirroring the url path, the query is folded in a short hash"""
+    parts = urlsplit(canonicalize_url(url))
+    segments = [UNSAFE_CHARS.sub('_', unquote(segment)) for segment in parts.path.split('/') if segment != '']
+    if len(segments) == 0:
+        segments = ['index']
+    name, current_extension = os.path.splitext(segments[-1])
+    if current_extension.lower() in ('.html', '.htm', '.php', '.aspx', '.md'):
+        segments[-1] = name
+    if parts.query:
+        segments[-1] += '__' + hashlib.sha1(parts.query.encode('utf-8')).hexdigest()[:8]
+    return '/'.join(segments) + extension
+
+class PageIndex:
+    """Persistent canonical url -> stored file index of a crawled site"""
+
+    def __init__(self, output_folder):
+        self.path = f"{output_folder.rstrip('/')}.index.json"
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        # stored file -> canonical url, so that claiming a file does not scan the whole index
+        self.owners = {path: url for url, path in self.entries.items()}
+
+    def get(self, url):
+        with self.lock:
+            return self.entries.get(canonicalize_url(url))
+
+    def claim(self, url, file_path):
+        """record the file of a page, a file already owned by another url gets a suffix so no page is overwritten"""
+        url = canonicalize_url(url)
+        with self.lock:
+            if self.owners.get(file_path, url) != url:
+                name, extension = os.path.splitext(file_path)
+                file_path = f"{name}__{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}{extension}"
+            previous = self.entries.get(url)
+            if previous is not None and previous != file_path and self.owners.get(previous) == url:
+                del self.owners[previous]
+            self.entries[url] = file_path
+            self.owners[file_path] = url
+            return file_path
+
+    def save(self):
+        with self.lock:
+            entries = dict(self.entries)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)